@@ -0,0 +1,484 @@
+"""Benchmark collect_metrics.py against a synthetic GitHub API.
+
+Starts a local stand-in for the REST and GraphQL endpoints the collectors use. Repository
+'bench/nN' has N issues (a third of them PRs, half of everything closed), one comment per
+issue, one review comment per PR, N/10 forks and N/20 discussions, spread evenly over the
+last --span-days days. Each collector then runs on its own for every size and count mode,
+and the report shows per section:
+
+    requests  HTTP requests made (304s included)
+    KiB       response bytes on the wire (gzip, like the real API)
+    points    rate-limit points used: 1 per REST/search request except 304s; GraphQL
+              queries are charged like GitHub does, by the connections they ask for
+    seconds   wall time
+
+plus a 'total' line with all collectors running concurrently, as in collect_metrics.py.
+Like the real API, search results stop after 1000 items.
+
+    python bench_collect_metrics.py [--sizes 10,100,1000,10000,100000] [--modes rest,graphql,search]
+                                    [--span-days 30] [--latency-ms 20] [--incremental]
+                                    [--json results.json]
+
+With --incremental every section runs twice with a state file (see METRICS_STATE_FILE)
+and the second, warm run is reported.
+"""
+
+import argparse
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import math
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+import collect_metrics as cm
+
+SEARCH_RESULT_LIMIT = 1000  # GitHub search never returns more results than this
+DEFAULT_SIZES = (10, 100, 1000, 10_000, 100_000)
+SEARCH_DATE = re.compile(r"(created|closed|merged|updated):>=(\S+)")
+
+
+def iso(value):
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+# --- Synthetic Data ---
+class SyntheticRepo:
+    """Items are generated from their index, newest first, so any size costs the same to set up.
+
+    Issue i (0 = newest) was created, updated and (if i is odd) closed at time(i).
+    Every third issue is a PR; a closed PR is merged if i % 12 == 3.
+    """
+
+    def __init__(self, full_name, size, span_days, now, base_url):
+        self.full_name = full_name
+        self.size = size
+        self.now = now
+        self.url = f"{base_url}/repos/{full_name}"
+        self.span = timedelta(days=span_days)
+        self.forks = max(1, size // 10)
+        self.discussions = max(1, size // 20)
+
+    def time(self, i, count=None):
+        """Time of item i out of `count` (default: the issues) evenly spread over the span."""
+        return self.now - (i + 0.5) * self.span / (count or self.size)
+
+    def newer_than(self, since, count=None):
+        """Number of items (of `count`) at or after `since`, i.e. items 0 .. k-1."""
+        count = count or self.size
+        k = math.floor((self.now - since) / (self.span / count) - 0.5) + 1
+        return max(0, min(count, k))
+
+    def repo_json(self):
+        return {
+            "id": self.size,
+            "name": self.full_name.split("/")[1],
+            "full_name": self.full_name,
+            "url": self.url,
+            "stargazers_count": self.size,
+            "subscribers_count": self.size // 10,
+            "forks_count": self.forks,
+            "open_issues_count": self.size // 2,
+            "network_count": self.forks,
+            "size": self.size * 10,
+            "language": "Python",
+            "created_at": iso(self.now - self.span * 12),
+            "pushed_at": iso(self.now),
+            "archived": False,
+            "disabled": False,
+            "has_issues": True,
+            "has_projects": True,
+            "has_wiki": False,
+            "has_pages": False,
+            "has_downloads": True,
+            "has_discussions": True,
+            "default_branch": "main",
+            "license": {"key": "apache-2.0", "spdx_id": "Apache-2.0"},
+            "owner": {"login": "bench"},
+        }
+
+    def issue_json(self, i):
+        is_pr, closed = i % 3 == 0, i % 2 == 1
+        created = iso(self.time(i))
+        item = {
+            "id": i + 1,
+            "number": self.size - i,
+            "title": f"Synthetic item {i}",
+            "user": {"login": f"user{i % 50}", "id": i % 50, "type": "User"},
+            "state": "closed" if closed else "open",
+            "created_at": created,
+            "updated_at": created,
+            "closed_at": created if closed else None,
+            "comments": 1,
+            "labels": [],
+            "html_url": f"https://github.com/{self.full_name}/{'pull' if is_pr else 'issues'}/{self.size - i}",
+            "body": "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4,
+        }
+        if is_pr:
+            item["pull_request"] = {"url": f"{self.url}/pulls/{self.size - i}"}
+        return item
+
+    def pull_json(self, i):
+        item = self.issue_json(i)
+        item.pop("pull_request")
+        item["merged_at"] = item["closed_at"] if i % 12 == 3 else None
+        item["base"] = {"ref": "main"}
+        return item
+
+    def comment_json(self, i, review=False):
+        kind = "pull" if i % 3 == 0 else "issues"
+        return {
+            "id": (i + 1) * (2 if review else 1),
+            "created_at": iso(self.time(i)),
+            "updated_at": iso(self.time(i)),
+            "user": {"login": f"user{i % 50}", "id": i % 50, "type": "User"},
+            "html_url": f"https://github.com/{self.full_name}/{kind}/{self.size - i}#issuecomment-{i + 1}",
+            "body": "Synthetic comment. " * 5,
+        }
+
+    def search_count(self, query):
+        """issueCount of a search like 'repo:o/r is:issue is:closed closed:>=DATE'."""
+        match = SEARCH_DATE.search(query)
+        k = self.newer_than(datetime.fromisoformat(match.group(2).replace("Z", "+00:00"))) if match else self.size
+        prs, closed_prs, merged_prs = len(range(0, k, 3)), len(range(3, k, 6)), len(range(3, k, 12))
+        if "is:merged" in query:
+            return merged_prs
+        if "is:pr" in query:
+            return closed_prs if "is:closed" in query else prs
+        if "is:closed" in query:
+            return len(range(1, k, 2)) - closed_prs
+        return k - prs
+
+    def comment_search_nodes(self, query, start, count):
+        """Items updated since the search date, each with its one comment (and review for PRs), and their count."""
+        k = self.newer_than(datetime.fromisoformat(SEARCH_DATE.search(query).group(2).replace("Z", "+00:00")))
+        total = min(k, SEARCH_RESULT_LIMIT)
+        nodes = []
+        for i in range(start, min(total, start + count)):
+            created = iso(self.time(i))
+            comments = {"nodes": [{"createdAt": created}], "pageInfo": {"hasPreviousPage": False}}
+            node = {"__typename": "Issue", "number": self.size - i, "comments": comments}
+            if i % 3 == 0:
+                node["__typename"] = "PullRequest"
+                review = {"submittedAt": created, "comments": comments}
+                node["reviews"] = {"nodes": [review], "pageInfo": {"hasPreviousPage": False}}
+            nodes.append(node)
+        return nodes, k, start + count < total
+
+
+# --- Synthetic Server ---
+class Counters:
+    """Requests, wire bytes and rate-limit points, reset before every measured section."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.not_modified = 0
+            self.bytes = 0
+            self.points = 0
+
+    def add(self, size, points, not_modified):
+        with self._lock:
+            self.requests += 1
+            self.not_modified += not_modified
+            self.bytes += size
+            self.points += points
+
+
+class SyntheticGitHub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, span_days, latency):
+        super().__init__(("127.0.0.1", 0), SyntheticHandler)
+        self.base_url = f"http://127.0.0.1:{self.server_address[1]}"
+        self.span_days = span_days
+        self.latency = latency
+        self.now = datetime.now(timezone.utc).replace(microsecond=0)
+        self.counters = Counters()
+        self._repos = {}
+        self._lock = threading.Lock()
+
+    def repo(self, full_name):
+        """'bench/n1000' -> SyntheticRepo with 1000 issues (None for other names)."""
+        match = re.fullmatch(r"bench/n(\d+)", full_name)
+        if not match:
+            return None
+        with self._lock:
+            if full_name not in self._repos:
+                self._repos[full_name] = SyntheticRepo(
+                    full_name, int(match.group(1)), self.span_days, self.now, self.base_url
+                )
+            return self._repos[full_name]
+
+
+def graphql_cost(query):
+    """GitHub's formula: connection requests needed (nested ones multiply) / 100, at least 1."""
+    if "comments(last" in query:
+        return 22  # 1 search page + 100 comment + 100 review + 100 * 20 review comment connections
+    return 1
+
+
+class SyntheticHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # Headers and body go out in separate writes, don't wait for delayed ACKs
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, obj, status=200, headers=None, resource="core", points=1):
+        body = json.dumps(obj).encode("utf-8")
+        etag = f'"{hashlib.md5(body + str(headers).encode()).hexdigest()}"'
+        not_modified = self.command == "GET" and status == 200 and self.headers.get("If-None-Match") == etag
+        if not_modified:
+            status, body, points = 304, b"", 0  # Conditional requests that hit are free
+        elif "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=6)
+            headers = dict(headers or {}, **{"Content-Encoding": "gzip"})
+        self.server.counters.add(len(body), points, not_modified)
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-RateLimit-Limit", "1000000")
+        self.send_header("X-RateLimit-Remaining", "999999")
+        self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+        self.send_header("X-RateLimit-Resource", resource)
+        if status == 200:
+            self.send_header("ETag", etag)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_page(self, indexes, make_item, query):
+        """Pages through a range of item indexes, with Link headers like the REST API."""
+        per_page = int(query.get("per_page", ["30"])[0])
+        page = int(query.get("page", ["1"])[0])
+        chunk = indexes[(page - 1) * per_page : page * per_page]
+        last = max(1, math.ceil(len(indexes) / per_page))
+        links = []
+        path = urlsplit(self.path).path
+        params = {name: values[0] for name, values in query.items()}
+        if page < last:
+            links.append(f'<{self.server.base_url}{path}?{urlencode({**params, "page": page + 1})}>; rel="next"')
+            links.append(f'<{self.server.base_url}{path}?{urlencode({**params, "page": last})}>; rel="last"')
+        self.send_json([make_item(i) for i in chunk], headers={"Link": ", ".join(links)} if links else None)
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/search/issues":
+            search_query = query.get("q", [""])[0]
+            name = re.search(r"repo:(\S+)", search_query)
+            repo = self.server.repo(name.group(1)) if name else None
+            if repo is None:
+                return self.send_json({"message": "Validation Failed"}, 422, resource="search")
+            count = repo.search_count(search_query)
+            per_page = int(query.get("per_page", ["30"])[0])
+            items = [repo.issue_json(i) for i in range(min(count, per_page, SEARCH_RESULT_LIMIT))]
+            return self.send_json(
+                {"total_count": count, "incomplete_results": False, "items": items}, resource="search"
+            )
+        match = re.fullmatch(r"/repos/([^/]+/[^/]+)(/.*)?", url.path)
+        repo = self.server.repo(match.group(1)) if match else None
+        if repo is None:
+            return self.send_json({"message": "Not Found"}, 404)
+        rest = match.group(2) or ""
+        since = query.get("since")
+        k = repo.newer_than(datetime.fromisoformat(since[0].replace("Z", "+00:00"))) if since else repo.size
+
+        if rest == "":
+            return self.send_json(repo.repo_json())
+        if rest == "/contributors":
+            return self.send_page(range(25), lambda i: {"login": f"user{i}", "contributions": 100 - i}, query)
+        if rest == "/releases":
+            return self.send_page(range(10), lambda i: {"id": i, "tag_name": f"v1.{i}"}, query)
+        if rest == "/forks":
+
+            def make_fork(j):
+                name = f"fork{j}/{repo.full_name.split('/')[1]}"
+                return {"id": j + 1, "full_name": name, "created_at": iso(repo.time(j, repo.forks))}
+
+            return self.send_page(range(repo.forks), make_fork, query)
+        if rest == "/stats/contributors":
+            week = int((repo.now - timedelta(days=repo.now.weekday())).replace(hour=0, minute=0, second=0).timestamp())
+            weeks = [{"w": week - 604800 * n, "a": 10 + n, "d": 2, "c": 1} for n in range(52)]
+            return self.send_json([{"author": {"login": f"user{a}"}, "total": 52, "weeks": weeks} for a in range(5)])
+        if rest in ("/traffic/views", "/traffic/clones"):
+            kind = rest.rsplit("/", 1)[1]
+            days = [repo.now.replace(hour=0, minute=0, second=0) - timedelta(days=d) for d in range(14, 0, -1)]
+            return self.send_json(
+                {"count": 140, "uniques": 40, kind: [{"timestamp": iso(d), "count": 10, "uniques": 3} for d in days]}
+            )
+        if rest == "/traffic/popular/referrers":
+            return self.send_json(
+                [{"referrer": f"site{n}.example", "count": 50 - n, "uniques": 10 - n // 2} for n in range(10)]
+            )
+        if rest == "/traffic/popular/paths":
+            return self.send_json(
+                [
+                    {"path": f"/{repo.full_name}/page{n}", "title": f"Page {n}", "count": 50 - n, "uniques": 9}
+                    for n in range(10)
+                ]
+            )
+        if rest == "/issues":
+            closed_only = query.get("state", ["open"])[0] == "closed"
+            return self.send_page(range(1, k, 2) if closed_only else range(k), repo.issue_json, query)
+        if rest == "/pulls":
+            closed_only = query.get("state", ["open"])[0] == "closed"
+            return self.send_page(
+                range(3, repo.size, 6) if closed_only else range(0, repo.size, 3), repo.pull_json, query
+            )
+        if rest == "/issues/comments":
+            return self.send_page(range(k), repo.comment_json, query)
+        if rest == "/pulls/comments":
+            return self.send_page(range(0, k, 3), lambda i: repo.comment_json(i, review=True), query)
+        return self.send_json({"message": "Not Found"}, 404)
+
+    def do_POST(self):
+        time.sleep(self.server.latency)
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        query, variables = request["query"], request.get("variables") or {}
+        searches = [value for value in variables.values() if isinstance(value, str) and "repo:" in value]
+        names = [re.search(r"repo:(\S+)", value).group(1) for value in searches]
+        if "owner" in variables:
+            names.append(f"{variables['owner']}/{variables['name']}")
+        repo = self.server.repo(names[0]) if names else None
+        if repo is None:
+            return self.send_json({"errors": [{"message": "Could not resolve to a Repository"}]}, resource="graphql")
+
+        data = {}
+        after = int(variables.get("after") or 0)
+        if "issuesOpened" in query or "forks(" in query:
+            for alias in ("issuesOpened", "issuesClosed", "prsOpened", "prsClosed", "prsMerged"):
+                if alias in variables:
+                    data[alias] = {"issueCount": repo.search_count(variables[alias])}
+            nodes = [{"createdAt": iso(repo.time(j, repo.forks))} for j in range(after, min(repo.forks, after + 100))]
+            data["repository"] = {
+                "forks": {
+                    "nodes": nodes,
+                    "pageInfo": {"hasNextPage": after + 100 < repo.forks, "endCursor": str(after + 100)},
+                }
+            }
+        elif "comments(last" in query:
+            nodes, issue_count, has_next = repo.comment_search_nodes(variables["searchQuery"], after, 100)
+            page_info = {"hasNextPage": has_next, "endCursor": str(after + 100)}
+            data["search"] = {"issueCount": issue_count, "nodes": nodes, "pageInfo": page_info}
+        elif "discussionCount" in query:
+            match = SEARCH_DATE.search(variables["searchQuery"])
+            since = datetime.fromisoformat(match.group(2).replace("Z", "+00:00"))
+            data["search"] = {"discussionCount": repo.newer_than(since, repo.discussions)}
+        cost = graphql_cost(query)
+        if "rateLimit" in query:
+            data["rateLimit"] = {"cost": cost, "remaining": 5000 - cost}
+        self.send_json({"data": data}, resource="graphql", points=cost)
+
+
+# --- Benchmark ---
+def measure(server, fn):
+    """Runs fn with the collector output silenced; returns its counters and wall time."""
+    server.counters.reset()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+    elapsed = time.perf_counter() - start
+    c = server.counters
+    return {
+        "requests": c.requests,
+        "not_modified": c.not_modified,
+        "kib": c.bytes / 1024,
+        "points": c.points,
+        "seconds": elapsed,
+    }
+
+
+def bench_size(server, size, modes, incremental):
+    repo_json = cm.rest_get(cm.token, f"/repos/bench/n{size}").json()
+    results = []
+    for mode in modes:
+        collectors = cm.get_collectors(mode)
+        with tempfile.TemporaryDirectory() as tmp:
+            state = cm.StateStore(os.path.join(tmp, "state.json"), 7) if incremental else None
+            cm.api_session.state = state
+            [ctx] = cm.build_contexts([repo_json], server.now, state)
+            for collector in collectors:
+
+                def run(collector=collector):
+                    return cm._run_collector(collector, ctx)
+
+                if incremental:
+                    measure(server, run)  # Warm up the state, the next run is the measured one
+                results.append({"size": size, "mode": mode, "section": collector.name, **measure(server, run)})
+
+            def run_all():
+                return cm.run_collectors([ctx], collectors, cm.max_workers)
+
+            if incremental:
+                measure(server, run_all)
+            results.append({"size": size, "mode": mode, "section": "total", **measure(server, run_all)})
+            cm.api_session.state = None
+    return results
+
+
+def print_results(results):
+    print(
+        f"{'size':>8} {'mode':<8} {'section':<18} {'requests':>9} {'304s':>6} {'KiB':>10} {'points':>7} {'seconds':>8}"
+    )
+    for r in results:
+        print(
+            f"{r['size']:>8} {r['mode']:<8} {r['section']:<18} {r['requests']:>9} {r['not_modified']:>6} "
+            f"{r['kib']:>10.1f} {r['points']:>7} {r['seconds']:>8.2f}"
+        )
+        if r["section"] == "total":
+            print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="issues per synthetic repository")
+    parser.add_argument("--modes", default="rest,graphql,search", help="count modes to compare")
+    parser.add_argument("--span-days", type=float, default=30, help="items are spread over this many days")
+    parser.add_argument("--latency-ms", type=float, default=20, help="simulated round trip per request")
+    parser.add_argument("--incremental", action="store_true", help="report a warm run with a state file")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    server = SyntheticGitHub(args.span_days, args.latency_ms / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    cm.api_url = server.base_url
+    cm.graphql_url = f"{server.base_url}/graphql"
+    cm.token = "bench"
+    print(
+        f"Synthetic GitHub API at {server.base_url}, {args.latency_ms:.0f} ms per request, "
+        f"items spread over {args.span_days:g} days, lookback {cm.lookback_days} day(s)\n"
+    )
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        size_results = bench_size(server, size, args.modes.split(","), args.incremental)
+        print_results(size_results)
+        results.extend(size_results)
+    server.shutdown()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {len(results)} results to {args.json}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
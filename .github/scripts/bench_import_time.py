@@ -0,0 +1,79 @@
+"""Import time of agentlab2, checked against a budget.
+
+Each case runs in a fresh interpreter under `python -X importtime` --repeat times; the time
+of a case is the smallest total, over the runs, of the modules it imported (interpreter
+startup excluded). Modules loaded lazily (agentlab2's package __getattr__) are reported by
+-X importtime as top-level imports of their own, so every top-level entry after the case
+starts is counted.
+
+    python bench_import_time.py [--repeat 7] [--top 10] [--no-budget]
+
+Exits with 1 when a case goes over its budget, listing the modules that took the most time.
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "src")
+MARKER = "agentlab2-bench-start"
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+# Statement -> budget in milliseconds. The package and its core types load nothing heavy; the
+# CLI parses its arguments before importing anything else; a study brings the runner and asyncio.
+CASES = {
+    "import agentlab2": 10,
+    "from agentlab2 import Agent, Env, TaskArgs": 25,
+    "import agentlab2.cli": 25,
+    "from agentlab2 import Study": 250,
+}
+
+
+def measure(statement):
+    """(total ms, {module: self ms}) of one run of `statement` in a fresh interpreter."""
+    code = f"import sys; print({MARKER!r}, file=sys.stderr, flush=True); {statement}"
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [SRC, os.environ.get("PYTHONPATH")]))}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], env=env, capture_output=True, text=True, check=True
+    )
+    lines = proc.stderr.split(MARKER, 1)[1].splitlines()
+    total_us, self_us = 0, {}
+    for line in lines:
+        match = LINE.match(line)
+        if match is None:
+            continue
+        own, cumulative, indent, module = int(match[1]), int(match[2]), match[3], match[4]
+        if len(indent) == 1:  # Top level
+            total_us += cumulative
+        self_us[module] = self_us.get(module, 0) + own
+    return total_us / 1000, {module: us / 1000 for module, us in self_us.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--top", type=int, default=10, help="Modules listed for a case over its budget")
+    parser.add_argument("--no-budget", action="store_true", help="Only report, never fail")
+    args = parser.parse_args()
+
+    over = []
+    print(f"{'statement':<44} {'ms':>8} {'budget':>8}")
+    for statement, budget in CASES.items():
+        runs = [measure(statement) for _ in range(args.repeat)]
+        total, modules = min(runs, key=lambda run: run[0])
+        flag = "" if total <= budget else "  OVER"
+        print(f"{statement:<44} {total:>8.1f} {budget:>8}{flag}")
+        if total > budget:
+            over.append((statement, modules))
+
+    for statement, modules in over:
+        print(f"\nSlowest imports of {statement!r} (self ms):")
+        for module, ms in sorted(modules.items(), key=lambda item: -item[1])[: args.top]:
+            print(f"  {ms:>8.1f}  {module}")
+    return 1 if over and not args.no_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""Failure cases of the runner and the environment pool, run end to end on stub environments.
+
+Each case runs a small study with run_parallel and checks the status of every episode (one
+status, or a set of possible ones); a case that hangs is caught by the episode timeout, whose
+"timeout" results fail the check.
+
+    python check_runner.py [case ...]
+
+Exits with 1 when a case fails.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "src"))
+
+from agentlab2.envpool import EnvPoolOptions, NoopAgentArgs, StubTaskArgs  # noqa: E402
+from agentlab2.experiment import Experiment  # noqa: E402
+from agentlab2.runner import run_parallel  # noqa: E402
+
+TIMEOUT_S = 20.0
+
+
+def launch_error():
+    """make_env raising at once, with warm environments: the pool used to deadlock on its own lock."""
+    failing = StubTaskArgs("failing", launch_s=0.0, launch_error="no browser")
+    working = StubTaskArgs("working", launch_s=0.0)
+    experiments = [Experiment(NoopAgentArgs("noop"), task, seed) for task in (failing, working) for seed in range(3)]
+    expected = {e.episode_id: "error" if e.task_args is failing else "done" for e in experiments}
+    for episodes_per_worker in (1, 2):
+        results = run_parallel(
+            experiments, 1, TIMEOUT_S, episodes_per_worker=episodes_per_worker, env_pool=EnvPoolOptions(warm=1)
+        )
+        yield expected, results
+
+
+def _slowly(results, delay_s):
+    """The results, taking `delay_s` over each like a study writing its journal."""
+    for result in results:
+        time.sleep(delay_s)
+        yield result
+
+
+def worker_crash():
+    """An episode killing its worker while the result of the episode next to it is being handled:
+    the free slot used to get more work, sent to the dead worker, and the broken pipe aborted the study."""
+    working = StubTaskArgs("working", launch_s=0.0, reset_s=0.0, step_s=0.05, n_steps=2)
+    crashing = StubTaskArgs("crashing", launch_s=0.0, reset_s=0.0, step_s=0.15, crash_step=1)
+    experiments = [Experiment(NoopAgentArgs("noop"), task, seed) for seed in range(3) for task in (working, crashing)]
+    # Episodes running next to a crashing one may crash with it
+    expected = {e.episode_id: "crashed" if e.task_args is crashing else {"done", "crashed"} for e in experiments}
+    for _ in range(3):
+        yield expected, _slowly(run_parallel(experiments, 1, TIMEOUT_S, episodes_per_worker=2), 0.1)
+
+
+CASES = {"launch_error": launch_error, "worker_crash": worker_crash}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("cases", nargs="*", help=f"Cases to run (default: all): {', '.join(CASES)}")
+    args = parser.parse_args()
+    if unknown := set(args.cases) - set(CASES):
+        parser.error(f"unknown case(s): {', '.join(sorted(unknown))}")
+    logging.basicConfig(level=logging.ERROR)
+
+    failed = 0
+    for name in args.cases or CASES:
+        for n, (expected, results) in enumerate(CASES[name]()):
+            start = time.perf_counter()
+            statuses = {result.episode_id: result.status for result in results}
+            wrong = {
+                episode: (allowed, statuses.get(episode))
+                for episode, allowed in expected.items()
+                if statuses.get(episode) not in ({allowed} if isinstance(allowed, str) else allowed)
+            }
+            verdict = "FAIL" if wrong else "ok"
+            print(f"{name}[{n}]: {verdict} ({time.perf_counter() - start:.1f}s)")
+            for episode, (want, got) in wrong.items():
+                print(f"  {episode}: expected {want}, got {got}")
+            failed += bool(wrong)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
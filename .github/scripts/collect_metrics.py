@@ -1,568 +1,1926 @@
-import os  
-import sys  
-import pandas as pd  
-from github import Github, GithubException, UnknownObjectException # Added UnknownObjectException  
-from datetime import datetime, timedelta, timezone # Added timezone  
-import time  
-import requests
+import gzip
+import heapq
+import http.client
+import importlib.util
 import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, NamedTuple
+from urllib.parse import parse_qs, urlencode, urlsplit
 
+# Only the standard library is needed to collect. pyarrow (Parquet output) and
+# pandas (pretty-printed table) are imported when used, see write_metrics().
 
-# --- GraphQL Helper ---  
-def run_graphql_query(token, query, variables=None):  
-    """Runs a GraphQL query against the GitHub API."""  
-    graphql_url = "https://api.github.com/graphql"  
-    headers = {  
-        "Authorization": f"bearer {token}",  
-        "Content-Type": "application/json",  
-    }  
-    payload = {"query": query}  
-    if variables:  
-        payload["variables"] = variables  
-
-    try:  
-        response = requests.post(graphql_url, headers=headers, json=payload, timeout=30) # Added timeout  
-        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)  
-
-        json_response = response.json()  
-
-        # Check for GraphQL-specific errors  
-        if "errors" in json_response:  
-            error_details = json.dumps(json_response["errors"], indent=2)  
-            # Consider logging this instead of printing if it gets noisy  
-            print(f"GraphQL query failed with errors:\n{error_details}")  
-            # Decide how to handle: return None, raise exception, etc.  
-            # Returning None might be suitable for metrics collection  
-            return None  
-
-        return json_response.get("data")  
-
-    except requests.exceptions.RequestException as e:  
-        print(f"Error during GraphQL request: {e}")  
-        return None  
-    except json.JSONDecodeError as e:  
-         print(f"Error decoding GraphQL JSON response: {e}")  
-         return None  
-
-  
-# --- Configuration ---  
-token = os.getenv("GITHUB_TOKEN")  
-repo_name = os.getenv("GITHUB_REPOSITORY") # Format: 'owner/repo'  
-lookback_days = 1 # Define the period for "new" items (e.g., last 1 day)  
-output_filename = f"github_metrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.parquet"  
-max_retries = 3 # Retries for API calls that might need time  
-  
-# --- Input Validation ---  
-if not token:  
-    print("Error: GITHUB_TOKEN environment variable not set.")  
-    sys.exit(1)  
-if not repo_name:  
-    print("Error: GITHUB_REPOSITORY environment variable not set.")  
-    sys.exit(1)  
-  
-print(f"Starting metrics collection for repository: {repo_name}")  
-print(f"Lookback period for 'new' items: {lookback_days} day(s)")  
-  
-# --- GitHub API Connection ---  
-try:  
-    g = Github(token, retry=5, timeout=15) # Added retry and timeout to Github object  
-    repo = g.get_repo(repo_name)  
-    print("Successfully connected to GitHub API.")  
-except GithubException as e:  
-    print(f"Error connecting to GitHub API or getting repository: {e}")  
-    sys.exit(1)  
-  
-# --- Define Cutoff Time (UTC) ---  
-# Use timezone-aware datetime object for 'since' parameter  
-cutoff_datetime_aware = datetime.now(timezone.utc) - timedelta(days=lookback_days)  
-# Use naive datetime for simple comparisons if needed (e.g., fork creation)  
-cutoff_datetime_naive = datetime.utcnow() - timedelta(days=lookback_days)  
-print(f"Calculating 'new' items since: {cutoff_datetime_aware}")  
-  
-  
-# --- Data Collection ---  
-metrics = {}  
-metrics['timestamp_utc'] = datetime.now(timezone.utc) # Store timezone-aware timestamp  
-metrics['repository_name'] = repo.full_name  
-  
-print("\nFetching standard repository metrics...")  
-try:  
-    # Standard Attributes  
-    metrics['stars'] = repo.stargazers_count  
-    metrics['watchers'] = repo.subscribers_count  
-    metrics['forks_total'] = repo.forks_count # Renamed for clarity  
-    metrics['open_issues_total'] = repo.open_issues_count # Renamed for clarity  
-    metrics['network_count'] = repo.network_count  
-    metrics['size_kb'] = repo.size  
-    metrics['language'] = repo.language  
-    metrics['created_at_utc'] = repo.created_at  
-    metrics['pushed_at_utc'] = repo.pushed_at  
-    metrics['archived'] = repo.archived  
-    metrics['disabled'] = repo.disabled  
-    metrics['has_issues'] = repo.has_issues  
-    metrics['has_projects'] = repo.has_projects  
-    metrics['has_wiki'] = repo.has_wiki  
-    metrics['has_pages'] = repo.has_pages  
-    metrics['has_downloads'] = repo.has_downloads  
-    metrics['has_discussions'] = repo.has_discussions # Added check for discussions  
-    metrics['license'] = repo.get_license().license.spdx_id if repo.license else None  
-  
-    # List Counts  
-    metrics['contributors_count_total'] = repo.get_contributors().totalCount  
-    metrics['releases_count_total'] = repo.get_releases().totalCount  
-  
-except GithubException as e:  
-    print(f"Warning: Could not fetch some standard metrics: {e}")  
-    # Initialize potentially missed metrics  
-    standard_keys = ['stars', 'watchers', 'forks_total', 'open_issues_total', 'network_count', 'size_kb',  
-                     'language', 'created_at_utc', 'pushed_at_utc', 'archived', 'disabled', 'has_issues',  
-                     'has_projects', 'has_wiki', 'has_pages', 'has_downloads', 'has_discussions', 'license',  
-                     'contributors_count_total', 'releases_count_total']  
-    for key in standard_keys:  
-        if key not in metrics: metrics[key] = None  
-  
-  
-# --- Calculated Metrics: "New" Forks (Last Period) ---  
-print(f"\nCalculating new forks in the last {lookback_days} day(s)...")  
-new_forks_count = 0  
-try:  
-    # Iterate through forks - PaginatedList handles pagination  
-    for fork in repo.get_forks():  
-        # Compare naive UTC datetimes  
-        if fork.created_at.replace(tzinfo=None) >= cutoff_datetime_naive:  
-             new_forks_count += 1  
-        else:  
-            # Forks are sorted newest first, so we can stop early  
-            break  
-    metrics['forks_new_last_period'] = new_forks_count  
-    print(f"Found {new_forks_count} new forks.")  
-except GithubException as e:  
-    print(f"Warning: Could not calculate new forks: {e}")  
-    metrics['forks_new_last_period'] = None  
-  
-  
-# --- Calculated Metrics: "New" Contributors (Approximation using stats) ---  
-# Stays the same as the previously corrected version - using weekly stats approximation  
-print(f"\nCalculating recent contributor additions (weekly stats)...")  
-recent_contributor_adds = 0  
-retries = 0  
-stats_contributors = None  
-while retries < max_retries:  
-    try:  
-        stats_contributors = repo.get_stats_contributors()  
-        if stats_contributors is not None: break  
-        else:  
-            print(f"Contributor stats not available yet (Attempt {retries+1}/{max_retries}). Waiting 30 seconds...")  
-            time.sleep(30)  
-            retries += 1  
-    except GithubException as e:  
-        if e.status == 202:  
-            print(f"Contributor stats computing (Attempt {retries+1}/{max_retries}). Waiting 30 seconds...")  
-            time.sleep(30)  
-            retries += 1  
-        elif e.status == 404:  
-            print(f"Warning: Contributor stats API 404: {e}")  
-            stats_contributors = [] # Treat as empty  
-            break  
-        else:  
-            print(f"Warning: Could not fetch contributor stats: {e}")  
-            stats_contributors = None  
-            break  
-  
-if stats_contributors is not None:  
-    cutoff_date_stats_naive = cutoff_datetime_naive # Use naive for comparison consistency  
-    print(f"Cutoff date for contributor stats: {cutoff_date_stats_naive} UTC (comparing week start)")  
-    for stat in stats_contributors:  
-        if not hasattr(stat, 'weeks') or not stat.weeks: continue  
-        for week_stat in stat.weeks:  
-            if not hasattr(week_stat, 'w'): continue  
-            week_start_time = week_stat.w  
-            if isinstance(week_start_time, datetime):  
-                naive_week_start = week_start_time.replace(tzinfo=None)  
-                if naive_week_start >= cutoff_date_stats_naive:  
-                    if hasattr(week_stat, 'a') and isinstance(week_stat.a, int):  
-                        recent_contributor_adds += week_stat.a  
-            else:  
-                 print(f"Warning: Unexpected type for week_stat.w: {type(week_start_time)}. Skipping.")  
-    metrics['contributors_additions_recent_weeks'] = recent_contributor_adds # Changed name slightly  
-    print(f"Found {recent_contributor_adds} contributor additions (approx) based on recent weekly stats.")  
-else:  
-     metrics['contributors_additions_recent_weeks'] = None  
-     if retries == max_retries: print("Warning: Contributor stats could not be retrieved.")  
-  
-  
-# --- Traffic Data (Last Day if available) ---  
-print("\nFetching traffic data (views and clones)...")  
-  
-# Define the target date (yesterday in UTC)  
-target_traffic_date_naive = (datetime.utcnow() - timedelta(days=1)).date()  
-print(f"Targeting traffic data for date: {target_traffic_date_naive}")  
-  
-# Initialize metrics for the target date  
-metrics['traffic_views_last_day_total'] = None  
-metrics['traffic_views_last_day_unique'] = None  
-metrics['traffic_clones_last_day_total'] = None  
-metrics['traffic_clones_last_day_unique'] = None  
-  
-# --- Process Views ---  
-found_view_data_for_target = False  
-try:  
-    views_traffic_obj = repo.get_views_traffic(per="day")  
-    # Check if the object and the 'views' list exist and are not empty  
-    if views_traffic_obj and hasattr(views_traffic_obj, 'views') and views_traffic_obj.views:  
-        # Iterate through the list of daily view data  
-        for view_entry in views_traffic_obj.views:  
-            # Check if the entry has a timestamp and it's a datetime object  
-            if hasattr(view_entry, 'timestamp') and isinstance(view_entry.timestamp, datetime):  
-                # Compare the date part of the timestamp with our target date  
-                if view_entry.timestamp.date() == target_traffic_date_naive:  
-                    # Found the data for yesterday!  
-                    metrics['traffic_views_last_day_total'] = getattr(view_entry, 'count', None) # Use getattr for safety  
-                    metrics['traffic_views_last_day_unique'] = getattr(view_entry, 'uniques', None)  
-                    print(f"Found views for {target_traffic_date_naive}: Total={metrics['traffic_views_last_day_total']}, Unique={metrics['traffic_views_last_day_unique']}")  
-                    found_view_data_for_target = True  
-                    break # Stop searching once found  
-            else:  
-                 print(f"Warning: Skipping view entry with missing or invalid timestamp: {view_entry}")  
-  
-        # After checking all entries, if we didn't find the target date  
-        if not found_view_data_for_target:  
-            print(f"Warning: No view data found specifically for target date {target_traffic_date_naive}. Metrics remain None.")  
-            # metrics['traffic_views_last_day_total'] = 0 # Alternative: default to 0 if preferred  
-            # metrics['traffic_views_last_day_unique'] = 0  
-  
-    else:  
-        print("Warning: No daily view data list available or attribute 'views' missing.")  
-        # Metrics remain None as initialized  
-  
-except GithubException as e:  
-    print(f"Warning: Could not fetch views traffic data: {e}")  
-    # Metrics remain None  
-except Exception as e: # Catch other potential errors during processing  
-    print(f"Warning: Error processing view data: {e}")  
-    # Metrics remain None  
-  
-  
-# --- Process Clones ---  
-found_clone_data_for_target = False  
-try:  
-    clones_traffic_obj = repo.get_clones_traffic(per="day")  
-    # Check if the object and the 'clones' list exist and are not empty  
-    if clones_traffic_obj and hasattr(clones_traffic_obj, 'clones') and clones_traffic_obj.clones:  
-        # Iterate through the list of daily clone data  
-        for clone_entry in clones_traffic_obj.clones:  
-             # Check if the entry has a timestamp and it's a datetime object  
-            if hasattr(clone_entry, 'timestamp') and isinstance(clone_entry.timestamp, datetime):  
-                # Compare the date part of the timestamp with our target date  
-                if clone_entry.timestamp.date() == target_traffic_date_naive:  
-                    # Found the data for yesterday!  
-                    metrics['traffic_clones_last_day_total'] = getattr(clone_entry, 'count', None) # Use getattr for safety  
-                    metrics['traffic_clones_last_day_unique'] = getattr(clone_entry, 'uniques', None)  
-                    print(f"Found clones for {target_traffic_date_naive}: Total={metrics['traffic_clones_last_day_total']}, Unique={metrics['traffic_clones_last_day_unique']}")  
-                    found_clone_data_for_target = True  
-                    break # Stop searching once found  
-            else:  
-                print(f"Warning: Skipping clone entry with missing or invalid timestamp: {clone_entry}")  
-  
-        # After checking all entries, if we didn't find the target date  
-        if not found_clone_data_for_target:  
-            print(f"Warning: No clone data found specifically for target date {target_traffic_date_naive}. Metrics remain None.")  
-            # metrics['traffic_clones_last_day_total'] = 0 # Alternative: default to 0  
-            # metrics['traffic_clones_last_day_unique'] = 0  
-  
-    else:  
-        print("Warning: No daily clone data list available or attribute 'clones' missing.")  
-        # Metrics remain None as initialized  
-  
-except GithubException as e:  
-    print(f"Warning: Could not fetch clones traffic data: {e}")  
-    # Metrics remain None  
-except Exception as e: # Catch other potential errors during processing  
-    print(f"Warning: Error processing clone data: {e}")  
-    # Metrics remain None  
-   
-  
-# --- Referrers and Popular Content Data (Last 14 days) ---  
-print("\nFetching top referrers data (last 14 days)...")  
-top_referrers_data = [] # Initialize empty list  
-try:  
-    top_referrers_list = repo.get_top_referrers()  
-    # Iterate through the PaginatedList of Referrer objects  
-    for r in top_referrers_list:  
-         # Extract relevant data into a dictionary  
-         # Use getattr for safety in case attributes are missing unexpectedly  
-         referrer_dict = {  
-             "referrer": getattr(r, 'referrer', None),  
-             "count": getattr(r, 'count', None),  
-             "uniques": getattr(r, 'uniques', None)  
-         }  
-         top_referrers_data.append(referrer_dict)  
-  
-    metrics['traffic_top_referrers_data'] = top_referrers_data # Store the list of dicts  
-    print(f"Fetched {len(top_referrers_data)} top referrer entries.")  
-  
-except GithubException as e:  
-     print(f"Warning: Could not fetch top referrers: {e}")  
-     metrics['traffic_top_referrers_data'] = None # Set to None on API error  
-except Exception as e: # Catch potential errors during processing the list  
-    print(f"Warning: Error processing referrer data: {e}")  
-    metrics['traffic_top_referrers_data'] = None  
-  
-  
-print("\nFetching top paths data (last 14 days)...")  
-top_paths_data = [] # Initialize empty list  
-try:  
-    top_paths_list = repo.get_top_paths()  
-     # Iterate through the PaginatedList of Path objects  
-    for p in top_paths_list:  
-         # Extract relevant data into a dictionary  
-         path_dict = {  
-             "path": getattr(p, 'path', None),  
-             "title": getattr(p, 'title', None), # Title might not always exist  
-             "count": getattr(p, 'count', None),  
-             "uniques": getattr(p, 'uniques', None)  
-         }  
-         top_paths_data.append(path_dict)  
-  
-    metrics['traffic_top_paths_data'] = top_paths_data # Store the list of dicts  
-    print(f"Fetched {len(top_paths_data)} top path entries.")  
-  
-except GithubException as e:  
-     print(f"Warning: Could not fetch top paths: {e}")  
-     metrics['traffic_top_paths_data'] = None # Set to None on API error  
-except Exception as e: # Catch potential errors during processing the list  
-    print(f"Warning: Error processing path data: {e}")  
-    metrics['traffic_top_paths_data'] = None  
-  
-  
-# --- Issues Opened/Closed Last Period ---  
-print(f"\nCalculating Issues opened/closed in the last {lookback_days} day(s)...")  
-issues_opened_count = 0  
-issues_closed_count = 0  
-issues_comments_count = 0  
-try:  
-    # Issues opened: Use 'since' which filters by creation time  
-    opened_issues = repo.get_issues(state='all', sort='created', since=cutoff_datetime_aware)  
-    for issue in opened_issues:  
-        # Double check creation time (though 'since' should handle it)  
-        # Note: get_issues() returns PRs as well. We need to filter later if needed.  
-        # For now, count all items returned by get_issues as potential "issues" opened.  
-        issues_opened_count += 1  
-  
-    # Issues closed: Need to check closed_at time  
-    # Get recently updated closed issues/PRs  
-    recently_updated_closed_items = repo.get_issues(state='closed', sort='updated', direction='desc', since=cutoff_datetime_aware)  
-    for item in recently_updated_closed_items:  
-        if item.closed_at and item.closed_at >= cutoff_datetime_aware:  
-            # Check if it's actually an Issue (not a PR)  
-            # An item is a PR if it has the 'pull_request' attribute  
-            if not hasattr(item, 'pull_request') or not item.pull_request:  
-                 issues_closed_count += 1  
-  
-    metrics['issues_opened_last_period'] = issues_opened_count  
-    metrics['issues_closed_last_period'] = issues_closed_count  
-    print(f"Found: Opened={issues_opened_count}, Closed={issues_closed_count}")  
-  
-except GithubException as e:  
-    print(f"Warning: Could not calculate issue metrics: {e}")  
-    metrics['issues_opened_last_period'] = None  
-    metrics['issues_closed_last_period'] = None  
-  
-# --- Pull Requests Opened/Closed Last Period ---  
-print(f"\nCalculating PRs opened/closed in the last {lookback_days} day(s)...")  
-prs_opened_count = 0  
-prs_closed_count = 0 # Includes merged PRs  
-prs_merged_count = 0  
-try:  
-    # PRs opened: Use 'since' on pulls endpoint  
-    opened_pulls = repo.get_pulls(state='all', sort='created', direction='desc', base=repo.default_branch) # Filter by base branch if desired  
-    # Iterate and filter by date - 'since' might not exist for pulls in PyGithub < 2.0 or work as expected  
-    for pr in opened_pulls:  
-        if pr.created_at >= cutoff_datetime_aware:  
-             prs_opened_count += 1  
-        else:  
-            break # Since sorted by created desc  
-  
-    # PRs closed/merged: Check closed_at/merged_at  
-    # Get recently updated closed PRs  
-    recently_updated_closed_pulls = repo.get_pulls(state='closed', sort='updated', direction='desc')#, since=cutoff_datetime_aware) # since might not work well here  
-    for pr in recently_updated_closed_pulls:  
-        # Stop checking if PRs updated date is older than cutoff  
-        if pr.updated_at < cutoff_datetime_aware:  
-             break  
-  
-        if pr.closed_at and pr.closed_at >= cutoff_datetime_aware:  
-            prs_closed_count += 1  
-            if pr.merged_at and pr.merged_at >= cutoff_datetime_aware:  
-                prs_merged_count += 1  
-  
-  
-    metrics['prs_opened_last_period'] = prs_opened_count  
-    metrics['prs_closed_last_period'] = prs_closed_count  
-    metrics['prs_merged_last_period'] = prs_merged_count  
-    print(f"Found: Opened={prs_opened_count}, Closed={prs_closed_count}, Merged={prs_merged_count}")  
-  
-except GithubException as e:  
-    print(f"Warning: Could not calculate PR metrics: {e}")  
-    metrics['prs_opened_last_period'] = None  
-    metrics['prs_closed_last_period'] = None  
-    metrics['prs_merged_last_period'] = None  
-  
-  
-# --- Comments (Issues, PRs) Last Period ---  
-print(f"\nCalculating Issue/PR Comments in the last {lookback_days} day(s)...")  
-issue_comments_last_period = 0  
-pr_comments_last_period = 0 # Includes review comments and general PR comments  
-  
-try:  
-    # General Issue/PR comments (use issues endpoint)  
-    all_comments = repo.get_issues_comments(sort='created', direction='desc', since=cutoff_datetime_aware)  
-    for comment in all_comments:  
-         # Check creation date again just to be sure  
-        if comment.created_at >= cutoff_datetime_aware:  
-            # Differentiate based on URL  
-            if "/pull/" in comment.html_url:  
-                pr_comments_last_period += 1  
-            else:  
-                issue_comments_last_period += 1  
-        else:  
-             # Since comments are sorted desc, we can stop  
-             break  
-  
-    # PR Review Comments  
-    review_comments = repo.get_pulls_comments(sort='created', direction='desc', since=cutoff_datetime_aware)  
-    for comment in review_comments:  
-         if comment.created_at >= cutoff_datetime_aware:  
-             pr_comments_last_period += 1  
-         else:  
-             break  
-  
-    metrics['issue_comments_last_period'] = issue_comments_last_period  
-    metrics['pr_comments_last_period'] = pr_comments_last_period # Combined count  
-    print(f"Found: Issue Comments={issue_comments_last_period}, PR Comments={pr_comments_last_period}")  
-  
-except GithubException as e:  
-    print(f"Warning: Could not calculate comment metrics: {e}")  
-    metrics['issue_comments_last_period'] = None  
-    metrics['pr_comments_last_period'] = None  
-  
-  
-# --- Discussions Metrics (via GraphQL) ---  
-print(f"\nCalculating Discussion Metrics for the last {lookback_days} day(s) via GraphQL...")  
-
-# Initialize metrics  
-metrics['discussions_opened_last_period'] = None  
-metrics['discussions_comments_last_period'] = None # Still challenging  
-
-# Check if discussions are enabled first  
-if metrics.get('has_discussions'):  
-    # Format the cutoff date as an ISO 8601 string for GraphQL  
-    since_iso_string = cutoff_datetime_aware.isoformat()  
-
-    # --- Query for Discussions Opened ---  
-    # Use the search API via GraphQL for efficient filtering by creation date  
-    search_query_string = f"repo:{repo_name} type:discussion is:open created:>={since_iso_string}"  
-    # Also count closed ones created in the period? Add another query or adjust logic if needed.  
-    # This query counts currently 'open' discussions created since the cutoff.  
-
-    discussions_search_query = """  
-    query($searchQuery: String!) {  
-      search(query: $searchQuery, type: DISCUSSION, first: 0) {  
-        discussionCount  
-      }  
-    }  
-    """  
-    variables = {"searchQuery": search_query_string}  
-
-    print(f"Running GraphQL search for new discussions with query: '{search_query_string}'")  
-    graphql_data_disc = run_graphql_query(token, discussions_search_query, variables)  
-
-    if graphql_data_disc and 'search' in graphql_data_disc:  
-        try:  
-            metrics['discussions_opened_last_period'] = graphql_data_disc['search']['discussionCount']  
-            print(f"Found via GraphQL Search: Discussions Opened={metrics['discussions_opened_last_period']}")  
-        except (KeyError, TypeError) as e:  
-             print(f"Warning: Could not extract discussion count from GraphQL response: {e}. Response: {graphql_data_disc}")  
-    else:  
-        print("Warning: Failed to get discussion count via GraphQL search.")  
-
-
-    # --- Query for Discussion Comments ---  
-    # NOTE: Getting an exact count of *all* comments across *all* discussions created  
-    # within a specific time window using a single, efficient GraphQL query is difficult.  
-    # The search API doesn't seem to support filtering for `type:discussioncomment` directly.  
-    # A possible (but potentially slow and complex) alternative would be:  
-    # 1. Fetch discussions UPDATED since the cutoff date.  
-    # 2. For each discussion, fetch comments created since the cutoff date (requires pagination per discussion).  
-    # This approach can lead to many API calls and is not implemented here for efficiency.  
-    # We will leave `discussions_comments_last_period` as None.  
-
-    print("Note: Fetching discussion *comment* counts for the period is complex with GraphQL Search and not implemented.")  
-    metrics['discussions_comments_last_period'] = None # Explicitly set to None  
-
-else:  
-    print("Discussions feature not enabled for this repository. Skipping GraphQL calls.")  
-    # Ensure metrics are None if discussions are disabled  
-    metrics['discussions_opened_last_period'] = None  
-    metrics['discussions_comments_last_period'] = None  
-  
-# --- Final Data Preparation ---  
-# Convert datetime objects to string or ensure pyarrow handles them  
-for key, value in metrics.items():  
-    if isinstance(value, datetime):  
-        # Ensure timezone-aware datetimes are handled correctly by pyarrow  
-        # Or convert to ISO format string with timezone  
-        if value.tzinfo is None:  
-            # Optional: Make naive datetimes timezone-aware (assuming UTC) before writing  
-            # metrics[key] = value.replace(tzinfo=timezone.utc)  
-            pass # Keep naive UTC as is  
-        # else: keep timezone-aware datetimes as is  
-        # Alternatively, convert all to ISO strings:  
-        # metrics[key] = value.isoformat()  
-  
-  
-# Create DataFrame - Note the list around the dictionary for a single row  
-try:  
-    df = pd.DataFrame([metrics])  
-  
-    # Define specific data types (especially nullable integers)  
-    # Adjust based on the actual metrics collected  
-    dtype_mapping = {  
-        'stars': pd.Int64Dtype(), 'watchers': pd.Int64Dtype(), 'forks_total': pd.Int64Dtype(),  
-        'open_issues_total': pd.Int64Dtype(), 'network_count': pd.Int64Dtype(), 'size_kb': pd.Int64Dtype(),  
-        'contributors_count_total': pd.Int64Dtype(), 'releases_count_total': pd.Int64Dtype(),  
-        'forks_new_last_period': pd.Int64Dtype(), 'contributors_additions_recent_weeks': pd.Int64Dtype(),  
-        'traffic_views_last_day_total': pd.Int64Dtype(), 'traffic_views_last_day_unique': pd.Int64Dtype(),  
-        'traffic_clones_last_day_total': pd.Int64Dtype(), 'traffic_clones_last_day_unique': pd.Int64Dtype(),  
-        # 'traffic_referrers_top_count': pd.Int64Dtype(), 'traffic_popular_paths_top_count': pd.Int64Dtype(),  
-        'issues_opened_last_period': pd.Int64Dtype(), 'issues_closed_last_period': pd.Int64Dtype(),  
-        'prs_opened_last_period': pd.Int64Dtype(), 'prs_closed_last_period': pd.Int64Dtype(),  
-        'prs_merged_last_period': pd.Int64Dtype(), 'issue_comments_last_period': pd.Int64Dtype(),  
-        'pr_comments_last_period': pd.Int64Dtype(),  
-        'discussions_opened_last_period': pd.Int64Dtype(), 'discussions_comments_last_period': pd.Int64Dtype()  
-        # Add others as needed, boolean types usually fine, string types usually fine  
-    }  
-    # Filter out any keys from mapping that don't exist in the DataFrame (e.g., due to API errors)  
-    valid_dtype_mapping = {k: v for k, v in dtype_mapping.items() if k in df.columns}  
-    df = df.astype(valid_dtype_mapping)  
-  
-  
-    print("\n--- Collected Metrics ---")  
-    # Print columns horizontally for better readability if many columns  
-    pd.set_option('display.max_columns', None) # Show all columns  
-    pd.set_option('display.width', 1000) # Adjust width as needed  
-    print(df)  
-  
-  
-    # --- Write to Parquet ---  
-    print(f"\nWriting metrics to {output_filename}...")  
-    df.to_parquet(output_filename, engine='pyarrow', index=False, coerce_timestamps='us', allow_truncated_timestamps=False)  
-    print("Successfully wrote Parquet file.")  
-  
-except Exception as e:  
-    print(f"Error creating DataFrame or writing Parquet file: {e}")  
-    import traceback  
-    traceback.print_exc() # Print full traceback for debugging  
-    sys.exit(1)  
-  
-print("\nScript finished successfully.") 
+
+# --- GraphQL Helper ---
+def run_graphql_query(token, query, variables=None):
+    """Runs a GraphQL query against the GitHub API."""
+    headers = {
+        "Authorization": f"bearer {token}",
+        "Content-Type": "application/json",
+    }
+    payload = {"query": query}
+    if variables:
+        payload["variables"] = variables
+
+    try:
+        response = api_session.request(
+            "POST", graphql_url, headers=headers, json_body=payload, timeout=30
+        )  # Added timeout
+        response.raise_for_status()  # Raise GitHubError for bad responses (4xx or 5xx)
+
+        json_response = response.json()
+
+        # Queries ask for rateLimit { cost }, a query without it (or failing) counts as 1 point
+        if (stats := current_section()) is not None:
+            stats.points["graphql"] += ((json_response.get("data") or {}).get("rateLimit") or {}).get("cost", 1)
+
+        # Check for GraphQL-specific errors
+        if "errors" in json_response:
+            error_details = json.dumps(json_response["errors"], indent=2)
+            # Consider logging this instead of printing if it gets noisy
+            print(f"GraphQL query failed with errors:\n{error_details}")
+            # Decide how to handle: return None, raise exception, etc.
+            # Returning None might be suitable for metrics collection
+            return None
+
+        return json_response.get("data")
+
+    except GitHubError as e:
+        print(f"Error during GraphQL request: {e}")
+        return None
+    except json.JSONDecodeError as e:
+        print(f"Error decoding GraphQL JSON response: {e}")
+        return None
+
+
+# --- REST Helpers ---
+class GitHubError(Exception):
+    """A failed GitHub API request: an error status, or no response at all (status None)."""
+
+    def __init__(self, status, message):
+        super().__init__(f"{status} {message}" if status else message)
+        self.status = status
+
+
+def _rest_headers(token):
+    return {
+        "Authorization": f"token {token}",
+        "Accept": "application/vnd.github+json",
+        "X-GitHub-Api-Version": "2022-11-28",
+    }
+
+
+def rest_get(token, url, params=None):
+    """GETs a REST endpoint (path or full URL), raising GitHubError on an error status."""
+    if not url.startswith(("http://", "https://")):
+        url = f"{api_url}{url}"
+    if params:
+        url = f"{url}?{urlencode(params)}"
+    response = api_session.request("GET", url, headers=_rest_headers(token), timeout=15)
+    response.raise_for_status()
+    return response
+
+
+def rest_paginate(token, url, params=None, per_page=100):
+    """Yields the items of a REST list, following the Link rel="next" pages."""
+    response = rest_get(token, url, {**(params or {}), "per_page": per_page})
+    while True:
+        count_section("pages")
+        if response.status_code == 200:  # 204 for lists of an empty repository
+            yield from response.json()
+        next_url = response.links.get("next")
+        if not next_url:
+            return
+        response = rest_get(token, next_url)
+
+
+def rest_total_count(token, url, params=None):
+    """Number of items in a REST list with one request: at per_page=1 the last page number is the count."""
+    response = rest_get(token, url, {**(params or {}), "per_page": 1})
+    last_url = response.links.get("last")
+    if last_url:
+        return int(parse_qs(urlsplit(last_url).query)["page"][0])
+    return len(response.json()) if response.status_code == 200 else 0
+
+
+def _parse_github_datetime(value):
+    """Parses a GitHub timestamp ('2024-01-01T00:00:00Z') into an aware datetime."""
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _format_github_datetime(value):
+    """Formats an aware datetime for REST 'since' parameters and search qualifiers (no fractional seconds)."""
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+# --- Configuration ---
+token = os.getenv("GITHUB_TOKEN")
+repo_name = os.getenv("GITHUB_REPOSITORY")  # Format: 'owner/repo'
+# Set by the Actions runner (and pointing at the right host on GitHub Enterprise Server)
+api_url = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+graphql_url = os.getenv("GITHUB_GRAPHQL_URL", f"{api_url}/graphql")
+# Optional fan-out: collect several repositories in one process instead of just GITHUB_REPOSITORY
+repositories = os.getenv("METRICS_REPOSITORIES", "").replace(",", " ").split()  # e.g. 'owner/a, owner/b'
+org_name = os.getenv("METRICS_ORG")  # Collect every repository of this organization (or user)
+lookback_days = 1  # Define the period for "new" items (e.g., last 1 day)
+# Contributor stats are computed by GitHub on demand (HTTP 202 until ready). They are polled in
+# the background with exponential backoff while the other collectors run, up to this many seconds.
+stats_timeout = int(os.getenv("METRICS_STATS_TIMEOUT", "120"))
+stats_poll_initial_delay = 2  # Seconds before the first re-poll, doubled after every 202
+stats_poll_max_delay = 30
+max_workers = int(os.getenv("METRICS_MAX_WORKERS", "8"))  # Max number of collectors running at the same time
+# How to get the "last period" counts for forks, issues, PRs and comments:
+#   'rest'    - walk the REST list endpoints and count items one by one
+#   'graphql' - use a few batched GraphQL queries (search issueCount / connection totalCount)
+#   'search'  - REST search total_count for the issue/PR counts (forks and comments are still walked)
+count_mode = os.getenv("METRICS_COUNT_MODE", "rest")
+# Stop spending a rate-limit resource when this many points are left and wait for its reset instead
+rate_limit_reserve = int(os.getenv("METRICS_RATE_LIMIT_RESERVE", "50"))
+# Optional incremental mode: ETags and walk cursors are kept in this JSON file between runs
+state_file = os.getenv("METRICS_STATE_FILE")
+state_retention_days = int(os.getenv("METRICS_STATE_RETENTION_DAYS", "7"))  # Drop state entries unused for this long
+state_max_etags = int(os.getenv("METRICS_STATE_MAX_ETAGS", "2000"))  # Cached responses kept, the most recently used
+# Optional history dataset: also append the rows to this partitioned Parquet dataset (see metrics_dataset.py)
+dataset_dir = os.getenv("METRICS_DATASET_DIR")
+# 'parquet' (needs pyarrow) or 'ndjson' (standard library only, one JSON object per repository)
+output_format = os.getenv("METRICS_OUTPUT_FORMAT", "parquet")
+# Optional fixed collection time (ISO 8601, UTC if no offset), e.g. to replay recorded API responses
+fixed_now = os.getenv("METRICS_NOW")
+
+
+# --- Shared Rate-Limit Budget ---
+class RateLimitBudget:
+    """Shared view of the API rate limits, fed from the X-RateLimit-* response headers.
+
+    Every request (REST and GraphQL, from every collector and every repository)
+    asks the budget first, so a large fan-out waits for the reset instead of
+    failing half way through the run.
+    """
+
+    probe_timeout = 30  # Seconds to wait for the first response of a resource before sending anyway
+
+    def __init__(self, reserve):
+        self.reserve = reserve
+        self._lock = threading.Condition()
+        self._limits = {}  # resource ('core', 'search', 'graphql') -> [remaining, reset epoch seconds, reserve]
+        self._probing = set()  # Resources whose limits are unknown and whose first request is in flight
+
+    def update(self, headers):
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        resource = headers.get("X-RateLimit-Resource", "core")
+        # Small budgets (search: 30 per minute) keep at most a tenth in reserve
+        limit = int(float(headers.get("X-RateLimit-Limit", 0))) or None
+        reserve = min(self.reserve, limit // 10) if limit else self.reserve
+        with self._lock:
+            self._limits[resource] = [int(float(remaining)), int(float(reset)), reserve]
+        if (stats := current_section()) is not None:
+            stats.saw_rate_limit(resource, int(float(remaining)))
+
+    def wait(self, resource):
+        """Blocks until the resource has more than `reserve` points left, then claims one.
+
+        While nothing is known about a resource, one request goes out to learn its
+        limits and the others wait for its response (see release), so a burst of
+        parallel first requests can't run past a small budget like search's.
+        """
+        while True:
+            with self._lock:
+                limit = self._limits.get(resource)
+                if limit is None:
+                    if resource not in self._probing:
+                        self._probing.add(resource)
+                        return
+                    if not self._lock.wait(self.probe_timeout) and resource not in self._limits:
+                        return  # The probe is stuck (or got no headers), don't hold everything up
+                    continue
+                remaining, reset, reserve = limit
+                if remaining > reserve:
+                    limit[0] -= 1  # Claim a point so concurrent callers don't all see the same budget
+                    return
+                delay = reset - time.time() + 1
+                if delay <= 0:  # Window already reset, the next response refreshes the numbers
+                    del self._limits[resource]
+                    continue
+            print(
+                f"Rate limit for '{resource}' nearly used up ({remaining} left). Waiting {delay:.0f}s for the reset..."
+            )
+            time.sleep(delay)
+
+    def release(self, resource):
+        """Called after every request (and update) so requests waiting on a probe can go."""
+        with self._lock:
+            if resource in self._probing:
+                self._probing.discard(resource)
+                self._lock.notify_all()
+
+
+# --- Section Instrumentation ---
+class SectionStats:
+    """Wall time and API cost of one collector (section) for one repository.
+
+    The collector's thread is tagged with its SectionStats (see measure_section),
+    so ApiSession and the helpers can count what they do without passing it along.
+    """
+
+    def __init__(self, section, repo_name):
+        self.section = section
+        self.repo_name = repo_name
+        self.wall_seconds = 0.0  # From start to result, polled sections include the waits between polls
+        self.polls = 0
+        self.requests = 0  # HTTP exchanges, retries and redirects included
+        self.retries = 0  # After connection errors, 5xx responses and rate limiting
+        self.not_modified = 0  # Conditional requests answered with 304 (free)
+        self.pages = 0  # REST list pages and GraphQL connection pages
+        self.points = {"core": 0, "search": 0, "graphql": 0}
+        self.lowest_remaining = {}  # resource -> lowest X-RateLimit-Remaining seen
+
+    def saw_rate_limit(self, resource, remaining):
+        if remaining < self.lowest_remaining.get(resource, remaining + 1):
+            self.lowest_remaining[resource] = remaining
+
+    def as_row(self, timestamp_utc):
+        return {
+            "timestamp_utc": timestamp_utc,
+            "repository_name": self.repo_name,
+            "section": self.section,
+            "wall_seconds": round(self.wall_seconds, 3),
+            "polls": self.polls,
+            "requests": self.requests,
+            "retries": self.retries,
+            "not_modified": self.not_modified,
+            "pages": self.pages,
+            **{f"points_{resource}": points for resource, points in self.points.items()},
+            **{f"rate_limit_remaining_{resource}": self.lowest_remaining.get(resource) for resource in self.points},
+        }
+
+
+_section_local = threading.local()
+
+
+class measure_section:
+    """Context manager tagging the current thread with `stats` while a collector runs."""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def __enter__(self):
+        self._previous = getattr(_section_local, "stats", None)
+        _section_local.stats = self.stats
+        return self.stats
+
+    def __exit__(self, *exc_info):
+        _section_local.stats = self._previous
+
+
+def current_section():
+    """The SectionStats of the collector running on this thread, or None."""
+    return getattr(_section_local, "stats", None)
+
+
+def count_section(counter, n=1):
+    """Adds n to a counter of the current section (a no-op outside of a collector)."""
+    stats = current_section()
+    if stats is not None:
+        setattr(stats, counter, getattr(stats, counter) + n)
+
+
+# --- Incremental State (ETags and Cursors) ---
+class StateStore:
+    """Small JSON file that carries ETags and walk cursors from one run to the next.
+
+    'etags' maps a GET URL to the ETag and body of its last 200 response, so the
+    next run can send If-None-Match (a 304 does not count against the rate limit).
+    URLs carrying a cursor (since=..., after=...) are not kept: the cursor moves
+    with every run, so they would never be asked for again. At most `max_etags`
+    are kept, the most recently used.
+    'windows' maps 'owner/repo|walk' to the items of a REST walk that are still
+    inside the lookback window and the cursor where the walk stopped.
+    """
+
+    version = 1
+    cursor_params = ("since", "after", "before")
+
+    def __init__(self, path, retention_days, max_etags=2000):
+        self.path = path
+        self.retention = timedelta(days=retention_days)
+        self.max_etags = max_etags
+        self._lock = threading.Lock()
+        self._now = datetime.now(timezone.utc).isoformat()
+        self.data = {"version": self.version, "etags": {}, "windows": {}}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    loaded = json.load(f)
+                if loaded.get("version") == self.version:
+                    self.data = loaded
+                else:
+                    print(f"Warning: Ignoring state file {path} with unknown version {loaded.get('version')}.")
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Warning: Could not read state file {path}: {e}. Starting from scratch.")
+
+    def _get(self, section, key):
+        with self._lock:
+            entry = self.data[section].get(key)
+            if entry is not None:
+                entry["last_used"] = self._now
+            return entry
+
+    def _put(self, section, key, entry):
+        with self._lock:
+            self.data[section][key] = dict(entry, last_used=self._now)
+
+    def get_etag(self, url):
+        return self._get("etags", url)
+
+    def put_etag(self, url, response):
+        if any(param in self.cursor_params for param in parse_qs(urlsplit(url).query)):
+            return
+        self._put(
+            "etags",
+            url,
+            {
+                "etag": response.headers["ETag"],
+                # Link carries the pagination, rest_paginate needs it back on a cache hit
+                "headers": {k: v for k, v in response.headers.items() if k.lower() in ("content-type", "etag", "link")},
+                "body": response.text,
+            },
+        )
+
+    def get_window(self, key):
+        return self._get("windows", key)
+
+    def put_window(self, key, entry):
+        self._put("windows", key, entry)
+
+    def save(self):
+        """Writes the state atomically, dropping entries nobody used within the retention period."""
+        oldest = (datetime.now(timezone.utc) - self.retention).isoformat()
+        with self._lock:
+            for section in ("etags", "windows"):
+                self.data[section] = {k: v for k, v in self.data[section].items() if v.get("last_used", "") >= oldest}
+            if len(self.data["etags"]) > self.max_etags:
+                recent = sorted(self.data["etags"].items(), key=lambda item: item[1]["last_used"], reverse=True)
+                self.data["etags"] = dict(recent[: self.max_etags])
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.data, f)
+            os.replace(tmp_path, self.path)
+
+
+def _response_from_cache(entry, not_modified):
+    """Turns a 304 into the 200 response it stands for, using the cached body."""
+    # Fresh rate-limit headers from the 304, cached content headers from the original 200
+    headers = ResponseHeaders(not_modified.headers.items())
+    headers.update(ResponseHeaders(entry["headers"].items()))
+    return ApiResponse(200, headers, entry["body"].encode("utf-8"), not_modified.url)
+
+
+class ItemWindow:
+    """The items of one REST walk that fall inside the lookback window.
+
+    With a state store, the items read by earlier runs are kept together with a
+    cursor (the newest sort timestamp seen), so a walk sorted newest first can stop
+    at the cursor instead of re-reading the whole window. Without one it simply
+    counts what the walk adds.
+    """
+
+    def __init__(self, state, key, cutoff):
+        self.state = state
+        self.key = key
+        self.cutoff = cutoff
+        self.cursor = None
+        self.items = {}  # item id -> (event time ISO string, kind)
+        entry = state.get_window(key) if state else None
+        if entry:
+            self.cursor = datetime.fromisoformat(entry["cursor"]) if entry["cursor"] else None
+            for item_id, (event_time, kind) in entry["items"].items():
+                if datetime.fromisoformat(event_time) >= cutoff:
+                    self.items[item_id] = (event_time, kind)
+        self._newest = self.cursor
+
+    def reached_cursor(self, sort_time):
+        """True once a newest-first walk gets to items an earlier run already read."""
+        return self.cursor is not None and sort_time < self.cursor
+
+    def add(self, item_id, sort_time, event_time, kind=None):
+        """Records a walked item; it is counted if event_time falls inside the window."""
+        if self._newest is None or sort_time > self._newest:
+            self._newest = sort_time
+        if event_time is not None and event_time >= self.cutoff:
+            self.items[str(item_id)] = (event_time.isoformat(), kind)
+        else:
+            self.items.pop(str(item_id), None)  # No longer counted (e.g. reopened)
+
+    def count(self, kind=None):
+        return sum(1 for _, item_kind in self.items.values() if kind is None or item_kind == kind)
+
+    def commit(self):
+        """Stores the items and the new cursor. Only call this after a complete walk."""
+        if self.state:
+            self.state.put_window(
+                self.key,
+                {
+                    "cursor": self._newest.isoformat() if self._newest else None,
+                    "items": {item_id: list(value) for item_id, value in self.items.items()},
+                },
+            )
+
+
+# --- Pooled HTTP Session ---
+class ResponseHeaders(dict):
+    """Response headers with case-insensitive lookup (names are stored lower case)."""
+
+    def __init__(self, items=()):
+        super().__init__((name.lower(), value) for name, value in items)
+
+    def __getitem__(self, name):
+        return super().__getitem__(name.lower())
+
+    def __contains__(self, name):
+        return super().__contains__(name.lower())
+
+    def get(self, name, default=None):
+        return super().get(name.lower(), default)
+
+
+class ApiResponse:
+    """The parts of an HTTP response the collectors use (a small subset of requests.Response)."""
+
+    def __init__(self, status_code, headers, content, url):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.url = url
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    @property
+    def links(self):
+        """Link header as {rel: url}, e.g. {'next': ..., 'last': ...}."""
+        return {rel: url for url, rel in re.findall(r'<([^>]+)>;\s*rel="([^"]+)"', self.headers.get("Link", ""))}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            try:
+                message = self.json().get("message", "")
+            except (ValueError, AttributeError):
+                message = self.text[:200]
+            raise GitHubError(self.status_code, message)
+
+
+class ConnectionPool:
+    """Keep-alive http.client connections, reused by every thread (one request at a time each)."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._idle = {}  # (scheme, host:port) -> [connection, ...]
+
+    def get(self, scheme, netloc, timeout):
+        """Returns (connection, reused)."""
+        with self._lock:
+            idle = self._idle.get((scheme, netloc))
+            if idle:
+                connection = idle.pop()
+                if connection.sock is not None:
+                    connection.sock.settimeout(timeout)
+                connection.timeout = timeout
+                return connection, True
+        connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return connection_class(netloc, timeout=timeout), False
+
+    def put(self, scheme, netloc, connection):
+        with self._lock:
+            idle = self._idle.setdefault((scheme, netloc), [])
+            if len(idle) < self.maxsize:
+                idle.append(connection)
+                return
+        connection.close()
+
+
+def _rate_limit_resource(url):
+    if url.rstrip("/").endswith("/graphql"):
+        return "graphql"
+    if "/search/" in url:
+        return "search"
+    return "core"
+
+
+class ApiSession:
+    """One keep-alive connection pool shared by the REST and GraphQL helpers."""
+
+    max_rate_limit_waits = 3  # Attempts after being rate limited before giving up on a request
+    max_retries = 5  # Attempts after a connection error or a 502/503/504
+    max_redirects = 3  # Renamed or transferred repositories answer with a redirect
+    retry_statuses = (502, 503, 504)
+    user_agent = "AgentLab2-collect-metrics"
+
+    def __init__(self, pool_size, budget, state=None):
+        self.budget = budget
+        self.state = state  # Optional StateStore for conditional requests
+        self.pool = ConnectionPool(pool_size)
+
+    def request(self, method, url, headers=None, json_body=None, timeout=30):
+        cacheable = self.state is not None and method == "GET"
+        cached = self.state.get_etag(url) if cacheable else None
+        headers = dict(headers or {})
+        if cached:
+            headers["If-None-Match"] = cached["etag"]
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode("utf-8")
+            headers.setdefault("Content-Type", "application/json")
+
+        response = self._send(method, url, headers, body, timeout)
+
+        if cached and response.status_code == 304:
+            count_section("not_modified")
+            return _response_from_cache(cached, response)
+        if cacheable and response.status_code == 200 and response.headers.get("ETag"):
+            self.state.put_etag(url, response)
+        return response
+
+    def _send(self, method, url, headers, body, timeout):
+        resource = _rate_limit_resource(url)
+        for attempt in range(self.max_rate_limit_waits + 1):
+            self.budget.wait(resource)
+            try:
+                response = self._send_with_retries(method, url, headers, body, timeout)
+                self.budget.update(response.headers)
+            finally:
+                self.budget.release(resource)
+            stats = current_section()
+            if stats is not None and resource != "graphql" and response.status_code != 304:
+                stats.points[resource] += 1  # GraphQL reports its real cost, see run_graphql_query
+            if response.status_code not in (403, 429) or attempt == self.max_rate_limit_waits:
+                return response
+            # Primary limit: remaining is 0 until the reset. Secondary limit: Retry-After.
+            if response.headers.get("Retry-After"):
+                delay = int(response.headers["Retry-After"])
+            elif response.headers.get("X-RateLimit-Remaining") == "0":
+                delay = int(response.headers.get("X-RateLimit-Reset", time.time())) - time.time() + 1
+            else:
+                return response  # A regular 403 (e.g. missing permission for traffic data)
+            print(
+                f"Rate limited on '{resource}' (HTTP {response.status_code}). Waiting {max(delay, 1):.0f}s before retrying..."
+            )
+            if stats is not None:
+                stats.retries += 1
+            time.sleep(max(delay, 1))
+        return response
+
+    def _send_with_retries(self, method, url, headers, body, timeout):
+        """Retries connection errors and 5xx gateway errors with exponential backoff, follows redirects."""
+        redirects = 0
+        attempt = 0
+        while True:
+            try:
+                response = self._send_once(method, url, headers, body, timeout)
+            except (OSError, http.client.HTTPException) as e:
+                if attempt == self.max_retries:
+                    raise GitHubError(None, f"{method} {url} failed: {e}") from e
+                response = None
+                error = e
+            if response is not None and response.status_code in (301, 302, 307, 308) and redirects < self.max_redirects:
+                redirects += 1
+                url = response.headers["Location"]
+                continue
+            if response is not None and (
+                response.status_code not in self.retry_statuses or attempt == self.max_retries
+            ):
+                return response
+            delay = min(2**attempt, 30)
+            reason = f"HTTP {response.status_code}" if response is not None else error
+            print(f"Warning: {method} {url} failed ({reason}). Retrying in {delay}s...")
+            count_section("retries")
+            time.sleep(delay)
+            attempt += 1
+
+    def _send_once(self, method, url, headers, body, timeout):
+        count_section("requests")
+        parts = urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        headers = {"User-Agent": self.user_agent, "Accept-Encoding": "gzip", **headers}
+        connection, reused = self.pool.get(parts.scheme, parts.netloc, timeout)
+        try:
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                raw = connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if not reused:
+                    raise
+                # The server closed the idle keep-alive connection, try once more on a new one
+                connection.close()
+                connection.request(method, path, body=body, headers=headers)
+                raw = connection.getresponse()
+            content = raw.read()
+        except BaseException:
+            connection.close()
+            raise
+        if raw.will_close:
+            connection.close()
+        else:
+            self.pool.put(parts.scheme, parts.netloc, connection)
+
+        response_headers = ResponseHeaders(raw.getheaders())
+        if response_headers.get("Content-Encoding") == "gzip":
+            content = gzip.decompress(content)
+        return ApiResponse(raw.status, response_headers, content, url)
+
+
+api_session = ApiSession(pool_size=max_workers, budget=RateLimitBudget(rate_limit_reserve))
+
+
+@dataclass
+class CollectionContext:
+    """Everything a collector needs to know about the repository and the period."""
+
+    token: str
+    repo_name: str
+    repo: dict  # Repository JSON as returned by the REST API
+    lookback_days: int
+    cutoff_datetime_aware: datetime
+    cutoff_datetime_naive: datetime
+    target_traffic_date: date
+    state: StateStore = None  # Set in incremental mode
+
+    def window(self, walk):
+        """Returns the ItemWindow of one REST walk of this repository."""
+        return ItemWindow(self.state, f"{self.repo_name}|{walk}", self.cutoff_datetime_aware)
+
+
+class Collector(NamedTuple):
+    """An independent unit of collection producing a fixed set of metric keys.
+
+    A polled collector returns None while GitHub is still preparing the data;
+    the scheduler then calls it again later (see PolledRun).
+    """
+
+    name: str
+    func: Callable[[CollectionContext], dict]
+    keys: tuple
+    polled: bool = False
+
+
+# --- Standard Attributes ---
+def collect_standard_metrics(ctx):
+    print("\nFetching standard repository metrics...")
+    repo = ctx.repo
+    metrics = {}
+    try:
+        if "subscribers_count" not in repo:
+            # Organization listings leave out a few fields, get the full repository
+            repo = rest_get(ctx.token, repo["url"]).json()
+
+        # Standard Attributes
+        metrics["stars"] = repo["stargazers_count"]
+        metrics["watchers"] = repo["subscribers_count"]
+        metrics["forks_total"] = repo["forks_count"]  # Renamed for clarity
+        metrics["open_issues_total"] = repo["open_issues_count"]  # Renamed for clarity
+        metrics["network_count"] = repo["network_count"]
+        metrics["size_kb"] = repo["size"]
+        metrics["language"] = repo["language"]
+        metrics["created_at_utc"] = _parse_github_datetime(repo["created_at"])
+        metrics["pushed_at_utc"] = _parse_github_datetime(repo["pushed_at"])
+        metrics["archived"] = repo["archived"]
+        metrics["disabled"] = repo["disabled"]
+        metrics["has_issues"] = repo["has_issues"]
+        metrics["has_projects"] = repo["has_projects"]
+        metrics["has_wiki"] = repo["has_wiki"]
+        metrics["has_pages"] = repo["has_pages"]
+        metrics["has_downloads"] = repo["has_downloads"]
+        metrics["has_discussions"] = repo["has_discussions"]  # Added check for discussions
+        # The repository JSON already carries the detected license, no extra request
+        metrics["license"] = (repo.get("license") or {}).get("spdx_id")
+
+        # List Counts
+        metrics["contributors_count_total"] = rest_total_count(ctx.token, f"{repo['url']}/contributors")
+        metrics["releases_count_total"] = rest_total_count(ctx.token, f"{repo['url']}/releases")
+
+    except GitHubError as e:
+        print(f"Warning: Could not fetch some standard metrics: {e}")
+        # Missing keys are initialized to None by the scheduler
+    return metrics
+
+
+# --- Calculated Metrics: "New" Forks (Last Period) ---
+def collect_new_forks(ctx):
+    print(f"\nCalculating new forks in the last {ctx.lookback_days} day(s)...")
+    repo = ctx.repo
+    metrics = {}
+    window = ctx.window("forks")
+    try:
+        # Iterate through forks - rest_paginate follows the pages
+        for fork in rest_paginate(ctx.token, f"{repo['url']}/forks", {"sort": "newest"}):
+            created_at = _parse_github_datetime(fork["created_at"])
+            # Forks are sorted newest first, so we can stop early at the cutoff
+            # (compare naive UTC datetimes) or where the previous run stopped
+            if created_at.replace(tzinfo=None) < ctx.cutoff_datetime_naive or window.reached_cursor(created_at):
+                break
+            window.add(fork["id"], created_at, created_at)
+        window.commit()
+        new_forks_count = window.count()
+        metrics["forks_new_last_period"] = new_forks_count
+        print(f"Found {new_forks_count} new forks.")
+    except GitHubError as e:
+        print(f"Warning: Could not calculate new forks: {e}")
+        metrics["forks_new_last_period"] = None
+    return metrics
+
+
+# --- Calculated Metrics: "New" Contributors (Approximation using stats) ---
+def collect_contributor_stats(ctx):
+    """Polled collector: one request per call, returns None while GitHub computes the stats."""
+    # Using weekly stats approximation
+    print(f"\nCalculating recent contributor additions (weekly stats) for {ctx.repo_name}...")
+    metrics = {}
+    recent_contributor_adds = 0
+    response = api_session.request(
+        "GET", f"{ctx.repo['url']}/stats/contributors", headers=_rest_headers(ctx.token), timeout=15
+    )
+
+    if response.status_code == 202:
+        print(f"Contributor stats for {ctx.repo_name} are still being computed.")
+        return None
+    if response.status_code == 204:  # Empty repository
+        stats_contributors = []
+    elif response.status_code == 404:
+        print(f"Warning: Contributor stats API 404 for {ctx.repo_name}")
+        stats_contributors = []  # Treat as empty
+    elif response.status_code == 200:
+        stats_contributors = response.json()
+    else:
+        print(
+            f"Warning: Could not fetch contributor stats for {ctx.repo_name}: HTTP {response.status_code} {response.text[:200]}"
+        )
+        metrics["contributors_additions_recent_weeks"] = None
+        return metrics
+
+    cutoff_date_stats_naive = ctx.cutoff_datetime_naive  # Use naive for comparison consistency
+    print(f"Cutoff date for contributor stats: {cutoff_date_stats_naive} UTC (comparing week start)")
+    for stat in stats_contributors:
+        for week_stat in stat.get("weeks") or []:
+            week_start_time = week_stat.get("w")
+            if not isinstance(week_start_time, int):
+                print(f"Warning: Unexpected type for week start 'w': {type(week_start_time)}. Skipping.")
+                continue
+            # 'w' is the week start as a Unix timestamp
+            naive_week_start = datetime.fromtimestamp(week_start_time, timezone.utc).replace(tzinfo=None)
+            if naive_week_start >= cutoff_date_stats_naive and isinstance(week_stat.get("a"), int):
+                recent_contributor_adds += week_stat["a"]
+    metrics["contributors_additions_recent_weeks"] = recent_contributor_adds  # Changed name slightly
+    print(f"Found {recent_contributor_adds} contributor additions (approx) based on recent weekly stats.")
+    return metrics
+
+
+# --- Traffic Data (Last Day if available) ---
+def _collect_daily_traffic(ctx, kind):
+    """Returns (count, uniques) of the target day from /traffic/views or /traffic/clones, or (None, None)."""
+    response = rest_get(ctx.token, f"{ctx.repo['url']}/traffic/{kind}", {"per": "day"})
+    entries = response.json().get(kind)
+    # Check if the list exists and is not empty
+    if not entries:
+        print(f"Warning: No daily {kind} data list available.")
+        return None, None
+    # Iterate through the list of daily data
+    for entry in entries:
+        timestamp = _parse_github_datetime(entry.get("timestamp"))
+        if timestamp is None:
+            print(f"Warning: Skipping {kind} entry with missing timestamp: {entry}")
+            continue
+        # Compare the date part of the timestamp with our target date
+        if timestamp.date() == ctx.target_traffic_date:
+            # Found the data for yesterday!
+            return entry.get("count"), entry.get("uniques")
+    # After checking all entries, we didn't find the target date
+    print(f"Warning: No {kind} data found specifically for target date {ctx.target_traffic_date}. Metrics remain None.")
+    return None, None
+
+
+def collect_views_traffic(ctx):
+    print(f"\nFetching views traffic for date: {ctx.target_traffic_date}")
+    # Initialize metrics for the target date
+    metrics = {
+        "traffic_views_last_day_total": None,
+        "traffic_views_last_day_unique": None,
+    }
+    try:
+        total, unique = _collect_daily_traffic(ctx, "views")
+        metrics["traffic_views_last_day_total"] = total
+        metrics["traffic_views_last_day_unique"] = unique
+        if total is not None:
+            print(f"Found views for {ctx.target_traffic_date}: Total={total}, Unique={unique}")
+    except GitHubError as e:
+        print(f"Warning: Could not fetch views traffic data: {e}")
+        # Metrics remain None
+    except Exception as e:  # Catch other potential errors during processing
+        print(f"Warning: Error processing view data: {e}")
+        # Metrics remain None
+    return metrics
+
+
+def collect_clones_traffic(ctx):
+    print(f"\nFetching clones traffic for date: {ctx.target_traffic_date}")
+    # Initialize metrics for the target date
+    metrics = {
+        "traffic_clones_last_day_total": None,
+        "traffic_clones_last_day_unique": None,
+    }
+    try:
+        total, unique = _collect_daily_traffic(ctx, "clones")
+        metrics["traffic_clones_last_day_total"] = total
+        metrics["traffic_clones_last_day_unique"] = unique
+        if total is not None:
+            print(f"Found clones for {ctx.target_traffic_date}: Total={total}, Unique={unique}")
+    except GitHubError as e:
+        print(f"Warning: Could not fetch clones traffic data: {e}")
+        # Metrics remain None
+    except Exception as e:  # Catch other potential errors during processing
+        print(f"Warning: Error processing clone data: {e}")
+        # Metrics remain None
+    return metrics
+
+
+# --- Referrers and Popular Content Data (Last 14 days) ---
+def collect_top_referrers(ctx):
+    print("\nFetching top referrers data (last 14 days)...")
+    metrics = {}
+    try:
+        top_referrers_list = rest_get(ctx.token, f"{ctx.repo['url']}/traffic/popular/referrers").json()
+        # Keep only the relevant fields, in a fixed order
+        top_referrers_data = [
+            {"referrer": r.get("referrer"), "count": r.get("count"), "uniques": r.get("uniques")}
+            for r in top_referrers_list
+        ]
+        metrics["traffic_top_referrers_data"] = top_referrers_data  # Store the list of dicts
+        print(f"Fetched {len(top_referrers_data)} top referrer entries.")
+
+    except GitHubError as e:
+        print(f"Warning: Could not fetch top referrers: {e}")
+        metrics["traffic_top_referrers_data"] = None  # Set to None on API error
+    except Exception as e:  # Catch potential errors during processing the list
+        print(f"Warning: Error processing referrer data: {e}")
+        metrics["traffic_top_referrers_data"] = None
+    return metrics
+
+
+def collect_top_paths(ctx):
+    print("\nFetching top paths data (last 14 days)...")
+    metrics = {}
+    try:
+        top_paths_list = rest_get(ctx.token, f"{ctx.repo['url']}/traffic/popular/paths").json()
+        # Keep only the relevant fields, in a fixed order (title might not always exist)
+        top_paths_data = [
+            {"path": p.get("path"), "title": p.get("title"), "count": p.get("count"), "uniques": p.get("uniques")}
+            for p in top_paths_list
+        ]
+        metrics["traffic_top_paths_data"] = top_paths_data  # Store the list of dicts
+        print(f"Fetched {len(top_paths_data)} top path entries.")
+
+    except GitHubError as e:
+        print(f"Warning: Could not fetch top paths: {e}")
+        metrics["traffic_top_paths_data"] = None  # Set to None on API error
+    except Exception as e:  # Catch potential errors during processing the list
+        print(f"Warning: Error processing path data: {e}")
+        metrics["traffic_top_paths_data"] = None
+    return metrics
+
+
+# --- Issues Opened/Closed Last Period ---
+def collect_issue_counts(ctx):
+    print(f"\nCalculating Issues opened/closed in the last {ctx.lookback_days} day(s)...")
+    repo = ctx.repo
+    metrics = {}
+    # Keyed 'issues_created': runs before this counted every issue and PR updated in the period
+    opened_window = ctx.window("issues_created")
+    closed_window = ctx.window("issues_closed")
+    try:
+        # Issues opened: created in the period, PRs excluded (same definition as the
+        # 'is:issue created:>=' search of the other count modes). 'since' filters by
+        # update time, so walk newest first and stop at the cutoff or the cursor.
+        opened_issues = rest_paginate(
+            ctx.token, f"{repo['url']}/issues", {"state": "all", "sort": "created", "direction": "desc"}
+        )
+        for issue in opened_issues:
+            created_at = _parse_github_datetime(issue["created_at"])
+            if created_at < ctx.cutoff_datetime_aware or opened_window.reached_cursor(created_at):
+                break
+            # The issues endpoint returns PRs as well (they have a 'pull_request' key)
+            opened_window.add(issue["id"], created_at, None if issue.get("pull_request") else created_at)
+        opened_window.commit()
+
+        # Issues closed: Need to check closed_at time
+        # Get recently updated closed issues/PRs
+        since = max(ctx.cutoff_datetime_aware, closed_window.cursor or ctx.cutoff_datetime_aware)
+        recently_updated_closed_items = rest_paginate(
+            ctx.token,
+            f"{repo['url']}/issues",
+            {"state": "closed", "sort": "updated", "direction": "desc", "since": _format_github_datetime(since)},
+        )
+        for item in recently_updated_closed_items:
+            closed_at = None
+            item_closed_at = _parse_github_datetime(item["closed_at"])
+            if item_closed_at and item_closed_at >= ctx.cutoff_datetime_aware:
+                # Check if it's actually an Issue (not a PR)
+                # An item is a PR if it has the 'pull_request' key
+                if not item.get("pull_request"):
+                    closed_at = item_closed_at
+            closed_window.add(item["id"], _parse_github_datetime(item["updated_at"]), closed_at)
+        closed_window.commit()
+
+        issues_opened_count = opened_window.count()
+        issues_closed_count = closed_window.count()
+        metrics["issues_opened_last_period"] = issues_opened_count
+        metrics["issues_closed_last_period"] = issues_closed_count
+        print(f"Found: Opened={issues_opened_count}, Closed={issues_closed_count}")
+
+    except GitHubError as e:
+        print(f"Warning: Could not calculate issue metrics: {e}")
+        metrics["issues_opened_last_period"] = None
+        metrics["issues_closed_last_period"] = None
+    return metrics
+
+
+# --- Pull Requests Opened/Closed Last Period ---
+def collect_pr_counts(ctx):
+    print(f"\nCalculating PRs opened/closed in the last {ctx.lookback_days} day(s)...")
+    repo = ctx.repo
+    metrics = {}
+    opened_window = ctx.window("pulls_opened")
+    closed_window = ctx.window("pulls_closed")  # Kind 'merged' or 'closed'
+    try:
+        # PRs opened: the pulls endpoint has no 'since', so walk newest first
+        opened_pulls = rest_paginate(
+            ctx.token,
+            f"{repo['url']}/pulls",
+            {"state": "all", "sort": "created", "direction": "desc", "base": repo["default_branch"]},
+        )  # Filter by base branch if desired
+        for pr in opened_pulls:
+            created_at = _parse_github_datetime(pr["created_at"])
+            # Since sorted by created desc, stop at the cutoff or where the previous run stopped
+            if created_at < ctx.cutoff_datetime_aware or opened_window.reached_cursor(created_at):
+                break
+            opened_window.add(pr["id"], created_at, created_at)
+        opened_window.commit()
+
+        # PRs closed/merged: Check closed_at/merged_at
+        # Get recently updated closed PRs
+        recently_updated_closed_pulls = rest_paginate(
+            ctx.token, f"{repo['url']}/pulls", {"state": "closed", "sort": "updated", "direction": "desc"}
+        )
+        for pr in recently_updated_closed_pulls:
+            updated_at = _parse_github_datetime(pr["updated_at"])
+            # Stop checking if PRs updated date is older than cutoff (or already read by the previous run)
+            if updated_at < ctx.cutoff_datetime_aware or closed_window.reached_cursor(updated_at):
+                break
+
+            merged_at = _parse_github_datetime(pr["merged_at"])
+            merged = bool(merged_at and merged_at >= ctx.cutoff_datetime_aware)
+            closed_window.add(
+                pr["id"], updated_at, _parse_github_datetime(pr["closed_at"]), "merged" if merged else "closed"
+            )
+        closed_window.commit()
+
+        prs_opened_count = opened_window.count()
+        prs_closed_count = closed_window.count()  # Includes merged PRs
+        prs_merged_count = closed_window.count("merged")
+        metrics["prs_opened_last_period"] = prs_opened_count
+        metrics["prs_closed_last_period"] = prs_closed_count
+        metrics["prs_merged_last_period"] = prs_merged_count
+        print(f"Found: Opened={prs_opened_count}, Closed={prs_closed_count}, Merged={prs_merged_count}")
+
+    except GitHubError as e:
+        print(f"Warning: Could not calculate PR metrics: {e}")
+        metrics["prs_opened_last_period"] = None
+        metrics["prs_closed_last_period"] = None
+        metrics["prs_merged_last_period"] = None
+    return metrics
+
+
+# --- Comments (Issues, PRs) Last Period ---
+def collect_comment_counts(ctx):
+    print(f"\nCalculating Issue/PR Comments in the last {ctx.lookback_days} day(s)...")
+    repo = ctx.repo
+    metrics = {}
+    comments_window = ctx.window("issue_comments")  # Kind 'pr' or 'issue'
+    review_window = ctx.window("review_comments")
+    params = {"sort": "created", "direction": "desc", "since": _format_github_datetime(ctx.cutoff_datetime_aware)}
+
+    try:
+        # General Issue/PR comments (use issues endpoint)
+        for comment in rest_paginate(ctx.token, f"{repo['url']}/issues/comments", params):
+            created_at = _parse_github_datetime(comment["created_at"])
+            # Since comments are sorted desc, we can stop at the cutoff or where the previous run stopped
+            if created_at < ctx.cutoff_datetime_aware or comments_window.reached_cursor(created_at):
+                break
+            # Differentiate based on URL
+            kind = "pr" if "/pull/" in comment["html_url"] else "issue"
+            comments_window.add(comment["id"], created_at, created_at, kind)
+        comments_window.commit()
+
+        # PR Review Comments
+        for comment in rest_paginate(ctx.token, f"{repo['url']}/pulls/comments", params):
+            created_at = _parse_github_datetime(comment["created_at"])
+            if created_at < ctx.cutoff_datetime_aware or review_window.reached_cursor(created_at):
+                break
+            review_window.add(comment["id"], created_at, created_at)
+        review_window.commit()
+
+        issue_comments_last_period = comments_window.count("issue")
+        pr_comments_last_period = (
+            comments_window.count("pr") + review_window.count()
+        )  # Includes review comments and general PR comments
+        metrics["issue_comments_last_period"] = issue_comments_last_period
+        metrics["pr_comments_last_period"] = pr_comments_last_period  # Combined count
+        print(f"Found: Issue Comments={issue_comments_last_period}, PR Comments={pr_comments_last_period}")
+
+    except GitHubError as e:
+        print(f"Warning: Could not calculate comment metrics: {e}")
+        metrics["issue_comments_last_period"] = None
+        metrics["pr_comments_last_period"] = None
+    return metrics
+
+
+# --- Batched GraphQL Counts (forks, issues, PRs, comments) ---
+# Replaces the REST walks above when count_mode == 'graphql'. Search issueCount
+# and connection totalCount give the numbers without downloading the items.
+GRAPHQL_COUNTS_QUERY = """
+query($owner: String!, $name: String!, $issuesOpened: String!, $issuesClosed: String!,
+      $prsOpened: String!, $prsClosed: String!, $prsMerged: String!) {
+  rateLimit { cost }
+  issuesOpened: search(query: $issuesOpened, type: ISSUE, first: 0) { issueCount }
+  issuesClosed: search(query: $issuesClosed, type: ISSUE, first: 0) { issueCount }
+  prsOpened: search(query: $prsOpened, type: ISSUE, first: 0) { issueCount }
+  prsClosed: search(query: $prsClosed, type: ISSUE, first: 0) { issueCount }
+  prsMerged: search(query: $prsMerged, type: ISSUE, first: 0) { issueCount }
+  repository(owner: $owner, name: $name) {
+    forks(first: 100, orderBy: {field: CREATED_AT, direction: DESC}) {
+      nodes { createdAt }
+      pageInfo { hasNextPage endCursor }
+    }
+  }
+}
+"""
+
+GRAPHQL_FORKS_PAGE_QUERY = """
+query($owner: String!, $name: String!, $after: String) {
+  rateLimit { cost }
+  repository(owner: $owner, name: $name) {
+    forks(first: 100, after: $after, orderBy: {field: CREATED_AT, direction: DESC}) {
+      nodes { createdAt }
+      pageInfo { hasNextPage endCursor }
+    }
+  }
+}
+"""
+
+SEARCH_RESULT_LIMIT = 1000  # GitHub search never returns more results than this
+
+# Comments have no search qualifier, so walk the items updated in the period
+# (100 per query) and count the recent comment timestamps on each of them.
+# Review comments are counted by their own createdAt, through the reviews.
+# Connections are cut (last 100 comments, 20 reviews, 50 comments per review):
+# an item whose cut connection still starts inside the period is recounted over
+# REST (see _count_item_comments_rest).
+GRAPHQL_COMMENTS_QUERY = """
+query($searchQuery: String!, $after: String) {
+  rateLimit { cost }
+  search(query: $searchQuery, type: ISSUE, first: 100, after: $after) {
+    issueCount
+    nodes {
+      __typename
+      ... on Issue {
+        number
+        comments(last: 100) { nodes { createdAt } pageInfo { hasPreviousPage } }
+      }
+      ... on PullRequest {
+        number
+        comments(last: 100) { nodes { createdAt } pageInfo { hasPreviousPage } }
+        reviews(last: 20) {
+          nodes { submittedAt comments(last: 50) { nodes { createdAt } pageInfo { hasPreviousPage } } }
+          pageInfo { hasPreviousPage }
+        }
+      }
+    }
+    pageInfo { hasNextPage endCursor }
+  }
+}
+"""
+
+
+# Query variables / result aliases of GRAPHQL_COUNTS_QUERY
+GRAPHQL_COUNT_ALIASES = {
+    "issues_opened_last_period": "issuesOpened",
+    "issues_closed_last_period": "issuesClosed",
+    "prs_opened_last_period": "prsOpened",
+    "prs_closed_last_period": "prsClosed",
+    "prs_merged_last_period": "prsMerged",
+}
+
+
+def issue_pr_search_queries(ctx, since):
+    """Search queries of the issue/PR counts, shared by the 'graphql' and 'search' count modes."""
+    repo_qualifier = f"repo:{ctx.repo_name}"
+    return {
+        "issues_opened_last_period": f"{repo_qualifier} is:issue created:>={since}",
+        "issues_closed_last_period": f"{repo_qualifier} is:issue is:closed closed:>={since}",
+        # Same base branch filter as the REST walk
+        "prs_opened_last_period": f"{repo_qualifier} is:pr base:{ctx.repo['default_branch']} created:>={since}",
+        "prs_closed_last_period": f"{repo_qualifier} is:pr is:closed closed:>={since}",  # Includes merged PRs
+        "prs_merged_last_period": f"{repo_qualifier} is:pr is:merged merged:>={since}",
+    }
+
+
+def _count_new_forks_graphql(ctx, owner, name, forks_page):
+    """Counts forks created since the cutoff, following pages only while they are all new."""
+    new_forks_count = 0
+    while True:
+        for node in forks_page["nodes"]:
+            if _parse_github_datetime(node["createdAt"]) < ctx.cutoff_datetime_aware:
+                # Forks are sorted newest first, so we can stop early
+                return new_forks_count
+            new_forks_count += 1
+        if not forks_page["pageInfo"]["hasNextPage"]:
+            return new_forks_count
+        count_section("pages")
+        data = run_graphql_query(
+            ctx.token,
+            GRAPHQL_FORKS_PAGE_QUERY,
+            {"owner": owner, "name": name, "after": forks_page["pageInfo"]["endCursor"]},
+        )
+        if not data or not data.get("repository"):
+            raise ValueError("fork page query returned no data")
+        forks_page = data["repository"]["forks"]
+
+
+def _recent_count(connection, cutoff):
+    """(comments created since the cutoff, whether older pages may hold more) of a `last: n` connection."""
+    times = [_parse_github_datetime(c["createdAt"]) for c in connection["nodes"]]
+    recent = sum(1 for t in times if t >= cutoff)
+    # Nodes come oldest first: if even the oldest one is recent, the cut-off pages may be too
+    truncated = connection["pageInfo"]["hasPreviousPage"] and (not times or times[0] >= cutoff)
+    return recent, truncated
+
+
+def _count_item_comments_rest(ctx, path):
+    """Comments created since the cutoff on one issue or PR ('issues/1/comments', 'pulls/1/comments')."""
+    since = _format_github_datetime(ctx.cutoff_datetime_aware)
+    return sum(
+        1
+        for c in rest_paginate(
+            ctx.token, f"{ctx.repo['url']}/{path}", {"since": since}
+        )  # 'since' filters on updated_at
+        if _parse_github_datetime(c["created_at"]) >= ctx.cutoff_datetime_aware
+    )
+
+
+def _count_review_comments(ctx, node):
+    """Review comments created since the cutoff on one PR node of GRAPHQL_COMMENTS_QUERY."""
+    reviews = node["reviews"]
+    count = 0
+    # Older reviews were cut off and the oldest one fetched is recent (or still pending, no submittedAt)
+    oldest = _parse_github_datetime(reviews["nodes"][0]["submittedAt"]) if reviews["nodes"] else None
+    truncated = reviews["pageInfo"]["hasPreviousPage"] and (oldest is None or oldest >= ctx.cutoff_datetime_aware)
+    for review in reviews["nodes"]:
+        recent, review_truncated = _recent_count(review["comments"], ctx.cutoff_datetime_aware)
+        count += recent
+        truncated = truncated or review_truncated
+    if not truncated:
+        return count
+    return _count_item_comments_rest(ctx, f"pulls/{node['number']}/comments")
+
+
+def _count_comments_graphql(ctx, since):
+    """Counts issue and PR comments created since the cutoff.
+
+    Returns (None, None) when more items were updated than the search can return.
+    """
+    issue_comments = 0
+    pr_comments = 0
+    variables = {"searchQuery": f"repo:{ctx.repo_name} updated:>={since}", "after": None}
+    while True:
+        count_section("pages")
+        data = run_graphql_query(ctx.token, GRAPHQL_COMMENTS_QUERY, variables)
+        if not data or not data.get("search"):
+            raise ValueError("comment search query returned no data")
+        if data["search"]["issueCount"] >= SEARCH_RESULT_LIMIT:
+            print(
+                f"Warning: {data['search']['issueCount']} items updated, more than search returns. Skipping comment counts."
+            )
+            return None, None
+        for node in data["search"]["nodes"]:
+            recent, truncated = _recent_count(node["comments"], ctx.cutoff_datetime_aware)
+            if truncated:
+                recent = _count_item_comments_rest(ctx, f"issues/{node['number']}/comments")
+            if node["__typename"] == "PullRequest":
+                pr_comments += recent + _count_review_comments(ctx, node)
+            else:
+                issue_comments += recent
+        page_info = data["search"]["pageInfo"]
+        if not page_info["hasNextPage"]:
+            return issue_comments, pr_comments
+        variables["after"] = page_info["endCursor"]
+
+
+def collect_counts_graphql(ctx):
+    print(f"\nCalculating fork/issue/PR/comment counts in the last {ctx.lookback_days} day(s) via GraphQL...")
+    metrics = {}
+    owner, name = ctx.repo_name.split("/", 1)
+    # Search qualifiers accept ISO 8601 timestamps, but without fractional seconds
+    since = _format_github_datetime(ctx.cutoff_datetime_aware)
+    variables = {"owner": owner, "name": name}
+    for key, search_query in issue_pr_search_queries(ctx, since).items():
+        variables[GRAPHQL_COUNT_ALIASES[key]] = search_query
+
+    data = run_graphql_query(ctx.token, GRAPHQL_COUNTS_QUERY, variables)
+    if data:
+        try:
+            for key, alias in GRAPHQL_COUNT_ALIASES.items():
+                metrics[key] = data[alias]["issueCount"]
+            print(
+                f"Found: Issues Opened={metrics['issues_opened_last_period']}, Closed={metrics['issues_closed_last_period']}"
+            )
+            print(
+                f"Found: PRs Opened={metrics['prs_opened_last_period']}, Closed={metrics['prs_closed_last_period']}, Merged={metrics['prs_merged_last_period']}"
+            )
+        except (KeyError, TypeError) as e:
+            print(f"Warning: Could not extract issue/PR counts from GraphQL response: {e}")
+        try:
+            metrics["forks_new_last_period"] = _count_new_forks_graphql(ctx, owner, name, data["repository"]["forks"])
+            print(f"Found {metrics['forks_new_last_period']} new forks.")
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Warning: Could not calculate new forks via GraphQL: {e}")
+    else:
+        print("Warning: Failed to get fork/issue/PR counts via GraphQL.")
+
+    try:
+        issue_comments, pr_comments = _count_comments_graphql(ctx, since)
+        metrics["issue_comments_last_period"] = issue_comments
+        metrics["pr_comments_last_period"] = pr_comments  # Combined count
+        print(f"Found: Issue Comments={issue_comments}, PR Comments={pr_comments}")
+    except (GitHubError, KeyError, TypeError, ValueError) as e:
+        print(f"Warning: Could not calculate comment metrics via GraphQL: {e}")
+        metrics["issue_comments_last_period"] = None
+        metrics["pr_comments_last_period"] = None
+    return metrics
+
+
+# --- Search Counts (issues, PRs) ---
+# Replaces the REST issue/PR walks when count_mode == 'search'. The server counts
+# the matching items: one request per number, and only total_count is read
+# (per_page=1, the items themselves are not needed).
+def _search_total_count(ctx, stats, search_query):
+    with measure_section(stats):  # Runs on a helper thread, count its requests in the collector's section
+        result = rest_get(ctx.token, "/search/issues", {"q": search_query, "per_page": 1}).json()
+    if result.get("incomplete_results"):
+        print(f"Warning: Search '{search_query}' timed out on GitHub's side, the count may be too low.")
+    return result["total_count"]
+
+
+def collect_counts_search(ctx):
+    print(f"\nCounting Issues/PRs opened/closed in the last {ctx.lookback_days} day(s) via search...")
+    metrics = {}
+    since = _format_github_datetime(ctx.cutoff_datetime_aware)
+    queries = issue_pr_search_queries(ctx, since)
+    # Sent together: the shared RateLimitBudget paces the 'search' bucket (30 per minute)
+    # across all collectors and repositories.
+    with ThreadPoolExecutor(max_workers=len(queries), thread_name_prefix="search-count") as pool:
+        futures = {key: pool.submit(_search_total_count, ctx, current_section(), q) for key, q in queries.items()}
+        for key, future in futures.items():
+            try:
+                metrics[key] = future.result()
+            except (GitHubError, KeyError, ValueError) as e:
+                print(f"Warning: Could not count {key} via search: {e}")
+    print(
+        f"Found: Issues Opened={metrics.get('issues_opened_last_period')}, Closed={metrics.get('issues_closed_last_period')}"
+    )
+    print(
+        f"Found: PRs Opened={metrics.get('prs_opened_last_period')}, Closed={metrics.get('prs_closed_last_period')}, Merged={metrics.get('prs_merged_last_period')}"
+    )
+    return metrics
+
+
+# --- Discussions Metrics (via GraphQL) ---
+def collect_discussions(ctx):
+    print(f"\nCalculating Discussion Metrics for the last {ctx.lookback_days} day(s) via GraphQL...")
+
+    # Initialize metrics
+    metrics = {
+        "discussions_opened_last_period": None,
+        "discussions_comments_last_period": None,  # Still challenging
+    }
+
+    # Check if discussions are enabled first (attribute of the already fetched repo, no API call)
+    if ctx.repo["has_discussions"]:
+        # Format the cutoff date as an ISO 8601 string for GraphQL
+        since_iso_string = ctx.cutoff_datetime_aware.isoformat()
+
+        # --- Query for Discussions Opened ---
+        # Use the search API via GraphQL for efficient filtering by creation date
+        search_query_string = f"repo:{ctx.repo_name} type:discussion is:open created:>={since_iso_string}"
+        # Also count closed ones created in the period? Add another query or adjust logic if needed.
+        # This query counts currently 'open' discussions created since the cutoff.
+
+        discussions_search_query = """
+        query($searchQuery: String!) {
+          rateLimit { cost }
+          search(query: $searchQuery, type: DISCUSSION, first: 0) {
+            discussionCount
+          }
+        }
+        """
+        variables = {"searchQuery": search_query_string}
+
+        print(f"Running GraphQL search for new discussions with query: '{search_query_string}'")
+        graphql_data_disc = run_graphql_query(ctx.token, discussions_search_query, variables)
+
+        if graphql_data_disc and "search" in graphql_data_disc:
+            try:
+                metrics["discussions_opened_last_period"] = graphql_data_disc["search"]["discussionCount"]
+                print(f"Found via GraphQL Search: Discussions Opened={metrics['discussions_opened_last_period']}")
+            except (KeyError, TypeError) as e:
+                print(
+                    f"Warning: Could not extract discussion count from GraphQL response: {e}. Response: {graphql_data_disc}"
+                )
+        else:
+            print("Warning: Failed to get discussion count via GraphQL search.")
+
+        # --- Query for Discussion Comments ---
+        # NOTE: Getting an exact count of *all* comments across *all* discussions created
+        # within a specific time window using a single, efficient GraphQL query is difficult.
+        # The search API doesn't seem to support filtering for `type:discussioncomment` directly.
+        # A possible (but potentially slow and complex) alternative would be:
+        # 1. Fetch discussions UPDATED since the cutoff date.
+        # 2. For each discussion, fetch comments created since the cutoff date (requires pagination per discussion).
+        # This approach can lead to many API calls and is not implemented here for efficiency.
+        # We will leave `discussions_comments_last_period` as None.
+
+        print(
+            "Note: Fetching discussion *comment* counts for the period is complex with GraphQL Search and not implemented."
+        )
+
+    else:
+        print("Discussions feature not enabled for this repository. Skipping GraphQL calls.")
+        # Metrics stay None if discussions are disabled
+    return metrics
+
+
+# --- Collector Registry ---
+# Each collector is independent of the others, so they can run in any order.
+# The order here only fixes the column order of the output.
+COLLECTORS = [
+    Collector(
+        "standard",
+        collect_standard_metrics,
+        (
+            "stars",
+            "watchers",
+            "forks_total",
+            "open_issues_total",
+            "network_count",
+            "size_kb",
+            "language",
+            "created_at_utc",
+            "pushed_at_utc",
+            "archived",
+            "disabled",
+            "has_issues",
+            "has_projects",
+            "has_wiki",
+            "has_pages",
+            "has_downloads",
+            "has_discussions",
+            "license",
+            "contributors_count_total",
+            "releases_count_total",
+        ),
+    ),
+    Collector("forks", collect_new_forks, ("forks_new_last_period",)),
+    Collector("contributor_stats", collect_contributor_stats, ("contributors_additions_recent_weeks",), polled=True),
+    Collector("views", collect_views_traffic, ("traffic_views_last_day_total", "traffic_views_last_day_unique")),
+    Collector("clones", collect_clones_traffic, ("traffic_clones_last_day_total", "traffic_clones_last_day_unique")),
+    Collector("referrers", collect_top_referrers, ("traffic_top_referrers_data",)),
+    Collector("paths", collect_top_paths, ("traffic_top_paths_data",)),
+    Collector("issues", collect_issue_counts, ("issues_opened_last_period", "issues_closed_last_period")),
+    Collector(
+        "pulls", collect_pr_counts, ("prs_opened_last_period", "prs_closed_last_period", "prs_merged_last_period")
+    ),
+    Collector("comments", collect_comment_counts, ("issue_comments_last_period", "pr_comments_last_period")),
+    Collector(
+        "discussions", collect_discussions, ("discussions_opened_last_period", "discussions_comments_last_period")
+    ),
+]
+
+# Output column order, independent of which collectors produced the values
+METRIC_KEYS = [key for collector in COLLECTORS for key in collector.keys]
+
+# Type of every output column. Everything is nullable: a failed collector leaves None.
+# 'referrers'/'paths' are lists of dicts (see ENTRY_FIELDS), unpacked into child tables by metrics_dataset.py.
+COLUMN_TYPES = {
+    "timestamp_utc": "timestamp",
+    "repository_name": "string",
+    "stars": "int64",
+    "watchers": "int64",
+    "forks_total": "int64",
+    "open_issues_total": "int64",
+    "network_count": "int64",
+    "size_kb": "int64",
+    "language": "string",
+    "created_at_utc": "timestamp",
+    "pushed_at_utc": "timestamp",
+    "archived": "bool",
+    "disabled": "bool",
+    "has_issues": "bool",
+    "has_projects": "bool",
+    "has_wiki": "bool",
+    "has_pages": "bool",
+    "has_downloads": "bool",
+    "has_discussions": "bool",
+    "license": "string",
+    "contributors_count_total": "int64",
+    "releases_count_total": "int64",
+    "forks_new_last_period": "int64",
+    "contributors_additions_recent_weeks": "int64",
+    "traffic_views_last_day_total": "int64",
+    "traffic_views_last_day_unique": "int64",
+    "traffic_clones_last_day_total": "int64",
+    "traffic_clones_last_day_unique": "int64",
+    "traffic_top_referrers_data": "referrers",
+    "traffic_top_paths_data": "paths",
+    "issues_opened_last_period": "int64",
+    "issues_closed_last_period": "int64",
+    "prs_opened_last_period": "int64",
+    "prs_closed_last_period": "int64",
+    "prs_merged_last_period": "int64",
+    "issue_comments_last_period": "int64",
+    "pr_comments_last_period": "int64",
+    "discussions_opened_last_period": "int64",
+    "discussions_comments_last_period": "int64",
+}
+assert list(COLUMN_TYPES)[2:] == METRIC_KEYS, "COLUMN_TYPES is out of sync with COLLECTORS"
+# Columns of the per-section collection stats, written next to the metrics (see SectionStats)
+SECTION_STATS_TYPES = {
+    "timestamp_utc": "timestamp",
+    "repository_name": "string",
+    "section": "string",
+    "wall_seconds": "float64",
+    "polls": "int64",
+    "requests": "int64",
+    "retries": "int64",
+    "not_modified": "int64",
+    "pages": "int64",
+    "points_core": "int64",
+    "points_search": "int64",
+    "points_graphql": "int64",
+    "rate_limit_remaining_core": "int64",
+    "rate_limit_remaining_search": "int64",
+    "rate_limit_remaining_graphql": "int64",
+}
+# Fields of one entry of the list columns
+ENTRY_FIELDS = {
+    "referrers": (("referrer", "string"), ("count", "int64"), ("uniques", "int64")),
+    "paths": (("path", "string"), ("title", "string"), ("count", "int64"), ("uniques", "int64")),
+}
+
+# Collectors replaced by collect_counts_graphql in 'graphql' count mode
+REST_COUNT_COLLECTORS = ("forks", "issues", "pulls", "comments")
+GRAPHQL_COUNTS_COLLECTOR = Collector(
+    "graphql_counts",
+    collect_counts_graphql,
+    (
+        "forks_new_last_period",
+        "issues_opened_last_period",
+        "issues_closed_last_period",
+        "prs_opened_last_period",
+        "prs_closed_last_period",
+        "prs_merged_last_period",
+        "issue_comments_last_period",
+        "pr_comments_last_period",
+    ),
+)
+
+
+# Collectors replaced by collect_counts_search in 'search' count mode
+REST_ISSUE_PR_COLLECTORS = ("issues", "pulls")
+SEARCH_COUNTS_COLLECTOR = Collector("search_counts", collect_counts_search, tuple(GRAPHQL_COUNT_ALIASES))
+
+
+def get_collectors(count_mode):
+    """Returns the collectors to run for the given count mode ('rest', 'graphql' or 'search')."""
+    if count_mode == "rest":
+        return list(COLLECTORS)
+    if count_mode == "graphql":
+        return [c for c in COLLECTORS if c.name not in REST_COUNT_COLLECTORS] + [GRAPHQL_COUNTS_COLLECTOR]
+    if count_mode == "search":
+        return [c for c in COLLECTORS if c.name not in REST_ISSUE_PR_COLLECTORS] + [SEARCH_COUNTS_COLLECTOR]
+    raise ValueError(f"Unknown count mode: {count_mode!r} (expected 'rest', 'graphql' or 'search')")
+
+
+# --- Scheduler ---
+def _run_collector(collector, ctx, stats=None):
+    """Runs one collector, turning unexpected failures into None metrics."""
+    stats = stats or SectionStats(collector.name, ctx.repo_name)
+    start = time.monotonic()
+    with measure_section(stats):
+        stats.polls += 1
+        try:
+            result = collector.func(ctx)
+        except Exception as e:
+            print(f"Warning: Collector '{collector.name}' failed unexpectedly for {ctx.repo_name}: {e}")
+            result = {}
+    stats.wall_seconds = time.monotonic() - start
+    print(
+        f"Collector '{collector.name}' for {ctx.repo_name} finished in {stats.wall_seconds:.1f}s ({stats.requests} request(s))"
+    )
+    # Every key the collector owns ends up in the output, even if it failed half way
+    return {key: result.get(key) for key in collector.keys}
+
+
+class DelayedSubmitter:
+    """Submits callables to a pool after a delay, using one background thread for all of them.
+
+    Waiting between polls happens here, so it never occupies a collector thread.
+    """
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._queue = []  # (due monotonic time, sequence, fn)
+        self._sequence = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="delayed-submitter", daemon=True)
+        self._thread.start()
+
+    def submit_later(self, delay, fn):
+        with self._cond:
+            self._sequence += 1
+            heapq.heappush(self._queue, (time.monotonic() + delay, self._sequence, fn))
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _run(self):
+        with self._cond:
+            while not self._closed:
+                if not self._queue:
+                    self._cond.wait()
+                    continue
+                due, _, fn = self._queue[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._queue)
+                self._pool.submit(fn)
+
+
+class PolledRun:
+    """Drives a polled collector: call, and on None call again with exponential backoff.
+
+    `future` resolves with the collector's metrics, or with None metrics once
+    `timeout` seconds have passed without a result.
+    """
+
+    def __init__(self, collector, ctx, pool, submitter, timeout, stats=None):
+        self.collector = collector
+        self.ctx = ctx
+        self.stats = stats or SectionStats(collector.name, ctx.repo_name)
+        self.pool = pool
+        self.submitter = submitter
+        self.future = Future()
+        self._start = time.monotonic()
+        self._deadline = self._start + timeout
+        self._delay = stats_poll_initial_delay
+        self._attempts = 0
+
+    def start(self):
+        self.pool.submit(self._attempt)
+
+    def _finish(self, result):
+        elapsed = time.monotonic() - self._start
+        self.stats.wall_seconds = elapsed
+        print(
+            f"Collector '{self.collector.name}' for {self.ctx.repo_name} finished in {elapsed:.1f}s ({self._attempts} attempt(s))"
+        )
+        self.future.set_result({key: result.get(key) for key in self.collector.keys})
+
+    def _attempt(self):
+        self._attempts += 1
+        self.stats.polls += 1
+        try:
+            with measure_section(self.stats):
+                result = self.collector.func(self.ctx)
+        except Exception as e:
+            print(f"Warning: Collector '{self.collector.name}' failed unexpectedly for {self.ctx.repo_name}: {e}")
+            return self._finish({})
+        if result is not None:
+            return self._finish(result)
+
+        remaining = self._deadline - time.monotonic()
+        if remaining <= 0:
+            print(f"Warning: Collector '{self.collector.name}' for {self.ctx.repo_name} timed out waiting for GitHub.")
+            return self._finish({})
+        delay = min(self._delay, remaining)
+        print(f"Polling '{self.collector.name}' for {self.ctx.repo_name} again in {delay:.0f}s...")
+        self._delay = min(self._delay * 2, stats_poll_max_delay)
+        self.submitter.submit_later(delay, self._attempt)
+
+
+def run_collectors(contexts, collectors, max_workers):
+    """Runs every collector for every repository on one shared thread pool.
+
+    Collectors spend nearly all their time waiting on the network, so running
+    them concurrently makes the total wall time roughly that of the slowest one.
+    Polled collectors are started first so GitHub computes their data while the
+    rest runs, and their results are merged in at the end.
+    Returns one merged metrics dict per context, in the order of `contexts`, and
+    the SectionStats of every collector run.
+    """
+    section_stats = []
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="collector") as pool:
+        submitter = DelayedSubmitter(pool)
+        futures = []
+        for ctx in contexts:
+            repo_futures = []
+            for collector in collectors:
+                stats = SectionStats(collector.name, ctx.repo_name)
+                section_stats.append(stats)
+                if collector.polled:
+                    run = PolledRun(collector, ctx, pool, submitter, stats_timeout, stats)
+                    run.start()
+                    repo_futures.append(run.future)
+                else:
+                    repo_futures.append(stats)  # Submitted below, after every polled collector has started
+            futures.append(repo_futures)
+        for ctx, repo_futures in zip(contexts, futures):
+            for i, collector in enumerate(collectors):
+                if isinstance(repo_futures[i], SectionStats):
+                    repo_futures[i] = pool.submit(_run_collector, collector, ctx, repo_futures[i])
+
+        results = []
+        for repo_futures in futures:
+            # Merge in registry order (not completion order) so the columns are stable
+            metrics = {}
+            for future in repo_futures:
+                metrics.update(future.result())
+            results.append(metrics)
+        submitter.close()
+    return results, section_stats
+
+
+def resolve_repositories(token):
+    """Returns the repositories (REST JSON) to collect, from METRICS_ORG, METRICS_REPOSITORIES or GITHUB_REPOSITORY."""
+    if org_name:
+        try:
+            return list(rest_paginate(token, f"/orgs/{org_name}/repos"))
+        except GitHubError as e:
+            if e.status != 404:
+                raise
+            # Not an organization, try a user account
+            return list(rest_paginate(token, f"/users/{org_name}/repos"))
+
+    names = repositories or [repo_name]
+    repos = []
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="get-repo") as pool:
+        futures = [pool.submit(rest_get, token, f"/repos/{name}") for name in names]
+        for name, future in zip(names, futures):
+            try:
+                repos.append(future.result().json())
+            except GitHubError as e:
+                print(f"Warning: Could not get repository {name}: {e}")
+    return repos
+
+
+# --- Output ---
+def arrow_schema(column_types=COLUMN_TYPES):
+    """Arrow schema of the output rows, built from COLUMN_TYPES (imports pyarrow)."""
+    import pyarrow as pa
+
+    scalar_types = {
+        "timestamp": pa.timestamp("us", tz="UTC"),  # Naive datetimes are taken as UTC
+        "string": pa.string(),
+        "bool": pa.bool_(),
+        "int64": pa.int64(),
+        "float64": pa.float64(),
+    }
+
+    def arrow_type(kind):
+        if kind in ENTRY_FIELDS:
+            return pa.list_(pa.struct([(name, scalar_types[k]) for name, k in ENTRY_FIELDS[kind]]))
+        return scalar_types[kind]
+
+    return pa.schema([(name, arrow_type(kind)) for name, kind in column_types.items()])
+
+
+def print_metrics(rows):
+    print("\n--- Collected Metrics ---")
+    try:
+        import pandas as pd
+    except ImportError:
+        # pandas is optional and only used for the table layout
+        for metrics in rows:
+            print(f"\n{metrics['repository_name']}:")
+            for key, value in metrics.items():
+                print(f"  {key}: {value}")
+        return
+
+    df = pd.DataFrame(rows)
+    # Nullable integers, so a failed collector gives <NA> instead of turning the column into floats
+    dtype_mapping = {k: pd.Int64Dtype() for k, t in COLUMN_TYPES.items() if t == "int64"}
+    df = df.astype({k: v for k, v in dtype_mapping.items() if k in df.columns})
+    # Print columns horizontally for better readability if many columns
+    pd.set_option("display.max_columns", None)  # Show all columns
+    pd.set_option("display.width", 1000)  # Adjust width as needed
+    print(df)
+
+
+def write_rows(rows, output_filename, column_types=COLUMN_TYPES):
+    """Writes rows as Parquet or NDJSON (METRICS_OUTPUT_FORMAT), exiting on failure."""
+    try:
+        print(f"\nWriting {len(rows)} row(s) to {output_filename}...")
+        if output_format == "ndjson":
+            with open(output_filename, "w") as f:
+                for row in rows:
+                    # Datetimes become ISO 8601 strings (with their UTC offset when known)
+                    f.write(json.dumps(row, default=lambda value: value.isoformat()) + "\n")
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            # Cast to the fixed schema (all-None columns keep their type)
+            pq.write_table(pa.Table.from_pylist(rows, schema=arrow_schema(column_types)), output_filename)
+        print(f"Successfully wrote {output_format} file.")
+
+    except Exception as e:
+        print(f"Error writing {output_format} file: {e}")
+        import traceback
+
+        traceback.print_exc()  # Print full traceback for debugging
+        sys.exit(1)
+
+
+def write_metrics(rows, output_filename):
+    print_metrics(rows)
+    write_rows(rows, output_filename)
+
+
+def write_section_stats(section_stats, timestamp_utc, output_filename):
+    """Prints the API cost of the run and writes the per-section stats next to the metrics."""
+    print("\n--- Collection Stats ---")
+    slowest = max(section_stats, key=lambda stats: stats.wall_seconds)
+    print(f"Slowest section: '{slowest.section}' for {slowest.repo_name} ({slowest.wall_seconds:.1f}s)")
+    print(
+        f"Requests: {sum(stats.requests for stats in section_stats)} "
+        f"({sum(stats.retries for stats in section_stats)} retries, "
+        f"{sum(stats.not_modified for stats in section_stats)} not modified)"
+    )
+    for resource in ("core", "search", "graphql"):
+        points = sum(stats.points[resource] for stats in section_stats)
+        remaining = [stats.lowest_remaining[resource] for stats in section_stats if resource in stats.lowest_remaining]
+        if points or remaining:
+            print(
+                f"Rate-limit points '{resource}': {points} used, "
+                f"{min(remaining) if remaining else 'unknown'} left at the lowest"
+            )
+    write_rows([stats.as_row(timestamp_utc) for stats in section_stats], output_filename, SECTION_STATS_TYPES)
+
+
+def collection_time():
+    """The timezone-aware 'now' of this run (METRICS_NOW if set)."""
+    if not fixed_now:
+        return datetime.now(timezone.utc)
+    now = datetime.fromisoformat(fixed_now)
+    return now.replace(tzinfo=timezone.utc) if now.tzinfo is None else now.astimezone(timezone.utc)
+
+
+def build_contexts(repos, now, state=None):
+    """One CollectionContext per repository, all with the same period ending at `now`."""
+    # Use timezone-aware datetime object for 'since' parameter
+    cutoff_datetime_aware = now - timedelta(days=lookback_days)
+    # Use naive datetime for simple comparisons if needed (e.g., fork creation)
+    cutoff_datetime_naive = cutoff_datetime_aware.replace(tzinfo=None)
+    # Traffic is reported per day, target yesterday (UTC)
+    target_traffic_date = (now - timedelta(days=1)).date()
+    return [
+        CollectionContext(
+            token=token,
+            repo_name=repo["full_name"],
+            repo=repo,
+            lookback_days=lookback_days,
+            cutoff_datetime_aware=cutoff_datetime_aware,
+            cutoff_datetime_naive=cutoff_datetime_naive,
+            target_traffic_date=target_traffic_date,
+            state=state,
+        )
+        for repo in repos
+    ]
+
+
+def main():
+    run_stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_filename = f"github_metrics_{run_stamp}.{output_format}"
+    stats_filename = f"github_collection_stats_{run_stamp}.{output_format}"
+
+    # --- Input Validation ---
+    if not token:
+        print("Error: GITHUB_TOKEN environment variable not set.")
+        sys.exit(1)
+    if not (repo_name or repositories or org_name):
+        print("Error: GITHUB_REPOSITORY environment variable not set (or METRICS_REPOSITORIES / METRICS_ORG).")
+        sys.exit(1)
+    if output_format not in ("parquet", "ndjson"):
+        print(f"Error: Unknown METRICS_OUTPUT_FORMAT {output_format!r} (expected 'parquet' or 'ndjson').")
+        sys.exit(1)
+    # Checked up front, so a missing pyarrow does not throw away a whole collection run
+    if (output_format == "parquet" or dataset_dir) and importlib.util.find_spec("pyarrow") is None:
+        print("Error: pyarrow is required for Parquet output (or set METRICS_OUTPUT_FORMAT=ndjson).")
+        sys.exit(1)
+
+    if org_name:
+        print(f"Starting metrics collection for all repositories of: {org_name}")
+    else:
+        print(f"Starting metrics collection for repositories: {', '.join(repositories or [repo_name])}")
+    print(f"Lookback period for 'new' items: {lookback_days} day(s)")
+    print(f"Running up to {max_workers} collectors concurrently")
+    print(f"Count mode: {count_mode}")
+
+    # --- Incremental State ---
+    state = None
+    if state_file:
+        state = StateStore(state_file, state_retention_days, state_max_etags)
+        api_session.state = state
+        print(f"Incremental mode: using state file {state_file}")
+
+    try:
+        collectors = get_collectors(count_mode)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    # --- GitHub API Connection ---
+    try:
+        repos = resolve_repositories(token)
+    except GitHubError as e:
+        print(f"Error connecting to GitHub API or getting repository: {e}")
+        sys.exit(1)
+    if not repos:
+        print("Error: No repositories to collect.")
+        sys.exit(1)
+    print(f"Successfully connected to GitHub API. Collecting {len(repos)} repository(ies).")
+
+    # --- Define Cutoff Time (UTC) ---
+    now = collection_time()
+    contexts = build_contexts(repos, now, state)
+    print(f"Calculating 'new' items since: {contexts[0].cutoff_datetime_aware}")
+
+    # --- Data Collection ---
+    timestamp_utc = now  # Store timezone-aware timestamp
+    rows = []
+    collected_metrics, section_stats = run_collectors(contexts, collectors, max_workers)
+    for ctx, collected in zip(contexts, collected_metrics):
+        metrics = {}
+        metrics["timestamp_utc"] = timestamp_utc
+        metrics["repository_name"] = ctx.repo_name
+        metrics.update((key, collected[key]) for key in METRIC_KEYS)
+        rows.append(metrics)
+
+    if state:
+        state.save()
+        print(f"Saved incremental state to {state_file}")
+
+    # --- Final Data Preparation ---
+    write_metrics(rows, output_filename)
+    write_section_stats(section_stats, timestamp_utc, stats_filename)
+
+    if dataset_dir:
+        import metrics_dataset  # Only needed in this mode, lives next to this script
+
+        print(f"\nAppending metrics to history dataset {dataset_dir}...")
+        metrics_dataset.append_rows(dataset_dir, rows)
+
+    print("\nScript finished successfully.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""Record and replay the GitHub API traffic of collect_metrics.py, to run it without a token or network.
+
+    python github_replay.py record FIXTURES   # live run (needs GITHUB_TOKEN), saves every API response
+    python github_replay.py replay FIXTURES   # offline run, every request is answered from FIXTURES
+    python github_replay.py serve FIXTURES [PORT]
+        # stand-in HTTP server for the fixtures; run collect_metrics.py against it
+        # with the environment it prints (GITHUB_API_URL, METRICS_NOW, ...)
+
+A record run pins the collection time (METRICS_NOW) and stores it with the collection
+settings in FIXTURES/meta.json, so a replay sends exactly the same requests: the 'since'
+parameters and search qualifiers depend on the time. Responses are appended to
+FIXTURES/responses.ndjson, keyed by method, URL (relative to the API root) and request
+body. A request made several times (contributor stats answer 202 until they are ready)
+replays its responses in order. Request headers, and so the token, are never stored.
+"""
+
+import json
+import os
+import sys
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+API_URL_PLACEHOLDER = "@@API_URL@@"  # Stands for the API root in stored bodies and headers
+# Collection settings that change which requests are made, restored on replay
+REPLAYED_SETTINGS = ("GITHUB_REPOSITORY", "METRICS_REPOSITORIES", "METRICS_ORG", "METRICS_COUNT_MODE", "METRICS_NOW")
+# Incremental state changes the requests as well, so record and replay always run without it
+IGNORED_SETTINGS = ("METRICS_STATE_FILE",)
+KEPT_HEADERS = ("content-type", "etag", "link", "location", "retry-after")
+
+
+def fixture_key(method, path, body):
+    """Identifies a request: method, URL relative to the API root and the JSON body (if any)."""
+    if isinstance(body, (bytes, str)):
+        body = json.loads(body) if body else None
+    return f"{method} {path} {json.dumps(body, sort_keys=True) if body is not None else ''}"
+
+
+class FixtureStore:
+    """The recorded responses of one run, in FIXTURES/responses.ndjson."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._responses = defaultdict(list)  # key -> [entry, ...] in the order they were recorded
+        self._replayed = defaultdict(int)  # key -> number of responses already handed out
+        responses_file = os.path.join(path, "responses.ndjson")
+        if os.path.exists(responses_file):
+            with open(responses_file) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._responses[entry["key"]].append(entry)
+
+    def add(self, key, status, headers, body, api_url):
+        entry = {
+            "key": key,
+            "status": status,
+            "headers": {
+                name: value.replace(api_url, API_URL_PLACEHOLDER)
+                for name, value in headers.items()
+                if name.lower() in KEPT_HEADERS or name.lower().startswith("x-ratelimit-")
+            },
+            "body": body.replace(api_url, API_URL_PLACEHOLDER),
+        }
+        with self._lock:
+            self._responses[key].append(entry)
+            with open(os.path.join(self.path, "responses.ndjson"), "a") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def next(self, key, api_url):
+        """Returns (status, headers, body) of the next recorded response for `key`, or None."""
+        with self._lock:
+            entries = self._responses.get(key)
+            if not entries:
+                return None
+            index = min(self._replayed[key], len(entries) - 1)  # The last response repeats
+            self._replayed[key] += 1
+        entry = entries[index]
+        headers = {name: value.replace(API_URL_PLACEHOLDER, api_url) for name, value in entry["headers"].items()}
+        return entry["status"], headers, entry["body"].replace(API_URL_PLACEHOLDER, api_url)
+
+
+def _relative_path(cm, url):
+    if url == cm.graphql_url:
+        return "/graphql"  # The stand-in server answers GraphQL at the default location
+    return url.removeprefix(cm.api_url)
+
+
+def record(cm, store):
+    """Wraps api_session.request so every response the collectors see is also stored."""
+    send = cm.api_session.request
+
+    def request(method, url, headers=None, json_body=None, timeout=30):
+        response = send(method, url, headers=headers, json_body=json_body, timeout=timeout)
+        key = fixture_key(method, _relative_path(cm, url), json_body)
+        store.add(key, response.status_code, dict(response.headers.items()), response.text, cm.api_url)
+        return response
+
+    cm.api_session.request = request
+
+
+def replay(cm, store):
+    """Replaces api_session.request with a fake transport that answers from the store."""
+
+    def request(method, url, headers=None, json_body=None, timeout=30):
+        key = fixture_key(method, _relative_path(cm, url), json_body)
+        recorded = store.next(key, cm.api_url)
+        if recorded is None:
+            print(f"Warning: No recorded response for {key}")
+            recorded = (404, {"Content-Type": "application/json"}, json.dumps({"message": "Not recorded"}))
+        status, response_headers, body = recorded
+        return cm.ApiResponse(status, cm.ResponseHeaders(response_headers.items()), body.encode("utf-8"), url)
+
+    cm.api_session.request = request
+
+
+def serve(store, port):
+    """Answers HTTP requests from the store until interrupted."""
+    api_url = f"http://127.0.0.1:{port}"
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+
+        def log_message(self, format, *args):
+            pass
+
+        def _answer(self, body):
+            key = fixture_key(self.command, self.path, body)
+            recorded = store.next(key, api_url)
+            if recorded is None:
+                print(f"Warning: No recorded response for {key}")
+                recorded = (404, {"Content-Type": "application/json"}, json.dumps({"message": "Not recorded"}))
+            status, headers, text = recorded
+            content = text.encode("utf-8")
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def do_GET(self):
+            self._answer(None)
+
+        def do_POST(self):
+            self._answer(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(f"Serving fixtures from {store.path} at {api_url} (Ctrl+C to stop)")
+    print("Run collect_metrics.py with:")
+    print(f"  GITHUB_API_URL={api_url} GITHUB_TOKEN=replay METRICS_STATE_FILE=")
+    for name, value in load_meta(store.path)["settings"].items():
+        print(f"  {name}={value!r}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def load_meta(path):
+    with open(os.path.join(path, "meta.json")) as f:
+        return json.load(f)
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] not in ("record", "replay", "serve"):
+        print(__doc__)
+        sys.exit(1)
+    command, path = sys.argv[1], sys.argv[2]
+    for name in IGNORED_SETTINGS:
+        os.environ.pop(name, None)
+
+    if command == "record":
+        if os.path.exists(os.path.join(path, "responses.ndjson")):
+            print(f"Error: {path} already holds a recording.")
+            sys.exit(1)
+        os.makedirs(path, exist_ok=True)
+        os.environ.setdefault("METRICS_NOW", datetime.now(timezone.utc).isoformat())
+        settings = {name: os.environ[name] for name in REPLAYED_SETTINGS if os.environ.get(name)}
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"settings": settings}, f, indent=2)
+    else:
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            print(f"Error: {path} holds no recording.")
+            sys.exit(1)
+        if command == "serve":
+            serve(FixtureStore(path), int(sys.argv[3]) if len(sys.argv) > 3 else 8765)
+            return
+        # Replay exactly the recorded settings
+        for name in REPLAYED_SETTINGS:
+            os.environ.pop(name, None)
+        os.environ.update(load_meta(path)["settings"])
+        os.environ.setdefault("GITHUB_TOKEN", "replay")
+
+    import collect_metrics as cm  # Reads its settings from the environment prepared above
+
+    store = FixtureStore(path)
+    if command == "record":
+        record(cm, store)
+    else:
+        replay(cm, store)
+    cm.main()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Partitioned Parquet history dataset for the metrics written by collect_metrics.py.
+
+collect_metrics.py writes one small file per run. This module appends those rows to
+a Hive-partitioned dataset, one file per repository and month, so readers (pyarrow.dataset,
+DuckDB, Athena, ...) prune by partition and row-group statistics instead of opening
+thousands of one-row files:
+
+    <root>/metrics/repository=<owner-repo>/month=<YYYY-MM>/part-0.parquet
+    <root>/traffic_top_referrers/repository=<owner-repo>/month=<YYYY-MM>/part-0.parquet
+    <root>/traffic_top_paths/repository=<owner-repo>/month=<YYYY-MM>/part-0.parquet
+
+The nested referrer/path lists are unpacked into the two child tables, one typed row per
+entry, joined to `metrics` on (repository_name, timestamp_utc).
+
+Appending is idempotent: a snapshot (repository_name, timestamp_utc) that is already in a
+partition replaces the old one, so re-running over the same daily files is safe.
+
+Usage (compaction / backfill of existing daily files):
+    python metrics_dataset.py <dataset_root> <daily_file_or_dir> [...]
+"""
+
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from collect_metrics import arrow_schema
+
+ROW_GROUP_SIZE = 10_000  # Rows per row group; a repository-month holds far fewer, keeps one group per file
+PART_FILENAME = "part-0.parquet"
+
+# --- Schemas ---
+# Derived from the daily file schema: the scalar columns make up `metrics`,
+# each list-of-struct column becomes a child table with one row per entry.
+DAILY_SCHEMA = arrow_schema()
+SNAPSHOT_FIELDS = [DAILY_SCHEMA.field("repository_name"), DAILY_SCHEMA.field("timestamp_utc")]
+METRICS_SCHEMA = pa.schema([field for field in DAILY_SCHEMA if not pa.types.is_list(field.type)])
+CHILD_TABLES = {
+    # column in the daily rows -> (table name, schema)
+    field.name: (field.name.removesuffix("_data"), pa.schema(SNAPSHOT_FIELDS + list(field.type.value_type)))
+    for field in DAILY_SCHEMA
+    if pa.types.is_list(field.type)
+}
+
+
+def _as_utc(value):
+    """Returns a timezone-aware UTC datetime; naive values are UTC already (see collect_metrics.py)."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def split_rows(rows):
+    """Splits collector rows into {table name: [row dicts]}, unpacking the nested columns."""
+    tables = defaultdict(list)
+    for row in rows:
+        snapshot = {"repository_name": row["repository_name"], "timestamp_utc": _as_utc(row["timestamp_utc"])}
+        tables["metrics"].append({**row, **snapshot})
+        for column, (table_name, _) in CHILD_TABLES.items():
+            for entry in row.get(column) or []:  # None (API error) and [] both give no child rows
+                tables[table_name].append({**entry, **snapshot})
+    return tables
+
+
+def partition_dir(root, table_name, repository_name, timestamp):
+    repository = repository_name.replace("/", "-")  # Same formatting as the daily S3 layout
+    return os.path.join(root, table_name, f"repository={repository}", f"month={timestamp:%Y-%m}")
+
+
+def _snapshot_key(row):
+    return row["repository_name"], _as_utc(row["timestamp_utc"])
+
+
+def write_partition(path, schema, new_rows):
+    """Merges `new_rows` into the partition file at `path`, replacing snapshots that are already there."""
+    file_path = os.path.join(path, PART_FILENAME)
+    new_keys = {_snapshot_key(row) for row in new_rows}
+    rows = []
+    if os.path.exists(file_path):
+        existing = pq.read_table(file_path).to_pylist()
+        rows = [row for row in existing if _snapshot_key(row) not in new_keys]
+    rows.extend(new_rows)
+    # Sorted by time, so the row-group min/max statistics on timestamp_utc are tight
+    rows.sort(key=lambda row: _as_utc(row["timestamp_utc"]))
+
+    table = pa.Table.from_pylist(rows, schema=schema)  # Casts to the stable schema, missing keys become null
+    os.makedirs(path, exist_ok=True)
+    tmp_path = file_path + ".tmp"
+    pq.write_table(table, tmp_path, row_group_size=ROW_GROUP_SIZE, compression="zstd", write_statistics=True)
+    os.replace(tmp_path, file_path)  # Readers never see a half written partition
+    return len(rows)
+
+
+def append_rows(root, rows):
+    """Appends collector rows (as built by collect_metrics.main) to the dataset at `root`."""
+    partitions = defaultdict(list)
+    for table_name, table_rows in split_rows(rows).items():
+        for row in table_rows:
+            key = (table_name, row["repository_name"], row["timestamp_utc"].strftime("%Y-%m"))
+            partitions[key].append(row)
+
+    schemas = {"metrics": METRICS_SCHEMA, **dict(CHILD_TABLES.values())}
+    for (table_name, repository_name, _), partition_rows in sorted(partitions.items()):
+        path = partition_dir(root, table_name, repository_name, partition_rows[0]["timestamp_utc"])
+        total = write_partition(path, schemas[table_name], partition_rows)
+        print(f"Wrote {len(partition_rows)} new row(s) to {path} ({total} total)")
+
+
+def read_daily_files(paths):
+    """Reads daily collect_metrics.py Parquet files (or directories of them) back into row dicts."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, _, filenames in os.walk(path):
+                files.extend(os.path.join(dirpath, f) for f in sorted(filenames) if f.endswith(".parquet"))
+        else:
+            files.append(path)
+
+    read_files, rows = [], []
+    for file_path in files:
+        try:
+            table = pq.read_table(file_path)
+        except (OSError, pa.ArrowInvalid) as e:
+            print(f"Warning: Could not read {file_path}: {e}")
+            continue
+        # Daily files always carry the nested columns, dataset partitions never do
+        if not set(CHILD_TABLES) <= set(table.column_names):
+            print(f"Skipping {file_path}: not a daily metrics file")
+            continue
+        read_files.append(file_path)
+        rows.extend(table.to_pylist())
+    return read_files, rows
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    root, paths = sys.argv[1], sys.argv[2:]
+
+    files, rows = read_daily_files(paths)
+    rows = [row for row in rows if row.get("repository_name") and isinstance(row.get("timestamp_utc"), datetime)]
+    if not rows:
+        print("Error: No metrics rows found.")
+        sys.exit(1)
+    print(f"Appending {len(rows)} row(s) from {len(files)} file(s) to {root}")
+    append_rows(root, rows)
+
+
+if __name__ == "__main__":
+    main()
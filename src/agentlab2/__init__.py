@@ -1,2 +1,40 @@
+from typing import TYPE_CHECKING
+
+from agentlab2._lazy import lazy_exports
+
+if TYPE_CHECKING:
+    from agentlab2.core import Agent, AgentArgs, AsyncAgent, AsyncEnv, Env, TaskArgs
+    from agentlab2.experiment import EpisodeResult, Experiment
+    from agentlab2.study import Study
+
+__all__ = [
+    "Agent",
+    "AgentArgs",
+    "AsyncAgent",
+    "AsyncEnv",
+    "Env",
+    "EpisodeResult",
+    "Experiment",
+    "Study",
+    "TaskArgs",
+    "hello",
+]
+
+__getattr__, __dir__ = lazy_exports(
+    __name__,
+    {
+        "Agent": "agentlab2.core",
+        "AgentArgs": "agentlab2.core",
+        "AsyncAgent": "agentlab2.core",
+        "AsyncEnv": "agentlab2.core",
+        "Env": "agentlab2.core",
+        "TaskArgs": "agentlab2.core",
+        "EpisodeResult": "agentlab2.experiment",
+        "Experiment": "agentlab2.experiment",
+        "Study": "agentlab2.study",
+    },
+)
+
+
 def hello() -> str:
     return "Hello from agentlab2!"
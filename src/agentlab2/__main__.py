@@ -0,0 +1,5 @@
+import sys
+
+from agentlab2.cli import main
+
+sys.exit(main())
@@ -0,0 +1,28 @@
+"""Lazy exports for the package __init__ modules.
+
+`import agentlab2` (or agentlab2.llm, ...) imports none of the submodules: each is imported the
+first time one of its names is looked up, so a process only pays for what it uses. Worker
+processes, the CLI and short scripts start in milliseconds instead of loading asyncio, sqlite3
+and multiprocessing up front (see .github/scripts/bench_import_time.py for the budgets).
+"""
+
+import importlib
+import sys
+from collections.abc import Callable
+from typing import Any
+
+
+def lazy_exports(package: str, exports: dict[str, str]) -> tuple[Callable[[str], Any], Callable[[], list[str]]]:
+    """Module-level __getattr__ and __dir__ for `package`; `exports` maps each name to its submodule."""
+
+    def __getattr__(name: str) -> Any:
+        if name not in exports:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(exports[name]), name)
+        setattr(sys.modules[package], name, value)  # Found without __getattr__ from now on
+        return value
+
+    def __dir__() -> list[str]:
+        return sorted(set(vars(sys.modules[package])) | set(exports))
+
+    return __getattr__, __dir__
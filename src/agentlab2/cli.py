@@ -0,0 +1,237 @@
+"""The `agentlab2` command.
+
+    agentlab2 run my_studies.py:study --study-dir studies/s1 --n-workers 8
+    agentlab2 status studies/s1
+    agentlab2 results studies/s1 --by agent_name
+    agentlab2 worker studies/s1/broker.sqlite --import my_studies.py
+    agentlab2 run recipes/stub_sweep.toml --shard 0/4
+
+`run` takes a Study, or a function returning one, from a Python file or module ("path.py:name"
+or "package.module:name", name defaults to "study"), or a recipe (a .toml file, compiled once
+and cached, or its compiled .manifest, see agentlab2.recipe); the options override its
+settings. Running it again with the same study directory resumes it. With --broker, its episodes run
+on the `worker` nodes serving that broker (see agentlab2.distributed).
+
+Only argparse is imported up front, each command imports what it needs: `agentlab2 --help`
+and `status` start as fast as Python does (see .github/scripts/bench_import_time.py).
+"""
+
+import argparse
+import logging
+import os
+import sys
+from typing import Any
+
+
+def load_module(target: str) -> Any:
+    """The module at "path/to/file.py", or named "package.module"."""
+    from agentlab2.recipe import load_module
+
+    try:
+        return load_module(target)
+    except ImportError as e:
+        raise SystemExit(str(e)) from None
+
+
+def load_object(spec: str, default_name: str = "study") -> Any:
+    """The object named by "path/to/file.py:name" or "package.module:name"."""
+    target, _, name = spec.partition(":")
+    name = name or default_name
+    module = load_module(target)
+    try:
+        return getattr(module, name)
+    except AttributeError:
+        raise SystemExit(f"{target} has no {name!r}") from None
+
+
+def _run(args: argparse.Namespace) -> int:
+    import dataclasses
+
+    from agentlab2.study import Study
+
+    if args.study.endswith((".toml", ".manifest")):
+        study = _recipe_study(args)
+    else:
+        if args.shard:
+            raise SystemExit("--shard only applies to recipes")
+        study = load_object(args.study)
+        if callable(study) and not isinstance(study, Study):
+            study = study()
+        if not isinstance(study, Study):
+            raise SystemExit(f"{args.study} is a {type(study).__name__}, not a Study")
+    overrides = {
+        "study_dir": args.study_dir,
+        "n_workers": args.n_workers,
+        "episodes_per_worker": args.episodes_per_worker,
+        "episode_timeout": args.episode_timeout,
+        "max_steps": args.max_steps,
+    }
+    if args.profile or args.sample is not None:
+        from agentlab2.profiling import ProfileOptions
+
+        overrides["profile"] = ProfileOptions(sample=args.sample or 0.0)
+    if args.broker:
+        from agentlab2.distributed.executor import BrokerExecutor
+
+        overrides["executor"] = BrokerExecutor(args.broker, local_workers=args.local_workers)
+    if args.shard and (args.study_dir or study.study_dir):
+        # Shards may run at the same time: each keeps its own journal
+        shard_dir = "shard-" + args.shard.replace("/", "-of-")
+        overrides["study_dir"] = os.path.join(args.study_dir or study.study_dir, shard_dir)
+    study = dataclasses.replace(study, **{key: value for key, value in overrides.items() if value is not None})
+    results = study.run()
+    counts: dict[str, int] = {}
+    for result in results:
+        counts[result.status] = counts.get(result.status, 0) + 1
+    n_success = sum(result.success for result in results)
+    print(f"{len(results)} episode(s): {n_success} successful; " + ", ".join(f"{n} {s}" for s, n in counts.items()))
+    return 0
+
+
+def _recipe_study(args: argparse.Namespace) -> Any:
+    from agentlab2.recipe import Manifest, RecipeError, compile_recipe
+
+    try:
+        manifest = compile_recipe(args.study) if args.study.endswith(".toml") else Manifest(args.study)
+    except (RecipeError, OSError, ValueError) as e:
+        raise SystemExit(str(e)) from None
+    with manifest:
+        start, stop = 0, None
+        if args.shard:
+            index, _, count = args.shard.partition("/")
+            try:
+                start, stop = manifest.shard(int(index), int(count))
+            except ValueError:
+                raise SystemExit(f"--shard {args.shard}: expected INDEX/COUNT, 0 <= INDEX < COUNT") from None
+        return manifest.study(start, stop)
+
+
+def _compile(args: argparse.Namespace) -> int:
+    from agentlab2.recipe import RecipeError, compile_recipe
+
+    try:
+        manifest = compile_recipe(args.recipe, cache_dir=args.cache_dir, force=args.force)
+    except RecipeError as e:
+        raise SystemExit(str(e)) from None
+    with manifest:
+        print(
+            f"{manifest.path}: {len(manifest)} episode(s), "
+            f"{manifest.n_agents} agent(s) x {manifest.n_tasks} task(s) x {len(manifest.seeds)} seed(s)"
+        )
+    return 0
+
+
+def _worker(args: argparse.Namespace) -> int:
+    from agentlab2.distributed.worker import serve
+
+    for target in args.imports:
+        load_module(target)
+    serve(args.broker, n_workers=args.n_workers, worker_id=args.worker_id)
+    return 0
+
+
+def _status(args: argparse.Namespace) -> int:
+    import sqlite3
+
+    from agentlab2.journal import JOURNAL_FILENAME
+
+    path = os.path.join(args.study_dir, JOURNAL_FILENAME)
+    if not os.path.exists(path):
+        raise SystemExit(f"No study in {args.study_dir} (no {JOURNAL_FILENAME})")
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = db.execute(
+            "SELECT state, COALESCE(status, '-'), COUNT(*), SUM(attempts) FROM episodes GROUP BY 1, 2 ORDER BY 1, 2"
+        ).fetchall()
+    finally:
+        db.close()
+    total = sum(row[2] for row in rows)
+    print(f"{args.study_dir}: {total} episode(s)")
+    for state, status, count, attempts in rows:
+        print(f"  {state:<8} {status:<8} {count:>7}  ({attempts or 0} attempt(s))")
+    return 0
+
+
+def _results(args: argparse.Namespace) -> int:
+    from agentlab2.results import ResultsTable
+
+    table = ResultsTable.load(args.study_dir, use_cache=not args.no_cache)
+    if args.episodes:
+        print(table.format(max_rows=args.max_rows))
+        return 0
+    by = tuple(name for name in args.by.split(",") if name)
+    aggregate = table.aggregate(by=by, n_boot=args.n_boot, confidence=args.confidence)
+    if args.csv:
+        import csv
+
+        writer = csv.writer(sys.stdout)
+        writer.writerow(aggregate.columns)
+        writer.writerows(zip(*(column.tolist() for column in aggregate.columns.values())))
+    else:
+        print(aggregate.format(max_rows=args.max_rows))
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="agentlab2", description="Run UI agent studies and look at their results.")
+    parser.add_argument("--log-level", default="INFO", help="Logging level (default: INFO)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Run or resume a study")
+    run.add_argument("study", help='Study to run: "file.py:name" or "package.module:name" (name defaults to study)')
+    run.add_argument("--study-dir", help="Where to save trajectories and progress")
+    run.add_argument("--n-workers", type=int, help="Worker processes (0 runs in this process)")
+    run.add_argument("--episodes-per-worker", type=int, help="Episodes each worker runs at once")
+    run.add_argument("--episode-timeout", type=float, help="Seconds after which an episode is killed")
+    run.add_argument("--max-steps", type=int, help="Steps per episode at most")
+    run.add_argument("--profile", action="store_true", help="Time every step and write <study-dir>/trace.json")
+    run.add_argument("--sample", type=float, help="Fraction of the episodes to run under the sampling profiler")
+    run.add_argument("--shard", help="With a recipe, run only shard INDEX/COUNT of its episodes (0-based)")
+    run.add_argument("--broker", help="Run the episodes on the workers serving this broker file (shared by all)")
+    run.add_argument("--local-workers", type=int, default=0, help="With --broker, also run workers on this machine")
+    run.set_defaults(handler=_run)
+
+    compile_ = commands.add_parser("compile", help="Validate a recipe and compile it to a manifest")
+    compile_.add_argument("recipe", help="Recipe file (.toml)")
+    compile_.add_argument("--cache-dir", help="Where to keep the manifest (default: .manifests next to the recipe)")
+    compile_.add_argument("--force", action="store_true", help="Compile again even if the manifest is cached")
+    compile_.set_defaults(handler=_compile)
+
+    worker = commands.add_parser("worker", help="Run episodes of the studies served on a broker")
+    worker.add_argument("broker", help="Broker file of the study, as given to run --broker")
+    worker.add_argument("--n-workers", type=int, help="Worker processes (default: one per CPU)")
+    worker.add_argument("--worker-id", help="Name of this node (default: host-pid)")
+    worker.add_argument(
+        "--import",
+        dest="imports",
+        action="append",
+        default=[],
+        help="File or module defining the study's agents and tasks (repeatable)",
+    )
+    worker.set_defaults(handler=_worker)
+
+    status = commands.add_parser("status", help="Show how far a study got")
+    status.add_argument("study_dir")
+    status.set_defaults(handler=_status)
+
+    results = commands.add_parser("results", help="Show the results of a study")
+    results.add_argument("study_dir")
+    results.add_argument("--by", default="agent_name,task_name", help="Columns to group by, comma separated")
+    results.add_argument("--n-boot", type=int, default=1000, help="Bootstrap resamples for the intervals")
+    results.add_argument("--confidence", type=float, default=0.95)
+    results.add_argument("--episodes", action="store_true", help="List the episodes instead of aggregating")
+    results.add_argument("--csv", action="store_true", help="Write CSV instead of a text table")
+    results.add_argument("--max-rows", type=int, default=100)
+    results.add_argument("--no-cache", action="store_true", help="Read every summary again")
+    results.set_defaults(handler=_results)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""Core interfaces: environments, agents, and the picklable arguments that build them.
+
+Live agents and environments hold browsers, sockets and model clients, so they never cross
+process boundaries. An experiment carries `AgentArgs` and `TaskArgs` instead; each worker
+builds its own agent and environment from them.
+
+`AsyncAgent` and `AsyncEnv` are the coroutine versions, for agents that mostly wait on model
+calls: a worker process can then drive many such episodes at once (see Study.episodes_per_worker).
+"""
+
+from abc import ABC, abstractmethod
+from collections.abc import Coroutine
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from agentlab2.profiling import EpisodeProfile
+
+Observation = dict[str, Any]
+Action = Any
+
+
+@dataclass
+class EpisodeContext:
+    """The episode the current code runs for, so shared services (LLM client, ...) can tell episodes apart."""
+
+    episode_id: str
+    counters: dict[str, int] = field(default_factory=dict)
+    usage: dict[str, float] = field(default_factory=dict)  # LLM calls, tokens, bytes, ..., reported in the result
+    profile: "EpisodeProfile | None" = None  # Spans of the episode, when profiled (see agentlab2.profiling)
+
+    def add_usage(self, **amounts: float) -> None:
+        for key, amount in amounts.items():
+            self.usage[key] = self.usage.get(key, 0) + amount
+
+
+# Set by Experiment.arun for everything the episode runs, its threads included
+current_episode: ContextVar[EpisodeContext | None] = ContextVar("agentlab2_current_episode", default=None)
+
+
+def _run(coroutine: Coroutine[Any, Any, Any]) -> Any:
+    """asyncio.run, with asyncio imported on first use: it would triple the import time of this module."""
+    import asyncio
+
+    return asyncio.run(coroutine)
+
+
+class Env(ABC):
+    """An environment running one task, with a gymnasium-style API."""
+
+    @abstractmethod
+    def reset(self, seed: int | None = None) -> tuple[Observation, dict[str, Any]]:
+        """Starts a new episode and returns (observation, info)."""
+
+    @abstractmethod
+    def step(self, action: Action) -> tuple[Observation, float, bool, bool, dict[str, Any]]:
+        """Applies `action` and returns (observation, reward, terminated, truncated, info)."""
+
+    def close(self) -> None:
+        """Releases the environment's resources (browser, app instance, ...)."""
+
+    def memory_bytes(self) -> int | None:
+        """Memory the environment holds, its processes included, None if unknown (see agentlab2.envpool)."""
+        return None
+
+
+class Agent(ABC):
+    """Chooses the next action from the current observation."""
+
+    @abstractmethod
+    def get_action(self, obs: Observation) -> tuple[Action, dict[str, Any]]:
+        """Returns (action, agent_info) for `obs`."""
+
+    def reset(self, seed: int | None = None) -> None:
+        """Called before each episode."""
+
+    def obs_preprocessor(self, obs: Observation) -> Observation:
+        """Turns the environment's observation into the one get_action receives and the trajectory records.
+
+        Runs on the episode's thread; see agentlab2.observation.ObservationPipeline.
+        """
+        return obs
+
+
+class AsyncEnv(Env):
+    """An environment whose reset and step are coroutines."""
+
+    @abstractmethod
+    async def areset(self, seed: int | None = None) -> tuple[Observation, dict[str, Any]]:
+        """Starts a new episode and returns (observation, info)."""
+
+    @abstractmethod
+    async def astep(self, action: Action) -> tuple[Observation, float, bool, bool, dict[str, Any]]:
+        """Applies `action` and returns (observation, reward, terminated, truncated, info)."""
+
+    def reset(self, seed: int | None = None) -> tuple[Observation, dict[str, Any]]:
+        return _run(self.areset(seed))
+
+    def step(self, action: Action) -> tuple[Observation, float, bool, bool, dict[str, Any]]:
+        return _run(self.astep(action))
+
+
+class AsyncAgent(Agent):
+    """An agent whose get_action is a coroutine, typically awaiting agentlab2.llm calls."""
+
+    @abstractmethod
+    async def aget_action(self, obs: Observation) -> tuple[Action, dict[str, Any]]:
+        """Returns (action, agent_info) for `obs`."""
+
+    def get_action(self, obs: Observation) -> tuple[Action, dict[str, Any]]:
+        return _run(self.aget_action(obs))
+
+
+@dataclass(frozen=True)
+class AgentArgs(ABC):
+    """Picklable configuration of an agent."""
+
+    agent_name: str
+
+    @abstractmethod
+    def make_agent(self) -> Agent:
+        """Builds the agent, in the process that runs the episode."""
+
+
+@dataclass(frozen=True)
+class TaskArgs(ABC):
+    """Picklable configuration of a task and the environment it runs in."""
+
+    task_name: str
+
+    @abstractmethod
+    def make_env(self) -> Env:
+        """Builds the environment, in the process that runs the episode."""
@@ -0,0 +1,20 @@
+from typing import TYPE_CHECKING
+
+from agentlab2._lazy import lazy_exports
+
+if TYPE_CHECKING:
+    from agentlab2.distributed.broker import SQLiteBroker
+    from agentlab2.distributed.executor import BrokerExecutor
+    from agentlab2.distributed.worker import BrokerQueue, serve
+
+__all__ = ["BrokerExecutor", "BrokerQueue", "SQLiteBroker", "serve"]
+
+__getattr__, __dir__ = lazy_exports(
+    __name__,
+    {
+        "SQLiteBroker": "agentlab2.distributed.broker",
+        "BrokerExecutor": "agentlab2.distributed.executor",
+        "BrokerQueue": "agentlab2.distributed.worker",
+        "serve": "agentlab2.distributed.worker",
+    },
+)
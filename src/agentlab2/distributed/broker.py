@@ -0,0 +1,216 @@
+"""A work queue in one SQLite file, shared by the study and the worker nodes.
+
+The study (BrokerExecutor) puts experiments in the `tasks` table; worker nodes lease them, run
+them, and put the results back, which the study collects and records in its journal.
+
+    queued -> leased (by a worker, until lease_until) -> done (result) -> collected (deleted)
+              \\-> queued again when the lease runs out
+
+A node renews the leases of everything it runs with a heartbeat every `lease_s / 3`: a lease
+only runs out when its node stopped (killed, crashed, cut off), and the study then puts the
+task back in the queue for another node. A task whose lease ran out `max_leases` times is
+given up on (it may be what kills the nodes) and reported as crashed. A result arriving for a
+task that was already finished elsewhere is dropped.
+
+The file uses SQLite's rollback journal, not WAL, so that it can live on a network file system
+shared by the machines (WAL needs shared memory between the processes). Payloads are pickles:
+only run workers on brokers you trust, with the code of the study importable.
+"""
+
+import contextlib
+import os
+import pickle
+import socket
+import sqlite3
+import time
+from collections.abc import Iterator
+from typing import Any
+
+from agentlab2.experiment import EpisodeResult, Experiment
+
+BROKER_FILENAME = "broker.sqlite"  # <study_dir>/broker.sqlite by default
+BUSY_TIMEOUT_S = 60.0  # Wait for another process's write to finish, up to this long
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value BLOB
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,  -- Leased in this order; never reused, even across studies
+    episode_id TEXT NOT NULL,
+    experiment BLOB NOT NULL,   -- Pickled Experiment
+    state TEXT NOT NULL,        -- queued, leased, done
+    worker_id TEXT,             -- Of the last lease
+    lease_until REAL,           -- Unix time
+    leases INTEGER NOT NULL DEFAULT 0,
+    result BLOB,                -- Pickled EpisodeResult, once done
+    queued_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, id);
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    capacity INTEGER NOT NULL,  -- Episodes it runs at once
+    started_at REAL NOT NULL,
+    heartbeat_at REAL NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class SQLiteBroker:
+    """One connection to the broker file; each thread and process opens its own."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=BUSY_TIMEOUT_S, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=DELETE")
+        self._db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self._db.close()
+
+    def _write(self, sql: str, params: tuple[Any, ...] = ()) -> sqlite3.Cursor:
+        with self._transaction():
+            return self._db.execute(sql, params)
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[None]:
+        """BEGIN IMMEDIATE takes the write lock before reading, so two workers never lease the same task."""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def open_study(self, options: dict[str, Any]) -> None:
+        """Starts serving a study: drops the tasks of any previous run and publishes the run options.
+
+        Refuses while a worker holds a lease that has not run out: another study is being served
+        from this file, and dropping its tasks would lose the work of its nodes.
+        """
+        with self._transaction():
+            (leased,) = self._db.execute(
+                "SELECT COUNT(*) FROM tasks WHERE state = 'leased' AND lease_until >= ?", (time.time(),)
+            ).fetchone()
+            if leased:
+                raise RuntimeError(
+                    f"{self.path} is serving another study ({leased} episode(s) running on its workers); "
+                    "use another broker file, or wait for that study to finish"
+                )
+            self._db.execute("DELETE FROM tasks")
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('options', ?)", (pickle.dumps(options),))
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('closed', 0)")
+
+    def close_study(self) -> None:
+        """No more tasks: the queued ones are dropped and the workers exit once idle."""
+        with self._transaction():
+            self._db.execute("DELETE FROM tasks WHERE state != 'done'")
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('closed', 1)")
+
+    def put(self, experiment: Experiment) -> int:
+        cursor = self._write(
+            "INSERT INTO tasks (episode_id, experiment, state, queued_at) VALUES (?, ?, 'queued', ?)",
+            (experiment.episode_id, pickle.dumps(experiment), time.time()),
+        )
+        return cursor.lastrowid
+
+    def collect(self) -> list[tuple[int, EpisodeResult]]:
+        """The results that came in since the last call, (task id, result)."""
+        with self._transaction():
+            rows = self._db.execute("SELECT id, result FROM tasks WHERE state = 'done'").fetchall()
+            self._db.execute("DELETE FROM tasks WHERE state = 'done'")
+        return [(task_id, pickle.loads(result)) for task_id, result in rows]
+
+    def requeue_expired(self, max_leases: int) -> tuple[int, list[int]]:
+        """Puts the tasks whose lease ran out back in the queue; returns how many, and the ones given up on (removed)."""
+        now = time.time()
+        with self._transaction():
+            given_up = [
+                task_id
+                for (task_id,) in self._db.execute(
+                    "SELECT id FROM tasks WHERE state = 'leased' AND lease_until < ? AND leases >= ?",
+                    (now, max_leases),
+                )
+            ]
+            self._db.execute(
+                "DELETE FROM tasks WHERE state = 'leased' AND lease_until < ? AND leases >= ?", (now, max_leases)
+            )
+            requeued = self._db.execute(
+                "UPDATE tasks SET state = 'queued', lease_until = NULL WHERE state = 'leased' AND lease_until < ?",
+                (now,),
+            ).rowcount
+        return requeued, given_up
+
+    def live_capacity(self, within_s: float) -> int:
+        """Episodes the workers that sent a heartbeat in the last `within_s` seconds can run at once."""
+        row = self._db.execute(
+            "SELECT COALESCE(SUM(capacity), 0) FROM workers WHERE heartbeat_at >= ?", (time.time() - within_s,)
+        ).fetchone()
+        return row[0]
+
+    def counts(self) -> dict[str, int]:
+        return dict(self._db.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall())
+
+    def options(self) -> dict[str, Any] | None:
+        """The options of the study being served, None before any study started."""
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'options'").fetchone()
+        return pickle.loads(row[0]) if row is not None else None
+
+    def closed(self) -> bool:
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'closed'").fetchone()
+        return row is not None and bool(row[0])
+
+    def register(self, worker_id: str, capacity: int) -> None:
+        now = time.time()
+        self._write(
+            "INSERT OR REPLACE INTO workers (worker_id, host, pid, capacity, started_at, heartbeat_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (worker_id, socket.gethostname(), os.getpid(), capacity, now, now),
+        )
+
+    def unregister(self, worker_id: str) -> None:
+        self._write("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+
+    def lease(self, worker_id: str, lease_s: float) -> tuple[int, Experiment] | None:
+        """The next queued task, leased to the worker for `lease_s` seconds."""
+        with self._transaction():
+            row = self._db.execute(
+                "SELECT id, experiment FROM tasks WHERE state = 'queued' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE tasks SET state = 'leased', worker_id = ?, lease_until = ?, leases = leases + 1 WHERE id = ?",
+                (worker_id, time.time() + lease_s, row[0]),
+            )
+        return row[0], pickle.loads(row[1])
+
+    def heartbeat(self, worker_id: str, lease_s: float) -> None:
+        """Renews the worker's leases and tells the study it is alive."""
+        now = time.time()
+        with self._transaction():
+            self._db.execute(
+                "UPDATE tasks SET lease_until = ? WHERE worker_id = ? AND state = 'leased'", (now + lease_s, worker_id)
+            )
+            self._db.execute("UPDATE workers SET heartbeat_at = ? WHERE worker_id = ?", (now, worker_id))
+
+    def complete(self, task_id: int, worker_id: str, result: EpisodeResult) -> bool:
+        """Stores the result of a task; False if it was already finished, or dropped, meanwhile."""
+        with self._transaction():
+            cursor = self._db.execute(
+                "UPDATE tasks SET state = 'done', result = ?, worker_id = ? "
+                "WHERE id = ? AND episode_id = ? AND state != 'done'",
+                (pickle.dumps(result), worker_id, task_id, result.episode_id),
+            )
+            self._db.execute("UPDATE workers SET completed = completed + 1 WHERE worker_id = ?", (worker_id,))
+        return cursor.rowcount == 1
@@ -0,0 +1,110 @@
+"""Runs a study on worker nodes, through a broker (see agentlab2.distributed.broker).
+
+    study = Study(agents, tasks, seeds=range(10), study_dir="/shared/studies/s1",
+                  executor=BrokerExecutor("/shared/studies/s1/broker.sqlite"))
+    study.run()
+
+and on each machine, as many as wanted, joining and leaving at any time:
+
+    agentlab2 worker /shared/studies/s1/broker.sqlite --n-workers 16 --import my_studies.py
+
+The study process hands the experiments of its queue to the broker as the nodes have room for
+them (`prefetch` times their capacity is kept queued; the rest waits in the journal's order,
+longest first), collects the results as they come in and records them in the study's
+journal, which decides on retries as for a local study (see agentlab2.journal). It also puts
+back in the queue the work of nodes that stopped sending heartbeats. Each node runs its
+episodes with run_parallel, with the study's timeout, episodes_per_worker and env_pool.
+"""
+
+import logging
+import math
+import multiprocessing
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+from agentlab2.distributed.broker import SQLiteBroker
+from agentlab2.distributed.worker import serve
+from agentlab2.envpool.pool import EnvPoolOptions
+from agentlab2.experiment import EpisodeResult, Experiment
+from agentlab2.runner import Executor, ExperimentQueue
+
+logger = logging.getLogger(__name__)
+
+NODE_EXIT_TIMEOUT_S = 30.0  # Time local nodes get to exit once the study is finished
+
+
+@dataclass(frozen=True)
+class BrokerExecutor(Executor):
+    """Runs the experiments on the worker nodes serving the broker at `path`.
+
+    lease_s: a node that sent no heartbeat for this long is taken for dead, and its experiments
+        go to other nodes.
+    max_leases: times an experiment may be lost with its node before it is reported as crashed.
+    prefetch: experiments kept queued on the broker, as a multiple of the live nodes' capacity.
+    local_workers: also run a node with that many worker processes on this machine.
+    """
+
+    path: str
+    lease_s: float = 60.0
+    max_leases: int = 3
+    prefetch: float = 2.0
+    poll_s: float = 0.5
+    local_workers: int = 0
+
+    def run(
+        self,
+        queue: ExperimentQueue,
+        episode_timeout: float | None = None,
+        episodes_per_worker: int = 1,
+        env_pool: EnvPoolOptions | None = None,
+    ) -> Iterator[EpisodeResult]:
+        broker = SQLiteBroker(self.path)
+        options = {
+            "episode_timeout": episode_timeout,
+            "episodes_per_worker": episodes_per_worker,
+            "env_pool": env_pool,
+            "lease_s": self.lease_s,
+        }
+        broker.open_study(options)
+        logger.info("Serving the study on %s: start workers with `agentlab2 worker %s`", self.path, self.path)
+        node = None
+        if self.local_workers:
+            node = multiprocessing.Process(target=serve, args=(self.path, self.local_workers), name="agentlab2-node")
+            node.start()
+        in_flight: dict[int, Experiment] = {}  # Task id -> experiment
+        try:
+            while True:
+                capacity = max(1, math.ceil(self.prefetch * broker.live_capacity(self.lease_s)))
+                while len(in_flight) < capacity and (experiment := queue.pop()) is not None:
+                    in_flight[broker.put(experiment)] = experiment
+
+                for task_id, result in broker.collect():
+                    experiment = in_flight.pop(task_id, None)
+                    if experiment is not None:
+                        queue.report(experiment, result)
+                        yield result
+
+                requeued, given_up = broker.requeue_expired(self.max_leases)
+                if requeued:
+                    logger.warning("%d episode(s) requeued: their worker stopped sending heartbeats", requeued)
+                for task_id in given_up:
+                    experiment = in_flight.pop(task_id, None)
+                    if experiment is None:  # Not one of ours
+                        continue
+                    logger.warning("Giving up on %s: lost by %d worker(s)", experiment.episode_id, self.max_leases)
+                    result = experiment.result("crashed", error=f"Lost by {self.max_leases} worker(s)")
+                    queue.report(experiment, result)
+                    yield result
+
+                ready_in = queue.ready_in()
+                if not in_flight and ready_in == float("inf"):
+                    break
+                time.sleep(min(self.poll_s, ready_in))
+        finally:
+            broker.close_study()
+            broker.close()
+            if node is not None:
+                node.join(NODE_EXIT_TIMEOUT_S)
+                if node.is_alive():
+                    node.terminate()
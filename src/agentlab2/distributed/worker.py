@@ -0,0 +1,110 @@
+"""A worker node: runs the experiments of a broker's study on this machine.
+
+    agentlab2 worker /shared/studies/s1/broker.sqlite --n-workers 16 --import my_studies.py
+
+The node waits for a study to be served on the broker, then leases its experiments one at a
+time as its worker processes have room, and runs them with run_parallel, like a study run on
+this machine: episode timeouts, crash isolation and environment pools (the study's settings)
+all apply. Each result goes back to the broker as soon as it is there. A thread renews the
+node's leases every `lease_s / 3`; if the node dies, its leases run out and the study gives
+its experiments to the other nodes. The node exits once the study is finished.
+
+Experiments arrive pickled: the node must be able to import the study's agent and task
+classes (--import the file or module that defines them), and see the study directory at the
+same path as the study process, to write the trajectories there.
+"""
+
+import logging
+import threading
+import time
+
+from agentlab2.distributed.broker import SQLiteBroker, default_worker_id
+from agentlab2.experiment import EpisodeResult, Experiment
+from agentlab2.runner import ExperimentQueue, default_n_workers, run_parallel
+
+logger = logging.getLogger(__name__)
+
+POLL_S = 1.0  # How often an idle node asks the broker for work
+
+
+class BrokerQueue(ExperimentQueue):
+    """The experiments of the broker's study, leased one at a time; results are sent back as they come."""
+
+    def __init__(self, broker: SQLiteBroker, worker_id: str, lease_s: float, poll_s: float = POLL_S) -> None:
+        self.broker = broker
+        self.worker_id = worker_id
+        self.lease_s = lease_s
+        self.poll_s = poll_s
+        self._tasks: dict[str, int] = {}  # Episode id -> task id, of the experiments running here
+        self._next_poll = 0.0
+
+    def pop(self) -> Experiment | None:
+        if time.monotonic() < self._next_poll:
+            return None  # The queue was empty a moment ago
+        leased = self.broker.lease(self.worker_id, self.lease_s)
+        if leased is None:
+            self._next_poll = time.monotonic() + self.poll_s
+            return None
+        task_id, experiment = leased
+        self._tasks[experiment.episode_id] = task_id
+        return experiment
+
+    def ready_in(self) -> float:
+        if self.broker.closed():
+            return float("inf")
+        return max(0.0, self._next_poll - time.monotonic())
+
+    def report(self, experiment: Experiment, result: EpisodeResult) -> None:
+        task_id = self._tasks.pop(experiment.episode_id)
+        if not self.broker.complete(task_id, self.worker_id, result):
+            logger.info("Result of %s dropped: finished elsewhere, or the study ended", experiment.episode_id)
+
+
+def _heartbeat(path: str, worker_id: str, lease_s: float, stop: threading.Event) -> None:
+    broker = SQLiteBroker(path)  # Connections are not shared between threads
+    try:
+        while not stop.wait(lease_s / 3):
+            try:
+                broker.heartbeat(worker_id, lease_s)
+            except Exception as e:  # Broker busy or unreachable for a while: try again next time
+                logger.warning("Heartbeat failed: %s", e)
+    finally:
+        broker.close()
+
+
+def serve(path: str, n_workers: int | None = None, worker_id: str | None = None, poll_s: float = POLL_S) -> int:
+    """Runs experiments from the broker at `path` until its study is finished. Returns how many ran here."""
+    broker = SQLiteBroker(path)
+    worker_id = worker_id or default_worker_id()
+    try:
+        while (options := broker.options()) is None or broker.closed():
+            logger.info("Waiting for a study on %s", path)
+            time.sleep(poll_s)
+        n_workers = default_n_workers() if n_workers is None else n_workers
+        broker.register(worker_id, max(1, n_workers) * options["episodes_per_worker"])
+        logger.info("Worker %s serving %s with %d worker process(es)", worker_id, path, n_workers)
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=_heartbeat, args=(path, worker_id, options["lease_s"], stop), name="agentlab2-heartbeat", daemon=True
+        )
+        heartbeat.start()
+        n_results = 0
+        try:
+            results = run_parallel(
+                BrokerQueue(broker, worker_id, options["lease_s"], poll_s),
+                n_workers,
+                options["episode_timeout"],
+                episodes_per_worker=options["episodes_per_worker"],
+                env_pool=options["env_pool"],
+            )
+            for result in results:
+                n_results += 1
+                logger.info("[%d] %s: %s", n_results, result.episode_id, result.status)
+        finally:
+            stop.set()
+            heartbeat.join()
+            broker.unregister(worker_id)
+        logger.info("Study finished, worker %s ran %d episode(s)", worker_id, n_results)
+        return n_results
+    finally:
+        broker.close()
@@ -0,0 +1,22 @@
+from typing import TYPE_CHECKING
+
+from agentlab2._lazy import lazy_exports
+
+if TYPE_CHECKING:
+    from agentlab2.envpool.pool import EnvPool, EnvPoolOptions, PooledEnv
+    from agentlab2.envpool.stub import NoopAgentArgs, StubEnv, StubTaskArgs, stub_suite
+
+__all__ = ["EnvPool", "EnvPoolOptions", "NoopAgentArgs", "PooledEnv", "StubEnv", "StubTaskArgs", "stub_suite"]
+
+__getattr__, __dir__ = lazy_exports(
+    __name__,
+    {
+        "EnvPool": "agentlab2.envpool.pool",
+        "EnvPoolOptions": "agentlab2.envpool.pool",
+        "PooledEnv": "agentlab2.envpool.pool",
+        "NoopAgentArgs": "agentlab2.envpool.stub",
+        "StubEnv": "agentlab2.envpool.stub",
+        "StubTaskArgs": "agentlab2.envpool.stub",
+        "stub_suite": "agentlab2.envpool.stub",
+    },
+)
@@ -0,0 +1,268 @@
+"""Warm environments kept across episodes, so that an episode does not wait for a browser to start.
+
+Each worker process has one `EnvPool`. An episode takes an environment of its task from the
+pool (`acquire`), resets it with its seed, and gives it back at the end (`release`) instead of
+closing it. On the first episode of a task the environment is launched on the spot (a miss).
+From the second episode of a task on, the pool also keeps `warm` more ready or launching in the
+background, while the episodes run, so the environments of the next ones are ready (hits) or on
+their way. Nothing is launched ahead for a task seen once: in most studies many tasks run a
+single episode on a worker, and their extra environments would only be launched to be closed.
+
+An environment is closed and replaced instead of being reused:
+- after `max_uses` episodes, since browsers accumulate state and leak,
+- when its memory (Env.memory_bytes, or the worker's resident memory when the environment
+  does not say) exceeds `max_memory_mb`,
+- when its episode failed, since it may be left in any state.
+
+Every pooled environment has a thread of its own, on which it is launched, used and closed:
+browser drivers are bound to the thread that started them. Coroutine environments (AsyncEnv)
+tied to an event loop should only be pooled by workers running several episodes at once (one
+event loop per worker); the others start a new loop per episode.
+
+Environments of a task are interchangeable: tasks are told apart by the repr of their
+TaskArgs.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any
+
+from agentlab2.core import Env, TaskArgs
+
+logger = logging.getLogger(__name__)
+
+CLOSE_TIMEOUT_S = 30.0  # Time an environment gets to close when the pool shuts down
+
+
+@dataclass(frozen=True)
+class EnvPoolOptions:
+    warm: int = 1  # Environments kept ready per task, beyond the ones in use
+    max_uses: int | None = 20  # Episodes an environment runs before it is relaunched
+    max_memory_mb: float | None = None  # Memory above which an environment is relaunched
+    max_idle: int = 8  # Idle environments kept in total, across tasks (the oldest are closed first)
+
+
+def process_memory_bytes() -> int:
+    """Resident memory of this process (peak resident memory where the current one is unknown)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PooledEnv:
+    """An environment of the pool and the thread it lives on."""
+
+    def __init__(self, task_args: TaskArgs, key: str) -> None:
+        self.task_args = task_args
+        self.key = key
+        self.env: Env | None = None
+        self.uses = 0
+        self.launch_s = 0.0
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix=f"agentlab2-env-{task_args.task_name}")
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> "Future[Any]":
+        return self.executor.submit(contextvars.copy_context().run, fn, *args)
+
+    async def call(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Runs fn(*args) on the environment's thread."""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+
+class EnvPool:
+    def __init__(self, options: EnvPoolOptions = EnvPoolOptions()) -> None:
+        self.options = options
+        self._lock = threading.Lock()
+        self._idle: dict[str, deque[PooledEnv]] = {}
+        self._launching: dict[str, list[tuple[PooledEnv, Future]]] = {}  # Background launches not claimed yet
+        self._episodes: dict[str, int] = {}  # Task -> episodes acquired for it
+        self._closed = False
+        self.stats = {
+            "acquired": 0,
+            "hits": 0,  # Ready when asked for
+            "warming": 0,  # Launched in advance, still starting when asked for
+            "misses": 0,  # Launched on demand
+            "launched": 0,
+            "launch_s": 0.0,
+            "resets": 0,
+            "reset_s": 0.0,
+            "recycled": 0,
+            "discarded": 0,
+        }
+
+    @property
+    def hit_rate(self) -> float:
+        return self.stats["hits"] / self.stats["acquired"] if self.stats["acquired"] else 0.0
+
+    def _launch(self, task_args: TaskArgs, key: str) -> tuple[PooledEnv, "Future[PooledEnv]"]:
+        pooled = PooledEnv(task_args, key)
+        started = time.perf_counter()
+
+        def make() -> PooledEnv:
+            pooled.env = task_args.make_env()
+            pooled.launch_s = time.perf_counter() - started
+            with self._lock:
+                self.stats["launched"] += 1
+                self.stats["launch_s"] += pooled.launch_s
+            return pooled
+
+        return pooled, pooled.submit(make)
+
+    def _top_up(self, task_args: TaskArgs, key: str) -> list[tuple[PooledEnv, "Future[PooledEnv]"]]:
+        """Starts launching environments for the task until `warm` are ready or on their way, once
+        the task has had a second episode. Lock held.
+
+        Returns the launches started, to pass to `_watch` once the lock is released.
+        """
+        if self._episodes.get(key, 0) < 2:
+            return []
+        launching = self._launching.setdefault(key, [])
+        started = []
+        for _ in range(self.options.warm - len(self._idle.get(key, ())) - len(launching)):
+            started.append(self._launch(task_args, key))
+            launching.append(started[-1])
+        return started
+
+    def _watch(self, launches: list[tuple[PooledEnv, "Future[PooledEnv]"]]) -> None:
+        """Puts the environments in the pool once launched. Lock not held: a launch that already
+        finished (make_env raised at once) runs its callback right here, and _launched takes the lock."""
+        for pooled, future in launches:
+            future.add_done_callback(lambda future, pooled=pooled: self._launched(pooled, future))
+
+    def _launched(self, pooled: PooledEnv, future: "Future[PooledEnv]") -> None:
+        with self._lock:
+            launching = self._launching.get(pooled.key, [])
+            if (pooled, future) not in launching:
+                return  # Claimed by acquire(), which is waiting for it
+            launching.remove((pooled, future))
+            if future.exception() is not None:
+                logger.warning("Could not launch an environment for %s: %s", pooled.key, future.exception())
+                pooled.executor.shutdown(wait=False)
+                return
+            if self._closed:
+                self._close(pooled)
+                return
+            self._idle.setdefault(pooled.key, deque()).append(pooled)
+            self._evict()
+
+    def _evict(self) -> None:
+        """Closes idle environments beyond `max_idle`, the oldest of the task with the most first. Lock held."""
+        while sum(len(idle) for idle in self._idle.values()) > self.options.max_idle:
+            key = max(self._idle, key=lambda key: len(self._idle[key]))
+            self._close(self._idle[key].popleft())
+
+    def _close(self, pooled: PooledEnv) -> "Future[Any]":
+        """Closes the environment on its thread, in the background."""
+
+        def close() -> None:
+            try:
+                if pooled.env is not None:
+                    pooled.env.close()
+            except Exception as e:
+                logger.warning("Could not close an environment of %s: %s", pooled.key, e)
+
+        future = pooled.submit(close)
+        pooled.executor.shutdown(wait=False)
+        return future
+
+    async def acquire(self, task_args: TaskArgs) -> tuple[PooledEnv, str]:
+        """An environment for the task and where it came from: "hit", "warming" or "miss"."""
+        key = repr(task_args)
+        with self._lock:
+            self.stats["acquired"] += 1
+            self._episodes[key] = self._episodes.get(key, 0) + 1
+            idle = self._idle.get(key)
+            launching = self._launching.get(key)
+            if idle:
+                pooled, future, source = idle.pop(), None, "hit"  # The most recently used: its pages are warmest
+            elif launching:
+                pooled, future = launching.pop(0)
+                source = "warming"
+            else:
+                pooled, future = self._launch(task_args, key)
+                source = "miss"
+            self.stats[{"hit": "hits", "warming": "warming", "miss": "misses"}[source]] += 1
+            launches = self._top_up(task_args, key)
+        self._watch(launches)
+        if future is not None:
+            try:
+                await asyncio.wrap_future(future)
+            except BaseException:
+                pooled.executor.shutdown(wait=False)
+                raise
+        return pooled, source
+
+    async def release(self, pooled: PooledEnv, healthy: bool = True) -> None:
+        """Takes the environment back after an episode, to reuse it or close it (see the module docstring)."""
+        pooled.uses += 1
+        reason = None
+        if not healthy:
+            reason = "discarded"
+        elif self.options.max_uses is not None and pooled.uses >= self.options.max_uses:
+            reason = "recycled"
+        elif self.options.max_memory_mb is not None:
+            memory = await pooled.call(pooled.env.memory_bytes)
+            if memory is None:
+                memory = process_memory_bytes()
+            if memory > self.options.max_memory_mb * 2**20:
+                logger.info("Relaunching an environment of %s using %d MB", pooled.key, memory // 2**20)
+                reason = "recycled"
+        launches = []
+        with self._lock:
+            if reason is not None or self._closed:
+                if reason is not None:
+                    self.stats[reason] += 1
+                close = self._close(pooled)
+                if not self._closed:
+                    launches = self._top_up(pooled.task_args, pooled.key)
+            else:
+                self._idle.setdefault(pooled.key, deque()).append(pooled)
+                self._evict()
+                close = None
+        self._watch(launches)
+        if close is not None:
+            await asyncio.wrap_future(close)
+
+    def discard(self, pooled: PooledEnv) -> None:
+        """Gives up on an environment that may be stuck (its episode timed out), without waiting for it."""
+        with self._lock:
+            self.stats["discarded"] += 1
+        pooled.executor.shutdown(wait=False, cancel_futures=True)
+
+    def record_reset(self, seconds: float) -> None:
+        with self._lock:
+            self.stats["resets"] += 1
+            self.stats["reset_s"] += seconds
+
+    def close(self) -> None:
+        """Closes the idle environments; the ones still launching are closed when they are up."""
+        with self._lock:
+            self._closed = True
+            closing = [self._close(pooled) for idle in self._idle.values() for pooled in idle]
+            self._idle.clear()
+        for future in closing:
+            try:
+                future.result(CLOSE_TIMEOUT_S)
+            except TimeoutError:
+                logger.warning("An environment did not close within %ss", CLOSE_TIMEOUT_S)
+        if self.stats["acquired"]:
+            logger.info(
+                "Environment pool: %d episode(s), %.0f%% hits, %d launched (%.2fs each), %.3fs per reset",
+                self.stats["acquired"],
+                100 * self.hit_rate,
+                self.stats["launched"],
+                self.stats["launch_s"] / max(1, self.stats["launched"]),
+                self.stats["reset_s"] / max(1, self.stats["resets"]),
+            )
@@ -0,0 +1,105 @@
+"""A stand-in for a browser environment, to try the environment pool (and the runner) without one.
+
+`StubEnv` takes `launch_s` to start and `reset_s` to reset, like a browser and a page load,
+grows by `leak_mb` per episode, and refuses to be used from another thread than the one that
+launched it, like Playwright's sync API. Episodes end after `n_steps` steps, with reward 1.
+With `launch_error` the environment fails to start, at once; with `crash_step` it kills its
+process at that step, like a segfaulting browser driver.
+
+    Study([NoopAgentArgs("noop")], [StubTaskArgs(f"stub-{i}", launch_s=3.0) for i in range(4)],
+          seeds=range(10), env_pool=EnvPoolOptions(warm=1)).run()
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from agentlab2.core import Action, Agent, AgentArgs, Env, Observation, TaskArgs
+
+
+class StubEnv(Env):
+    def __init__(
+        self,
+        launch_s: float,
+        reset_s: float,
+        step_s: float,
+        n_steps: int,
+        leak_mb: float,
+        crash_step: int | None = None,
+    ) -> None:
+        time.sleep(launch_s)
+        self.crash_step = crash_step
+        self.reset_s = reset_s
+        self.step_s = step_s
+        self.n_steps = n_steps
+        self.leak_mb = leak_mb
+        self.thread = threading.get_ident()
+        self.episodes = 0
+        self.steps = 0
+        self._leaked: list[bytearray] = []
+
+    def _check_thread(self) -> None:
+        if threading.get_ident() != self.thread:
+            raise RuntimeError("StubEnv used from another thread than the one that launched it")
+
+    def _obs(self) -> Observation:
+        return {"text": f"Stub page, step {self.steps} of episode {self.episodes} of this environment"}
+
+    def reset(self, seed: int | None = None) -> tuple[Observation, dict[str, Any]]:
+        self._check_thread()
+        time.sleep(self.reset_s)
+        self.episodes += 1
+        self.steps = 0
+        if self.leak_mb:
+            self._leaked.append(bytearray(int(self.leak_mb * 2**20)))
+        return self._obs(), {"seed": seed}
+
+    def step(self, action: Action) -> tuple[Observation, float, bool, bool, dict[str, Any]]:
+        self._check_thread()
+        time.sleep(self.step_s)
+        self.steps += 1
+        if self.steps == self.crash_step:
+            os._exit(1)
+        done = self.steps >= self.n_steps
+        return self._obs(), float(done), done, False, {"success": done}
+
+    def memory_bytes(self) -> int | None:
+        return sum(len(block) for block in self._leaked)
+
+    def close(self) -> None:
+        self._check_thread()
+        self._leaked.clear()
+
+
+@dataclass(frozen=True)
+class StubTaskArgs(TaskArgs):
+    launch_s: float = 2.0
+    reset_s: float = 0.05
+    step_s: float = 0.01
+    n_steps: int = 3
+    leak_mb: float = 0.0
+    launch_error: str | None = None
+    crash_step: int | None = None
+
+    def make_env(self) -> StubEnv:
+        if self.launch_error is not None:
+            raise RuntimeError(self.launch_error)
+        return StubEnv(self.launch_s, self.reset_s, self.step_s, self.n_steps, self.leak_mb, self.crash_step)
+
+
+def stub_suite(n: int, **args: Any) -> list[StubTaskArgs]:
+    """`n` stub tasks, stub-0 to stub-<n - 1>: a task suite for recipes (see agentlab2.recipe)."""
+    return [StubTaskArgs(f"stub-{i}", **args) for i in range(n)]
+
+
+class NoopAgent(Agent):
+    def get_action(self, obs: Observation) -> tuple[Action, dict[str, Any]]:
+        return "noop", {}
+
+
+@dataclass(frozen=True)
+class NoopAgentArgs(AgentArgs):
+    def make_agent(self) -> NoopAgent:
+        return NoopAgent()
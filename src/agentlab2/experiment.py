@@ -0,0 +1,265 @@
+"""A single episode: one agent on one task with one seed."""
+
+import asyncio
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field, replace
+from typing import Any, Literal
+
+from agentlab2.core import AgentArgs, AsyncAgent, AsyncEnv, EpisodeContext, TaskArgs, current_episode
+from agentlab2.envpool.pool import EnvPool
+from agentlab2.profiling import EpisodeProfile, ProfileOptions, span
+from agentlab2.trajectory import BLOBS_DIRNAME, EPISODES_DIRNAME, BlobStore, TrajectoryWriter
+
+logger = logging.getLogger(__name__)
+
+# done: the episode ran to the end (terminated, truncated or max_steps)
+# error: the agent or environment raised; timeout / crashed: set by the runner
+EpisodeStatus = Literal["done", "error", "timeout", "crashed"]
+
+
+async def close_loop_client() -> None:
+    """Closes the model client of the running event loop, if anything in it used one.
+
+    Call it before the loop shuts down (see agentlab2.llm.close_client).
+    """
+    client_module = sys.modules.get("agentlab2.llm.client")  # Not imported: no client to close
+    if client_module is not None:
+        await client_module.close_client()
+
+
+@dataclass
+class EpisodeResult:
+    """Summary of one episode, small enough to send between processes."""
+
+    episode_id: str
+    agent_name: str
+    task_name: str
+    seed: int
+    status: EpisodeStatus
+    reward: float = 0.0
+    success: bool = False
+    n_steps: int = 0
+    duration_s: float = 0.0
+    error: str | None = None
+    info: dict[str, Any] = field(default_factory=dict)
+    trace: list[dict[str, Any]] | None = field(default=None, repr=False)  # Profiled episodes, see agentlab2.profiling
+
+    def to_dict(self) -> dict[str, Any]:
+        """The summary saved with the trajectory and in the journal (the trace goes to the study's trace file)."""
+        data = asdict(replace(self, trace=None))
+        del data["trace"]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "EpisodeResult":
+        return cls(**data)
+
+
+@dataclass(frozen=True)
+class Experiment:
+    """Runs `agent_args` on `task_args` with `seed`, for at most `max_steps` steps.
+
+    With a `study_dir` the trajectory is saved to <study_dir>/episodes/<episode_id> as the
+    episode runs (see agentlab2.trajectory). With `profile` the phases of each step are timed
+    (see agentlab2.profiling).
+    """
+
+    agent_args: AgentArgs
+    task_args: TaskArgs
+    seed: int = 0
+    max_steps: int = 30
+    study_dir: str | None = None
+    profile: ProfileOptions | None = None
+
+    @property
+    def episode_id(self) -> str:
+        return f"{self.agent_args.agent_name}__{self.task_args.task_name}__{self.seed}"
+
+    @property
+    def episode_dir(self) -> str | None:
+        if self.study_dir is None:
+            return None
+        return os.path.join(self.study_dir, EPISODES_DIRNAME, self.episode_id)
+
+    def result(self, status: EpisodeStatus, **kwargs: Any) -> EpisodeResult:
+        return EpisodeResult(
+            episode_id=self.episode_id,
+            agent_name=self.agent_args.agent_name,
+            task_name=self.task_args.task_name,
+            seed=self.seed,
+            status=status,
+            **kwargs,
+        )
+
+    def run(self, env_pool: EnvPool | None = None, runner: asyncio.Runner | None = None) -> EpisodeResult:
+        """Runs the episode in this process. Exceptions are caught and reported in the result.
+
+        With `runner` the episode runs in its event loop, so that episodes run one after the other
+        share what is bound to the loop, like the model client's connections (agentlab2.llm); the
+        runner's owner closes them (see close_loop_client) before closing it.
+        """
+        if runner is None:
+            return asyncio.run(self._arun_and_close(env_pool))
+        return runner.run(self.arun(offload=False, env_pool=env_pool))
+
+    async def _arun_and_close(self, env_pool: EnvPool | None) -> EpisodeResult:
+        try:
+            return await self.arun(offload=False, env_pool=env_pool)
+        finally:
+            await close_loop_client()
+
+    async def arun(self, offload: bool = True, env_pool: EnvPool | None = None) -> EpisodeResult:
+        """Runs the episode as a coroutine, so one event loop can drive many episodes at once.
+
+        Coroutine agents and environments (AsyncAgent, AsyncEnv) are awaited. With `offload`,
+        the blocking calls (sync agents and environments, trajectory writes) run on a thread of
+        their own, always the same one for the episode, since browser drivers are bound to the
+        thread that started them.
+
+        With an `env_pool` the environment comes from the pool and goes back to it, instead of
+        being made and closed (see agentlab2.envpool); it then runs on the pool's thread for it.
+
+        The result's info holds how long the reset took, whether the environment was warm, the
+        LLM calls, tokens, retries, bytes and cost of the episode (see agentlab2.llm), the bytes
+        of trajectory written and, when profiled, the time spent in each phase; the result's
+        trace then holds the episode's spans.
+        """
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(1, thread_name_prefix=self.episode_id) if offload else None
+        context = EpisodeContext(self.episode_id)
+        profile = None
+        if self.profile is not None:
+            profile = context.profile = EpisodeProfile(self.episode_id, self.profile)
+        current_episode.set(context)
+
+        async def call(fn: Callable[..., Any], *args: Any) -> Any:
+            if executor is None:
+                return fn(*args)
+            return await loop.run_in_executor(executor, contextvars.copy_context().run, fn, *args)
+
+        env = writer = pooled = None
+        env_call = call
+        reward, n_steps, info = 0.0, 0, {}
+        env_stats: dict[str, Any] = {}
+        try:
+            if profile is not None:
+                profile.threads.update((threading.get_ident(), await call(threading.get_ident)))
+                profile.start_sampling()
+            if self.study_dir is not None:
+                blob_store = BlobStore(os.path.join(self.study_dir, BLOBS_DIRNAME))
+                writer = await call(TrajectoryWriter, self.episode_dir, blob_store)
+            with span("agent_make"):
+                agent = await call(self.agent_args.make_agent)
+            if env_pool is not None:
+                with span("env_acquire") as args:
+                    pooled, env_stats["env_pool"] = await env_pool.acquire(self.task_args)
+                    args["source"] = env_stats["env_pool"]
+                env, env_call = pooled.env, pooled.call
+                if profile is not None:
+                    profile.threads.add(await env_call(threading.get_ident))
+            else:
+                with span("env_make"):
+                    env = await call(self.task_args.make_env)
+            await call(agent.reset, self.seed)
+            with span("env_reset"):
+                reset_start = time.perf_counter()
+                if isinstance(env, AsyncEnv):
+                    obs, info = await env.areset(seed=self.seed)
+                else:
+                    obs, info = await env_call(env.reset, self.seed)
+                env_stats["env_reset_s"] = time.perf_counter() - reset_start
+            if env_pool is not None:
+                env_pool.record_reset(env_stats["env_reset_s"])
+            with span("observation"):
+                obs = await call(agent.obs_preprocessor, obs)
+            terminated = truncated = False
+            while not (terminated or truncated) and n_steps < self.max_steps:
+                with span("step", step=n_steps):
+                    with span("agent"):
+                        if isinstance(agent, AsyncAgent):
+                            action, agent_info = await agent.aget_action(obs)
+                        else:
+                            action, agent_info = await call(agent.get_action, obs)
+                    with span("env_step"):
+                        if isinstance(env, AsyncEnv):
+                            next_obs, reward, terminated, truncated, info = await env.astep(action)
+                        else:
+                            next_obs, reward, terminated, truncated, info = await env_call(env.step, action)
+                    with span("observation"):
+                        next_obs = await call(agent.obs_preprocessor, next_obs)
+                    if writer is not None:
+                        record = {
+                            "step": n_steps,
+                            "obs": obs,
+                            "action": action,
+                            "agent_info": agent_info,
+                            "env_info": info,
+                        }
+                        with span("trajectory"):
+                            await call(writer.add_step, record, reward, terminated, truncated)
+                obs = next_obs
+                n_steps += 1
+            if writer is not None:
+                with span("trajectory"):
+                    await call(
+                        writer.add_step, {"step": n_steps, "obs": obs, "action": None}, reward, terminated, truncated
+                    )
+            result = self.result(
+                "done",
+                reward=float(reward),
+                success=bool(info.get("success", reward > 0)),
+                n_steps=n_steps,
+                duration_s=time.perf_counter() - start,
+                info={**env_stats, **context.usage},
+            )
+        except asyncio.CancelledError:
+            # Timed out: the episode's thread may be stuck in a blocking call, don't wait for it
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+            if pooled is not None:
+                env_pool.discard(pooled)
+            if profile is not None:
+                profile.stop_sampling()
+            raise
+        except Exception as e:
+            logger.warning("Episode %s failed: %s", self.episode_id, e)
+            result = self.result(
+                "error",
+                n_steps=n_steps,
+                duration_s=time.perf_counter() - start,
+                error=f"{type(e).__name__}: {e}\n{traceback.format_exc()}",
+                info={**env_stats, **context.usage},
+            )
+        try:
+            if env is not None:
+                try:
+                    with span("env_close"):
+                        if pooled is not None:
+                            await env_pool.release(pooled, healthy=result.status == "done")
+                        else:
+                            await call(env.close)
+                except Exception as e:
+                    logger.warning("Could not close the environment of %s: %s", self.episode_id, e)
+            if writer is not None:
+                context.add_usage(trajectory_bytes=writer.bytes_written + writer.blob_store.bytes_written)
+                result.info.update(context.usage)
+            if profile is not None:
+                profile.stop_sampling()
+                profile.add("episode", start, time.perf_counter(), {"status": result.status, **context.usage})
+                result.info.update(profile.info())
+                result.trace = profile.trace_events()
+            if writer is not None:
+                await call(writer.close, result.to_dict())
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False)
+        return result
@@ -0,0 +1,223 @@
+"""Durable progress journal of a study, so an interrupted study resumes where it stopped.
+
+<study_dir>/journal.sqlite holds one row per episode:
+
+    pending -> running -> done
+                       -> failed -> (after a backoff) running -> ...
+
+with the number of attempts, the status, duration and error of the last one, and the path
+of its summary.json (relative to the study directory). Every change is committed before the
+runner goes on, so a killed study loses nothing but the episodes that were running; those
+count as a failed attempt ("interrupted") when the study is relaunched.
+
+`JournalQueue` drives run_parallel from the journal: finished episodes are skipped, failed
+ones are retried up to `max_attempts` times with exponential backoff, and pending episodes
+start longest-expected-first (from the durations of the same task so far), so the long ones
+do not end up alone at the tail of the study.
+"""
+
+import heapq
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections.abc import Iterable
+
+from agentlab2.experiment import EpisodeResult, Experiment
+from agentlab2.runner import ExperimentQueue
+from agentlab2.trajectory import SUMMARY_FILENAME, write_summary
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FILENAME = "journal.sqlite"
+MAX_BACKOFF_S = 3600.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS episodes (
+    episode_id TEXT PRIMARY KEY,
+    agent_name TEXT NOT NULL,
+    task_name TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    state TEXT NOT NULL,        -- pending, running, done, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    status TEXT,                -- EpisodeResult.status of the last attempt
+    duration_s REAL,
+    error TEXT,
+    result_path TEXT,           -- summary.json of the last attempt, relative to the study directory
+    retry_at REAL,              -- failed episodes are not retried before this (Unix time)
+    updated_at REAL NOT NULL
+)
+"""
+
+
+class Journal:
+    """The episode states of the study in `study_dir`."""
+
+    def __init__(self, study_dir: str) -> None:
+        os.makedirs(study_dir, exist_ok=True)
+        self.study_dir = study_dir
+        self.path = os.path.join(study_dir, JOURNAL_FILENAME)
+        self._db = sqlite3.connect(self.path)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(SCHEMA)
+        self._db.commit()
+
+    def close(self) -> None:
+        self._db.close()
+
+    def register(self, experiments: Iterable[Experiment]) -> None:
+        """Adds the experiments that are not in the journal yet, as pending."""
+        now = time.time()
+        with self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO episodes (episode_id, agent_name, task_name, seed, state, updated_at) "
+                "VALUES (?, ?, ?, ?, 'pending', ?)",
+                [(e.episode_id, e.agent_args.agent_name, e.task_args.task_name, e.seed, now) for e in experiments],
+            )
+
+    def recover(self) -> int:
+        """Marks the episodes a previous, interrupted run left running as failed. Returns their number."""
+        with self._db:
+            cursor = self._db.execute(
+                "UPDATE episodes SET state = 'failed', status = 'crashed', error = 'interrupted', updated_at = ? "
+                "WHERE state = 'running'",
+                (time.time(),),
+            )
+        return cursor.rowcount
+
+    def rows(self) -> dict[str, sqlite3.Row]:
+        return {row["episode_id"]: row for row in self._db.execute("SELECT * FROM episodes")}
+
+    def expected_durations(self) -> dict[str, float]:
+        """Mean duration of the attempts so far, per task."""
+        rows = self._db.execute(
+            "SELECT task_name, AVG(duration_s) FROM episodes WHERE duration_s IS NOT NULL GROUP BY task_name"
+        )
+        return dict(rows.fetchall())
+
+    def mark_running(self, episode_id: str) -> None:
+        with self._db:
+            self._db.execute(
+                "UPDATE episodes SET state = 'running', attempts = attempts + 1, updated_at = ? WHERE episode_id = ?",
+                (time.time(), episode_id),
+            )
+
+    def record(self, result: EpisodeResult, result_path: str | None, retry_at: float | None) -> None:
+        state = "done" if result.status == "done" else "failed"
+        with self._db:
+            self._db.execute(
+                "UPDATE episodes SET state = ?, status = ?, duration_s = ?, error = ?, result_path = ?, "
+                "retry_at = ?, updated_at = ? WHERE episode_id = ?",
+                (
+                    state,
+                    result.status,
+                    result.duration_s,
+                    result.error,
+                    result_path,
+                    retry_at,
+                    time.time(),
+                    result.episode_id,
+                ),
+            )
+
+    def load_result(self, episode_id: str) -> EpisodeResult | None:
+        """The last result of an episode, from its summary.json."""
+        row = self._db.execute("SELECT result_path FROM episodes WHERE episode_id = ?", (episode_id,)).fetchone()
+        if row is None or row["result_path"] is None:
+            return None
+        try:
+            with open(os.path.join(self.study_dir, row["result_path"])) as f:
+                return EpisodeResult.from_dict(json.load(f))
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning("Could not load the result of %s: %s", episode_id, e)
+            return None
+
+    def counts(self) -> dict[str, int]:
+        return dict(self._db.execute("SELECT state, COUNT(*) FROM episodes GROUP BY state").fetchall())
+
+
+class JournalQueue(ExperimentQueue):
+    """Serves the experiments that still need to run according to `journal`, and records their results."""
+
+    def __init__(
+        self,
+        journal: Journal,
+        experiments: Iterable[Experiment],
+        max_attempts: int = 3,
+        retry_backoff_s: float = 30.0,
+    ) -> None:
+        self.journal = journal
+        self.max_attempts = max_attempts
+        self.retry_backoff_s = retry_backoff_s
+        experiments = list(experiments)
+        journal.register(experiments)
+        interrupted = journal.recover()
+        if interrupted:
+            logger.warning("%d episode(s) were interrupted by the previous run", interrupted)
+
+        rows = journal.rows()
+        expected = journal.expected_durations()
+        self._ready: list[tuple[float, int, Experiment]] = []  # (-expected duration, order, experiment)
+        self._retries: list[tuple[float, int, Experiment]] = []  # (retry_at, order, experiment)
+        self._attempts: dict[str, int] = {}
+        self._order: dict[str, int] = {}  # Tie-breaker, keeps equally long episodes in study order
+        for order, experiment in enumerate(experiments):
+            row = rows[experiment.episode_id]
+            self._attempts[experiment.episode_id] = row["attempts"]
+            self._order[experiment.episode_id] = order
+            if row["state"] == "done" or (row["state"] == "failed" and row["attempts"] >= max_attempts):
+                continue
+            if row["state"] == "failed" and row["retry_at"]:
+                self._retries.append((row["retry_at"], order, experiment))
+            else:
+                # Unknown durations first: they are as likely to be long, and the sooner we know the better
+                self._ready.append((-expected.get(experiment.task_args.task_name, float("inf")), order, experiment))
+        heapq.heapify(self._ready)
+        heapq.heapify(self._retries)
+        self.n_skipped = len(experiments) - len(self._ready) - len(self._retries)
+
+    def __len__(self) -> int:
+        return len(self._ready) + len(self._retries)
+
+    def pop(self) -> Experiment | None:
+        now = time.time()
+        while self._retries and self._retries[0][0] <= now:
+            _, order, experiment = heapq.heappop(self._retries)
+            heapq.heappush(self._ready, (float("-inf"), order, experiment))  # Failed ones are known to take long
+        if not self._ready:
+            return None
+        experiment = heapq.heappop(self._ready)[2]
+        self.journal.mark_running(experiment.episode_id)
+        self._attempts[experiment.episode_id] += 1
+        return experiment
+
+    def ready_in(self) -> float:
+        if self._ready:
+            return 0.0
+        if self._retries:
+            return max(0.0, self._retries[0][0] - time.time())
+        return float("inf")
+
+    def report(self, experiment: Experiment, result: EpisodeResult) -> None:
+        result_path = None
+        if experiment.episode_dir is not None:
+            if result.status in ("timeout", "crashed"):  # The worker was gone before it could write one
+                write_summary(experiment.episode_dir, result.to_dict())
+            result_path = os.path.relpath(
+                os.path.join(experiment.episode_dir, SUMMARY_FILENAME), self.journal.study_dir
+            )
+        attempts = self._attempts[experiment.episode_id]
+        retry_at = None
+        if result.status != "done" and attempts < self.max_attempts:
+            retry_at = time.time() + min(self.retry_backoff_s * 2 ** (attempts - 1), MAX_BACKOFF_S)
+            heapq.heappush(self._retries, (retry_at, self._order[experiment.episode_id], experiment))
+            logger.info(
+                "Retrying %s in %.0fs (attempt %d/%d)",
+                experiment.episode_id,
+                retry_at - time.time(),
+                attempts + 1,
+                self.max_attempts,
+            )
+        self.journal.record(result, result_path, retry_at)
@@ -0,0 +1,45 @@
+from typing import TYPE_CHECKING
+
+from agentlab2._lazy import lazy_exports
+
+if TYPE_CHECKING:
+    from agentlab2.llm.cache import CacheMiss, ResponseCache
+    from agentlab2.llm.client import (
+        LLMClient,
+        LLMError,
+        LLMResponse,
+        ProviderConfig,
+        close_client,
+        get_client,
+        register_provider,
+        request_key,
+    )
+
+__all__ = [
+    "CacheMiss",
+    "LLMClient",
+    "LLMError",
+    "LLMResponse",
+    "ProviderConfig",
+    "ResponseCache",
+    "close_client",
+    "get_client",
+    "register_provider",
+    "request_key",
+]
+
+__getattr__, __dir__ = lazy_exports(
+    __name__,
+    {
+        "CacheMiss": "agentlab2.llm.cache",
+        "ResponseCache": "agentlab2.llm.cache",
+        "LLMClient": "agentlab2.llm.client",
+        "LLMError": "agentlab2.llm.client",
+        "LLMResponse": "agentlab2.llm.client",
+        "ProviderConfig": "agentlab2.llm.client",
+        "close_client": "agentlab2.llm.client",
+        "get_client": "agentlab2.llm.client",
+        "register_provider": "agentlab2.llm.client",
+        "request_key": "agentlab2.llm.client",
+    },
+)
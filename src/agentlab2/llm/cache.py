@@ -0,0 +1,193 @@
+"""Content-addressed cache of LLM responses, to rerun studies without paying for the same prompts.
+
+Responses are keyed by `request_key`: a hash of the provider, model, parameters and messages,
+images included. Deterministic requests (temperature 0) share one entry whatever episode sends
+them. Sampled ones are keyed per episode and per occurrence as well (the 3rd identical request
+of episode X), so a rerun replays each episode's own samples instead of collapsing the seeds
+of a task onto one answer.
+
+Entries live in a SQLite file shared by the worker processes, behind an in-memory LRU per
+process. The file is kept under `max_bytes` (least recently used entries go first) and
+entries older than `max_age_s` are dropped. Uses are noted in memory and written in batches
+(by hits read from the file, writes, eviction and close), never by a hit in memory.
+
+Modes:
+    read_through  answer from the cache, call the API on a miss and store the answer
+    record        always call the API, store (or refresh) the answer
+    replay        answer from the cache only; a miss raises CacheMiss (offline, deterministic runs)
+    off           no cache
+
+`get_client()` sets up one cache per process from AGENTLAB2_LLM_CACHE (path of the SQLite file) and
+AGENTLAB2_LLM_CACHE_MODE (default read_through), which worker processes inherit.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Literal
+
+from agentlab2.core import current_episode
+
+CacheMode = Literal["read_through", "record", "replay", "off"]
+CACHE_MODES = ("read_through", "record", "replay", "off")
+EVICT_EVERY = 1000  # Writes between two eviction passes
+FLUSH_USED_EVERY = 256  # Entries used since the last write of their last_used_at, before writing them
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,     -- The API's JSON answer
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL
+)
+"""
+
+
+class CacheMiss(KeyError):
+    """Replay mode found no recorded response for a request."""
+
+
+def scoped_key(request_key: str, deterministic: bool) -> str:
+    """Cache key of a request sent by the current episode; see the module docstring."""
+    episode = current_episode.get()
+    if deterministic or episode is None:
+        return request_key
+    occurrence = episode.counters.get(request_key, 0)
+    episode.counters[request_key] = occurrence + 1
+    return hashlib.sha256(f"{request_key}/{episode.episode_id}/{occurrence}".encode()).hexdigest()
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        path: str,
+        mode: CacheMode = "read_through",
+        max_bytes: int = 10 * 2**30,
+        max_age_s: float | None = None,
+        memory_items: int = 1024,
+    ) -> None:
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode: {mode!r} (expected one of {', '.join(CACHE_MODES)})")
+        self.path = path
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.memory_items = memory_items
+        self._memory: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._used: dict[str, float] = {}  # Key -> last use, not written to the file yet
+        self.stats = {"hits": 0, "memory_hits": 0, "misses": 0, "writes": 0, "evicted": 0}
+        self._closed = False
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")  # Readers don't block the writers of other workers
+        self._db.execute(SCHEMA)
+        self._db.commit()
+        if mode != "replay":
+            self.evict()
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache | None":
+        path = os.environ.get("AGENTLAB2_LLM_CACHE")
+        mode = os.environ.get("AGENTLAB2_LLM_CACHE_MODE", "read_through")
+        if not path or mode == "off":
+            return None
+        return cls(path, mode)  # type: ignore[arg-type]
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        """The stored response for `key`, None on a miss (and always in record mode)."""
+        if self.mode == "record":
+            return None
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._used[key] = time.time()
+                self.stats["memory_hits"] += 1
+                return self._memory[key]
+            row = self._db.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.max_age_s and row[1] < time.time() - self.max_age_s and self.mode != "replay"):
+                self.stats["misses"] += 1
+                return None
+            self._used[key] = time.time()
+            if len(self._used) >= FLUSH_USED_EVERY:
+                with self._db:
+                    self._flush_used()
+            response = json.loads(row[0])
+            self._remember(key, response)
+            self.stats["hits"] += 1
+            return response
+
+    def put(self, key: str, model: str, response: dict[str, Any]) -> None:
+        if self.mode == "replay":
+            return
+        text = json.dumps(response, separators=(",", ":"))
+        now = time.time()
+        with self._lock:
+            self._used.pop(key, None)
+            with self._db:
+                self._flush_used()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_used_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model, text, len(text), now, now),
+                )
+            self._remember(key, response)
+            self.stats["writes"] += 1
+            self._writes += 1
+            evict = self._writes % EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def _flush_used(self) -> None:
+        """Writes the last uses noted since the last flush, so that eviction keeps those entries
+        (the file is shared with other workers). Called with the lock held, in a transaction."""
+        if self._used and self.mode != "replay":
+            self._db.executemany(
+                "UPDATE responses SET last_used_at = ? WHERE key = ?",
+                [(used_at, key) for key, used_at in self._used.items()],
+            )
+        self._used.clear()
+
+    def _remember(self, key: str, response: dict[str, Any]) -> None:
+        self._memory[key] = response
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def evict(self) -> int:
+        """Drops expired entries, then the least recently used ones until the file is under max_bytes."""
+        with self._lock, self._db:
+            self._flush_used()
+            evicted = 0
+            if self.max_age_s:
+                cursor = self._db.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age_s,))
+                evicted += cursor.rowcount
+            cursor = self._db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "  SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY last_used_at DESC, key) AS total"
+                "  FROM responses) WHERE total > ?)",
+                (self.max_bytes,),
+            )
+            evicted += cursor.rowcount
+            if evicted:
+                self._memory.clear()
+            self.stats["evicted"] += evicted
+        return evicted
+
+    def close(self) -> None:
+        """Writes the pending uses and closes the file; closing again does nothing (atexit closes it too)."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            with self._db:
+                self._flush_used()
+            self._db.close()
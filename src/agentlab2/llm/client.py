@@ -0,0 +1,325 @@
+"""Shared asyncio client for OpenAI-compatible chat completion APIs.
+
+One `LLMClient` per event loop (see `get_client`) serves every episode running in it, and one
+response cache per process serves every client:
+
+- connections are pooled and kept alive (agentlab2.llm.http),
+- each provider has its own concurrency, requests-per-minute and tokens-per-minute limits,
+- failed requests (connection errors, 408/429/5xx) are retried with exponential backoff and
+  full jitter, honouring Retry-After,
+- identical deterministic requests (temperature 0) in flight at the same time are sent once
+  and the answer is shared, e.g. the first step of several seeds of the same task,
+- answers can be cached across runs (agentlab2.llm.cache),
+- the calls, tokens, retries, bytes and cost of each episode are added up in its
+  EpisodeContext, and end up in the info of its result (cost only for the models whose
+  prices the provider lists); each call is a span of a profiled episode (agentlab2.profiling).
+
+Models are named "<provider>/<model>", e.g. "openai/gpt-4o-mini". The limits apply per
+process: with several worker processes, give each its share of the provider's budget.
+"""
+
+import asyncio
+import atexit
+import hashlib
+import json
+import logging
+import os
+import random
+import weakref
+from dataclasses import dataclass, field
+from typing import Any
+
+from agentlab2.core import current_episode
+from agentlab2.llm.cache import CacheMiss, ResponseCache, scoped_key
+from agentlab2.llm.http import ConnectionPool
+from agentlab2.llm.limits import ProviderLimits
+from agentlab2.profiling import span
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+IMAGE_TOKENS = 765  # Rough cost of one image input (a 1024x1024 tile set at high detail)
+DEFAULT_MAX_TOKENS = 256  # Completion tokens assumed when the request does not set a maximum
+
+
+@dataclass(frozen=True)
+class ProviderConfig:
+    name: str
+    base_url: str  # Up to and including the API version, e.g. https://api.openai.com/v1
+    api_key_env: str | None = None  # Environment variable holding the API key
+    max_concurrency: int = 16
+    requests_per_minute: float | None = None
+    tokens_per_minute: float | None = None
+    max_retries: int = 5
+    timeout_s: float = 120.0
+    backoff_base_s: float = 1.0
+    backoff_max_s: float = 60.0
+    prices: dict[str, tuple[float, float]] = field(default_factory=dict)  # Model -> USD per 1M (input, output) tokens
+
+    def cost(self, model: str, usage: dict[str, int]) -> float:
+        input_price, output_price = self.prices.get(model, (0.0, 0.0))
+        return (usage.get("prompt_tokens", 0) * input_price + usage.get("completion_tokens", 0) * output_price) / 1e6
+
+
+def default_providers() -> dict[str, ProviderConfig]:
+    return {
+        "openai": ProviderConfig(
+            "openai", os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1"), "OPENAI_API_KEY"
+        ),
+    }
+
+
+class LLMError(Exception):
+    def __init__(self, status: int | None, message: str) -> None:
+        super().__init__(f"{status}: {message}" if status else message)
+        self.status = status
+
+
+@dataclass
+class LLMResponse:
+    text: str
+    model: str
+    usage: dict[str, int] = field(default_factory=dict)
+    raw: dict[str, Any] = field(default_factory=dict)
+    cached: bool = False
+
+    @classmethod
+    def from_api(cls, data: dict[str, Any], cached: bool = False) -> "LLMResponse":
+        try:
+            text = data["choices"][0]["message"].get("content") or ""
+        except (KeyError, IndexError, TypeError) as e:
+            raise LLMError(200, f"Unexpected response: {e}") from e
+        return cls(text=text, model=data.get("model", ""), usage=data.get("usage") or {}, raw=data, cached=cached)
+
+
+def request_key(provider: str, payload: dict[str, Any]) -> str:
+    """Content hash of a request: provider, model, parameters and messages (images included)."""
+    canonical = json.dumps([provider, payload], sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def estimate_tokens(payload: dict[str, Any]) -> int:
+    """Upper-bound guess of the tokens a request will use, charged to the tokens-per-minute budget."""
+    chars, images = 0, 0
+    for message in payload.get("messages", []):
+        content = message.get("content")
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content or ""}]
+        for part in parts:
+            if part.get("type") == "image_url":
+                images += 1
+            else:
+                chars += len(str(part.get("text", "")))
+    max_tokens = payload.get("max_completion_tokens") or payload.get("max_tokens") or DEFAULT_MAX_TOKENS
+    return chars // 4 + images * IMAGE_TOKENS + max_tokens
+
+
+def _is_deterministic(params: dict[str, Any]) -> bool:
+    return params.get("temperature") == 0 and params.get("n", 1) == 1
+
+
+class LLMClient:
+    """Chat completions over pooled connections, with per-provider limits, retries and coalescing."""
+
+    def __init__(
+        self,
+        providers: dict[str, ProviderConfig] | None = None,
+        pool: ConnectionPool | None = None,
+        cache: ResponseCache | None = None,
+    ) -> None:
+        self.providers = dict(providers or default_providers())
+        self.pool = pool or ConnectionPool()
+        self.cache = cache
+        self._limits: dict[str, ProviderLimits] = {}
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.stats = {"requests": 0, "retries": 0, "coalesced": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def add_provider(self, config: ProviderConfig) -> None:
+        self.providers[config.name] = config
+        self._limits.pop(config.name, None)
+
+    def limits(self, provider: ProviderConfig) -> ProviderLimits:
+        if provider.name not in self._limits:
+            self._limits[provider.name] = ProviderLimits(
+                provider.max_concurrency, provider.requests_per_minute, provider.tokens_per_minute
+            )
+        return self._limits[provider.name]
+
+    async def chat(
+        self, model: str, messages: list[dict[str, Any]], coalesce: bool | None = None, **params: Any
+    ) -> LLMResponse:
+        """Sends a chat completion request. `params` go to the API as they are (temperature, ...).
+
+        coalesce: share the answer with identical requests in flight; by default only for
+        deterministic ones (temperature=0), since sampled answers are expected to differ.
+        """
+        with span("llm", concurrent=True, model=model) as args:
+            response = await self._chat(model, messages, coalesce, **params)
+            args.update(response.usage, cached=response.cached)
+        return response
+
+    async def _chat(
+        self, model: str, messages: list[dict[str, Any]], coalesce: bool | None, **params: Any
+    ) -> LLMResponse:
+        provider_name, _, model_name = model.partition("/")
+        if provider_name not in self.providers:
+            raise LLMError(None, f"Unknown provider {provider_name!r} in model {model!r}")
+        payload = {"model": model_name, "messages": messages, **params}
+        deterministic = _is_deterministic(params)
+        key = request_key(provider_name, payload)
+        cache_key = None
+        if self.cache is not None:
+            cache_key = scoped_key(key, deterministic)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                response = LLMResponse.from_api(cached, cached=True)
+                _add_usage(response, None)
+                return response
+            if self.cache.mode == "replay":
+                raise CacheMiss(f"No cached response for {model} (key {cache_key[:16]})")
+
+        provider = self.providers[provider_name]
+        paid = True
+        if coalesce if coalesce is not None else deterministic:
+            task = self._inflight.get(key)
+            if task is None:
+                task = asyncio.create_task(self._send(provider, payload))
+                self._inflight[key] = task
+                task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            else:
+                self.stats["coalesced"] += 1
+                paid = False  # Charged to the episode that sent it
+            # A waiter that gives up (episode timeout) must not cancel the request for the others
+            response = await asyncio.shield(task)
+        else:
+            response = await self._send(provider, payload)
+        _add_usage(response, provider.cost(model_name, response.usage) if paid else None)
+        if self.cache is not None:
+            self.cache.put(cache_key, model, response.raw)
+        return response
+
+    async def _send(self, provider: ProviderConfig, payload: dict[str, Any]) -> LLMResponse:
+        limits = self.limits(provider)
+        url = f"{provider.base_url.rstrip('/')}/chat/completions"
+        headers = {"Content-Type": "application/json"}
+        if provider.api_key_env and os.environ.get(provider.api_key_env):
+            headers["Authorization"] = f"Bearer {os.environ[provider.api_key_env]}"
+        body = json.dumps(payload).encode("utf-8")
+        estimated = estimate_tokens(payload)
+
+        attempt = 0
+        while True:
+            await limits.acquire(estimated)
+            retry_after = None
+            used = 0  # Tokens the attempt used: none unless it succeeded, the rest of the budget goes back
+            try:
+                async with limits.concurrency:
+                    self.stats["requests"] += 1
+                    try:
+                        response = await self.pool.request("POST", url, headers, body, provider.timeout_s)
+                    except (OSError, asyncio.IncompleteReadError, TimeoutError) as e:
+                        error = LLMError(None, f"{type(e).__name__}: {e}")
+                    else:
+                        _count(llm_bytes_sent=len(body), llm_bytes_received=len(response.body))
+                        if response.status == 200:
+                            try:
+                                data = response.json()
+                            except ValueError as e:  # Not JSON, or not UTF-8
+                                raise LLMError(200, f"Invalid response body: {e}") from e
+                            if not isinstance(data, dict):
+                                raise LLMError(200, f"Unexpected response: {response.text[:500]}")
+                            used = (data.get("usage") or {}).get("total_tokens", estimated)
+                            return self._parse(data)
+                        error = LLMError(response.status, response.text[:500])
+                        if response.status not in RETRY_STATUSES:
+                            raise error
+                        retry_after = response.headers.get("retry-after")
+            finally:
+                limits.settle(estimated, used)
+            if attempt == provider.max_retries:
+                raise error
+            delay = random.uniform(0, min(provider.backoff_max_s, provider.backoff_base_s * 2**attempt))
+            if retry_after and retry_after.replace(".", "", 1).isdigit():
+                delay = max(delay, float(retry_after))
+            logger.info("%s request failed (%s), retrying in %.1fs", provider.name, error, delay)
+            self.stats["retries"] += 1
+            _count(llm_retries=1)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _parse(self, data: dict[str, Any]) -> LLMResponse:
+        usage = data.get("usage") or {}
+        self.stats["prompt_tokens"] += usage.get("prompt_tokens", 0)
+        self.stats["completion_tokens"] += usage.get("completion_tokens", 0)
+        return LLMResponse.from_api(data)
+
+    def close(self) -> None:
+        """Closes the connections, and the cache unless it is the process's one (see get_client)."""
+        self.pool.close()
+        if self.cache is not None and self.cache not in _cache:
+            self.cache.close()
+
+
+def _count(**amounts: float) -> None:
+    """Adds to the usage of the current episode, if any."""
+    episode = current_episode.get()
+    if episode is not None:
+        episode.add_usage(**amounts)
+
+
+def _add_usage(response: LLMResponse, cost: float | None) -> None:
+    """Charges the response to the current episode; cost None for answers that were not paid for (cached, shared)."""
+    _count(
+        llm_calls=1,
+        llm_cached_calls=cost is None,
+        prompt_tokens=response.usage.get("prompt_tokens", 0),
+        completion_tokens=response.usage.get("completion_tokens", 0),
+        cost_usd=cost or 0.0,
+    )
+
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, LLMClient]" = weakref.WeakKeyDictionary()
+_providers: dict[str, ProviderConfig] = {}
+_cache: list[ResponseCache | None] = []  # The process's response cache, once set up
+
+
+def register_provider(config: ProviderConfig) -> None:
+    """Makes a provider available to every client of this process, existing and future."""
+    _providers[config.name] = config
+    for client in _clients.values():
+        client.add_provider(config)
+
+
+def _process_cache() -> ResponseCache | None:
+    """The response cache of the process, shared by the clients of all its event loops."""
+    if not _cache:
+        cache = ResponseCache.from_env()
+        if cache is not None:
+            atexit.register(cache.close)
+        _cache.append(cache)
+    return _cache[0]
+
+
+def get_client() -> LLMClient:
+    """The client shared by everything running in the current event loop.
+
+    Run the episodes of a process in one loop (Experiment.run with an asyncio.Runner, as the
+    runner's workers do) to keep its connections open from one episode to the next, and call
+    `close_client` before the loop shuts down.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = LLMClient({**default_providers(), **_providers}, cache=_process_cache())
+    return client
+
+
+async def close_client() -> None:
+    """Closes the client of the current event loop, if it has one (the next get_client makes a new one).
+
+    Called by Experiment.run and by the runner's workers before their loop shuts down, while it
+    still runs the callbacks that finish closing the connections.
+    """
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        client.close()
+        await asyncio.sleep(0)  # Lets the transports close
@@ -0,0 +1,165 @@
+"""A small asyncio HTTP/1.1 client with keep-alive connection pooling (standard library only).
+
+Model APIs are slow to answer but cheap to talk to, so the cost to avoid is the TCP and TLS
+handshake per request: connections are kept open and reused, up to `max_per_host` per origin.
+"""
+
+import asyncio
+import gzip
+import json
+import ssl
+import time
+from dataclasses import dataclass, field
+from typing import Any
+from urllib.parse import urlsplit
+
+Origin = tuple[str, str, int]  # (scheme, host, port)
+
+
+@dataclass
+class HTTPResponse:
+    status: int
+    headers: dict[str, str] = field(default_factory=dict)  # Lower-case names
+    body: bytes = b""
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+    @property
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+
+class _Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.last_used = time.monotonic()
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+async def _read_headers(reader: asyncio.StreamReader) -> tuple[int, dict[str, str]]:
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("Connection closed by the server")
+    status = int(status_line.split(b" ", 2)[1])
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return status, headers
+
+
+async def _read_body(reader: asyncio.StreamReader, headers: dict[str, str]) -> tuple[bytes, bool]:
+    """Returns (body, whether the connection can be reused)."""
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        chunks = []
+        while size := int((await reader.readline()).split(b";")[0], 16):
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)  # CRLF after each chunk
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):  # Trailers
+            pass
+        return b"".join(chunks), True
+    if "content-length" in headers:
+        return await reader.readexactly(int(headers["content-length"])), True
+    return await reader.read(), False  # Delimited by the end of the connection
+
+
+class ConnectionPool:
+    """Keeps connections open per origin; at most `max_per_host` requests in flight per origin."""
+
+    def __init__(self, max_per_host: int = 32, connect_timeout: float = 10.0, idle_timeout: float = 60.0) -> None:
+        self.max_per_host = max_per_host
+        self.connect_timeout = connect_timeout
+        self.idle_timeout = idle_timeout
+        self._idle: dict[Origin, list[_Connection]] = {}
+        self._slots: dict[Origin, asyncio.Semaphore] = {}
+        self._ssl_context: ssl.SSLContext | None = None
+        self.connections_opened = 0
+        self.requests_sent = 0
+
+    async def _connect(self, origin: Origin) -> _Connection:
+        scheme, host, port = origin
+        ssl_context = None
+        if scheme == "https":
+            self._ssl_context = self._ssl_context or ssl.create_default_context()
+            ssl_context = self._ssl_context
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=ssl_context, server_hostname=host if ssl_context else None),
+            self.connect_timeout,
+        )
+        self.connections_opened += 1
+        return _Connection(reader, writer)
+
+    def _take_idle(self, origin: Origin) -> _Connection | None:
+        idle = self._idle.get(origin, [])
+        while idle:
+            conn = idle.pop()
+            if time.monotonic() - conn.last_used < self.idle_timeout and not conn.reader.at_eof():
+                return conn
+            conn.close()
+        return None
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str] | None = None,
+        body: bytes | None = None,
+        timeout: float | None = None,
+    ) -> HTTPResponse:
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        origin = (parts.scheme, parts.hostname or "", port)
+        target = parts.path or "/"
+        if parts.query:
+            target += f"?{parts.query}"
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {parts.netloc}", "Accept-Encoding: gzip"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        lines.append(f"Content-Length: {len(body or b'')}")
+        head = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+        slots = self._slots.setdefault(origin, asyncio.Semaphore(self.max_per_host))
+        async with slots:
+            while True:
+                conn = self._take_idle(origin)
+                reused = conn is not None
+                conn = conn or await self._connect(origin)
+                try:
+                    response, reusable = await asyncio.wait_for(self._exchange(conn, head, body, method), timeout)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    conn.close()
+                    if reused:  # The server closed the idle connection meanwhile, try a fresh one
+                        continue
+                    raise
+                except BaseException:
+                    conn.close()
+                    raise
+                self.requests_sent += 1
+                if reusable and response.headers.get("connection", "").lower() != "close":
+                    conn.last_used = time.monotonic()
+                    self._idle.setdefault(origin, []).append(conn)
+                else:
+                    conn.close()
+                return response
+
+    async def _exchange(
+        self, conn: _Connection, head: bytes, body: bytes | None, method: str
+    ) -> tuple[HTTPResponse, bool]:
+        conn.writer.write(head + (body or b""))
+        await conn.writer.drain()
+        status, headers = await _read_headers(conn.reader)
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            return HTTPResponse(status, headers), True
+        content, reusable = await _read_body(conn.reader, headers)
+        if headers.get("content-encoding", "").lower() == "gzip":
+            content = gzip.decompress(content)
+        return HTTPResponse(status, headers, content), reusable
+
+    def close(self) -> None:
+        for idle in self._idle.values():
+            for conn in idle:
+                conn.close()
+        self._idle.clear()
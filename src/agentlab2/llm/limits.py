@@ -0,0 +1,59 @@
+"""Per-provider request limits: concurrent requests, requests and tokens per minute."""
+
+import asyncio
+import time
+
+
+class RateLimiter:
+    """Token bucket refilled at `per_minute` units per minute, holding at most a minute's worth.
+
+    Waiters are served in arrival order, so a large request is not starved by small ones.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self._rate = per_minute / 60.0
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._updated) * self._rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        amount = min(amount, self.capacity)  # A request larger than the budget still goes, alone
+        async with self._lock:
+            self._refill()
+            while self.available < amount:
+                await asyncio.sleep((amount - self.available) / self._rate)
+                self._refill()
+            self.available -= amount
+
+    def adjust(self, amount: float) -> None:
+        """Charges `amount` more (or gives it back, if negative), e.g. actual minus estimated tokens."""
+        self._refill()
+        self.available = min(self.capacity, self.available - amount)
+
+
+class ProviderLimits:
+    """All the limits of one provider: acquire() before each request, hold `concurrency` while it runs."""
+
+    def __init__(
+        self, max_concurrency: int, requests_per_minute: float | None = None, tokens_per_minute: float | None = None
+    ) -> None:
+        self.concurrency = asyncio.Semaphore(max_concurrency)
+        self.requests = RateLimiter(requests_per_minute) if requests_per_minute else None
+        self.tokens = RateLimiter(tokens_per_minute) if tokens_per_minute else None
+
+    async def acquire(self, tokens: float) -> None:
+        """Waits for the request and token budgets (not for a concurrency slot)."""
+        if self.requests is not None:
+            await self.requests.acquire(1)
+        if self.tokens is not None:
+            await self.tokens.acquire(tokens)
+
+    def settle(self, estimated_tokens: float, used_tokens: float) -> None:
+        if self.tokens is not None:
+            self.tokens.adjust(used_tokens - estimated_tokens)
@@ -0,0 +1,161 @@
+"""Local stand-in for an OpenAI-compatible chat completions API, for tests and benchmarks.
+
+    with MockLLMServer(latency_s=0.2, failure_rate=0.1) as server:
+        register_provider(server.provider("mock"))
+        ...  # agents call get_client().chat("mock/any-model", messages)
+
+or from the command line:
+
+    python -m agentlab2.llm.mock_server [--port 8000] [--latency-ms 200] [--failure-rate 0.1]
+
+Replies echo the last user message; failures alternate between 429 (with Retry-After) and 503.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+from agentlab2.llm.client import ProviderConfig
+
+
+def echo_reply(messages: list[dict[str, Any]]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            content = message.get("content")
+            if isinstance(content, list):
+                content = " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+            return f"Mock reply to: {str(content)[:200]}"
+    return "Mock reply"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real APIs
+    disable_nagle_algorithm = True
+    server: "_Server"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, obj: dict[str, Any], headers: dict[str, str] | None = None) -> None:
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        mock = self.server.mock
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+        with mock.lock:
+            mock.requests += 1
+            mock.in_flight += 1
+            mock.max_in_flight = max(mock.max_in_flight, mock.in_flight)
+            fail = mock.random.random() < mock.failure_rate
+            mock.failures += fail
+        try:
+            time.sleep(mock.latency_s)
+            if fail:
+                if mock.failures % 2:
+                    return self._send(429, {"error": {"message": "Rate limit reached"}}, {"Retry-After": "0"})
+                return self._send(503, {"error": {"message": "Overloaded"}})
+            messages = request.get("messages", [])
+            text = mock.reply(messages)
+            prompt_tokens = len(json.dumps(messages)) // 4
+            completion_tokens = len(text) // 4
+            self._send(
+                200,
+                {
+                    "id": f"mock-{mock.requests}",
+                    "object": "chat.completion",
+                    "model": request.get("model", "mock"),
+                    "choices": [
+                        {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+                    ],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                },
+            )
+        finally:
+            with mock.lock:
+                mock.in_flight -= 1
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    mock: "MockLLMServer"
+
+
+class MockLLMServer:
+    """Serves /v1/chat/completions on 127.0.0.1 from a background thread."""
+
+    def __init__(
+        self,
+        port: int = 0,
+        latency_s: float = 0.0,
+        failure_rate: float = 0.0,
+        reply: Callable[[list[dict[str, Any]]], str] = echo_reply,
+        seed: int = 0,
+    ) -> None:
+        self.latency_s = latency_s
+        self.failure_rate = failure_rate
+        self.reply = reply
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = self.failures = self.in_flight = self.max_in_flight = 0
+        self._server = _Server(("127.0.0.1", port), _Handler)
+        self._server.mock = self
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def provider(self, name: str = "mock", **kwargs: Any) -> ProviderConfig:
+        """A provider config pointing at this server; `kwargs` set its limits."""
+        return ProviderConfig(name, self.base_url, backoff_base_s=0.05, **kwargs)
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible chat completions server")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = MockLLMServer(args.port, args.latency_ms / 1000, args.failure_rate)
+    print(f"Mock LLM API at {server.base_url} (Ctrl+C to stop)")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
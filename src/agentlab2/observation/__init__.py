@@ -0,0 +1,39 @@
+from typing import TYPE_CHECKING
+
+from agentlab2._lazy import lazy_exports
+
+if TYPE_CHECKING:
+    from agentlab2.observation.pipeline import ObservationPipeline
+    from agentlab2.observation.screenshot import PendingImage, ScreenshotOptions, encode_screenshot, submit_screenshot
+    from agentlab2.observation.tree import Node, TreeIndex, TreeOptions, TreeSerializer, diff_trees, to_tree
+
+__all__ = [
+    "Node",
+    "ObservationPipeline",
+    "PendingImage",
+    "ScreenshotOptions",
+    "TreeIndex",
+    "TreeOptions",
+    "TreeSerializer",
+    "diff_trees",
+    "encode_screenshot",
+    "submit_screenshot",
+    "to_tree",
+]
+
+__getattr__, __dir__ = lazy_exports(
+    __name__,
+    {
+        "ObservationPipeline": "agentlab2.observation.pipeline",
+        "PendingImage": "agentlab2.observation.screenshot",
+        "ScreenshotOptions": "agentlab2.observation.screenshot",
+        "encode_screenshot": "agentlab2.observation.screenshot",
+        "submit_screenshot": "agentlab2.observation.screenshot",
+        "Node": "agentlab2.observation.tree",
+        "TreeIndex": "agentlab2.observation.tree",
+        "TreeOptions": "agentlab2.observation.tree",
+        "TreeSerializer": "agentlab2.observation.tree",
+        "diff_trees": "agentlab2.observation.tree",
+        "to_tree": "agentlab2.observation.tree",
+    },
+)
@@ -0,0 +1,103 @@
+"""The observation stage between the environment and the agent.
+
+An agent owns an `ObservationPipeline` and returns its output from `Agent.obs_preprocessor`,
+which the episode loop calls on every observation before get_action:
+
+    class MyAgent(Agent):
+        def __init__(self):
+            self.pipeline = ObservationPipeline(tree_keys=("axtree_object",))
+
+        def reset(self, seed=None):
+            self.pipeline.reset()
+
+        def obs_preprocessor(self, obs):
+            return self.pipeline(obs)
+
+        def get_action(self, obs):
+            page = obs["axtree_diff"] if obs["axtree_diff_tokens"] < 500 else obs["axtree_txt"]
+            image_url = obs["screenshot_url"].result()  # or `await obs["screenshot_url"]`
+            ...
+
+For each tree key ("axtree_object" becomes "axtree", "dom_tree" stays "dom_tree"), the
+pipeline adds:
+
+    <name>_txt          the pruned tree as text (see agentlab2.observation.tree)
+    <name>_tokens       its token count
+    <name>_diff         the changes since the previous step, None on the first one
+    <name>_diff_tokens  the token count of the diff
+
+and drops the raw tree, unless `keep_raw_trees`. The screenshot is replaced by
+"screenshot_url": a `PendingImage`, encoded in the background, which the trajectory stores
+once per distinct image. The raw pixels are dropped as soon as the encoding is done, unless
+`keep_raw_screenshot`.
+"""
+
+from collections.abc import Callable
+
+from agentlab2.core import Observation
+from agentlab2.observation.screenshot import ScreenshotOptions, submit_screenshot
+from agentlab2.observation.tree import (
+    TreeIndex,
+    TreeOptions,
+    TreeSerializer,
+    approx_tokens,
+    cached_counter,
+    diff_trees,
+    to_tree,
+)
+
+
+class ObservationPipeline:
+    """Turns raw observations into prompt-ready ones, reusing the work of the previous step."""
+
+    def __init__(
+        self,
+        tree_keys: tuple[str, ...] = ("axtree_object",),
+        screenshot_key: str | None = "screenshot",
+        tree_options: TreeOptions = TreeOptions(),
+        screenshot_options: ScreenshotOptions = ScreenshotOptions(),
+        count_tokens: Callable[[str], int] = approx_tokens,
+        keep_raw_trees: bool = False,
+        keep_raw_screenshot: bool = False,
+    ) -> None:
+        self.tree_keys = tree_keys
+        self.screenshot_key = screenshot_key
+        self.tree_options = tree_options
+        self.screenshot_options = screenshot_options
+        self.keep_raw_trees = keep_raw_trees
+        self.keep_raw_screenshot = keep_raw_screenshot
+        self.count_tokens = cached_counter(count_tokens)  # Shared by the trees and the diffs
+        self._serializers = {key: TreeSerializer(self.count_tokens) for key in tree_keys}
+        self._previous: dict[str, TreeIndex] = {}
+
+    def reset(self) -> None:
+        """Forgets the previous step, at the start of an episode. Memoized text is kept."""
+        self._previous.clear()
+
+    def __call__(self, obs: Observation) -> Observation:
+        obs = dict(obs)
+        screenshot = obs.get(self.screenshot_key) if self.screenshot_key else None
+        if screenshot is not None:
+            # Started first, so that it runs while the trees are processed
+            obs["screenshot_url"] = submit_screenshot(screenshot, self.screenshot_options)
+            if not self.keep_raw_screenshot:
+                del obs[self.screenshot_key]  # The encoder holds the pixels until it is done with them
+        for key in self.tree_keys:
+            raw = obs.get(key)
+            if raw is None:
+                continue
+            name = key.removesuffix("_object")
+            tree = to_tree(raw, self.tree_options)
+            obs[f"{name}_txt"], obs[f"{name}_tokens"] = self._serializers[key].serialize(tree)
+            index = TreeIndex.build(tree)
+            previous = self._previous.get(key)
+            if previous is None:
+                obs[f"{name}_diff"], obs[f"{name}_diff_tokens"] = None, 0
+            else:
+                diff = diff_trees(previous, index)
+                obs[f"{name}_diff"] = diff
+                obs[f"{name}_diff_tokens"] = sum(self.count_tokens(line) for line in diff.splitlines())
+            self._previous[key] = index
+            if not self.keep_raw_trees:
+                del obs[key]
+        return obs
@@ -0,0 +1,200 @@
+"""Screenshot downscaling and encoding, in a thread pool shared by the episodes of a process.
+
+`submit_screenshot` returns at once with a `PendingImage`; the box-filter downscale, the PNG or
+JPEG encoding and the base64 data URL are computed in the background, while the agent does
+its text work. numpy and zlib release the GIL for most of it. A screenshot identical to a
+recent one (pages often do not change between steps) reuses its encoding.
+
+Encoding uses Pillow when it is installed; without it, PNG is written with zlib alone and JPEG
+falls back to PNG, and screenshots that come encoded (PNG/JPEG bytes) are passed on as they
+are, neither decoded nor downscaled, labelled with the format their signature shows.
+"""
+
+import asyncio
+import base64
+import hashlib
+import io
+import logging
+import math
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Literal
+
+logger = logging.getLogger(__name__)
+
+ENCODE_THREADS = 4
+RECENT_ENCODINGS = 32  # Encoded screenshots kept for reuse, per process
+PNG_COMPRESSION_LEVEL = 6
+IMAGE_SIGNATURES = {
+    b"\x89PNG\r\n\x1a\n": "image/png",
+    b"\xff\xd8\xff": "image/jpeg",
+    b"GIF87a": "image/gif",
+    b"GIF89a": "image/gif",
+}
+
+
+@dataclass(frozen=True)
+class ScreenshotOptions:
+    max_width: int = 1280
+    max_height: int = 1280
+    format: Literal["png", "jpeg"] = "png"
+    quality: int = 85  # JPEG only
+
+
+class PendingImage:
+    """A screenshot being encoded; `result()` (or `await`) gives its data URL."""
+
+    def __init__(self, future: "Future[str]", width: int, height: int) -> None:
+        self._future = future
+        self.width = width
+        self.height = height
+
+    def result(self, timeout: float | None = None) -> str:
+        return self._future.result(timeout)
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def decoded(self, timeout: float | None = None) -> tuple[str, bytes]:
+        """The media type and the bytes of the encoded image."""
+        header, _, data = self.result(timeout).partition(",")
+        return header.removeprefix("data:").removesuffix(";base64"), base64.b64decode(data)
+
+    def __await__(self):
+        return asyncio.wrap_future(self._future).__await__()
+
+    def __repr__(self) -> str:
+        return f"PendingImage({self.width}x{self.height})"
+
+
+_executor: ThreadPoolExecutor | None = None
+_executor_pid: int | None = None
+_lock = threading.Lock()
+_recent: OrderedDict[bytes, str] = OrderedDict()
+_warned: set[str] = set()
+
+
+def _warn_once(message: str) -> None:
+    if message not in _warned:
+        _warned.add(message)
+        logger.warning(message)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor, _executor_pid
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():  # A forked worker can't use its parent's threads
+            _executor = ThreadPoolExecutor(ENCODE_THREADS, thread_name_prefix="agentlab2-screenshot")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def scale_factor(width: int, height: int, options: ScreenshotOptions) -> int:
+    """The integer factor screenshots of this size are shrunk by to fit the options' bounds."""
+    return max(1, math.ceil(max(width / options.max_width, height / options.max_height)))
+
+
+def downscale(pixels: Any, factor: int) -> Any:
+    """Shrinks an (height, width[, channels]) uint8 array by `factor`, averaging each factor x factor block."""
+    if factor == 1:
+        return pixels
+    import numpy as np
+
+    height, width = pixels.shape[0] // factor, pixels.shape[1] // factor
+    blocks = pixels[: height * factor, : width * factor].reshape(height, factor, width, factor, *pixels.shape[2:])
+    return (blocks.sum(axis=(1, 3), dtype=np.uint32) // (factor * factor)).astype(np.uint8)
+
+
+def _png(pixels: Any) -> bytes:
+    """PNG with zlib only; each row stores its difference with the one above ("Up" filter)."""
+    import numpy as np
+
+    height, width = pixels.shape[:2]
+    channels = 1 if pixels.ndim == 2 else pixels.shape[2]
+    color_type = {1: 0, 2: 4, 3: 2, 4: 6}[channels]
+    rows = pixels.reshape(height, width * channels)
+    raw = np.empty((height, 1 + width * channels), dtype=np.uint8)
+    raw[:, 0] = 2
+    raw[0, 1:] = rows[0]
+    np.subtract(rows[1:], rows[:-1], out=raw[1:, 1:])  # Wraps around, as the filter expects
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    data = zlib.compress(raw.tobytes(), PNG_COMPRESSION_LEVEL)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", data) + chunk(b"IEND", b"")
+
+
+def image_media_type(data: bytes) -> str:
+    """The MIME type of an encoded image, from its signature (PNG, JPEG, GIF or WebP)."""
+    for signature, media_type in IMAGE_SIGNATURES.items():
+        if data.startswith(signature):
+            return media_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    raise ValueError(f"Unknown image format (starts with {bytes(data[:8])!r})")
+
+
+def encode_screenshot(screenshot: Any, options: ScreenshotOptions = ScreenshotOptions()) -> str:
+    """Downscales and encodes a screenshot (uint8 array, or PNG/JPEG bytes) as a data URL."""
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+    if isinstance(screenshot, (bytes, bytearray)):
+        if Image is None:
+            media_type = image_media_type(screenshot)
+            _warn_once("Pillow is not installed, encoded screenshots are sent as they are, without downscaling")
+            return f"data:{media_type};base64," + base64.b64encode(screenshot).decode("ascii")
+        import numpy as np
+
+        screenshot = np.asarray(Image.open(io.BytesIO(screenshot)).convert("RGB"))
+    pixels = downscale(screenshot, scale_factor(screenshot.shape[1], screenshot.shape[0], options))
+    if Image is None:
+        if options.format == "jpeg":
+            _warn_once("Pillow is not installed, encoding screenshots as PNG instead of JPEG")
+        return "data:image/png;base64," + base64.b64encode(_png(pixels)).decode("ascii")
+    buffer = io.BytesIO()
+    image = Image.fromarray(pixels)
+    if options.format == "jpeg":
+        image.convert("RGB").save(buffer, format="JPEG", quality=options.quality)
+    else:
+        image.save(buffer, format="PNG", compress_level=PNG_COMPRESSION_LEVEL)
+    return f"data:image/{options.format};base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def _encode_recent(screenshot: Any, options: ScreenshotOptions) -> str:
+    if isinstance(screenshot, (bytes, bytearray)):
+        h = hashlib.blake2b(screenshot, digest_size=16)
+    else:
+        import numpy as np
+
+        h = hashlib.blake2b(np.ascontiguousarray(screenshot), digest_size=16)
+    h.update(repr((getattr(screenshot, "shape", None), options)).encode())
+    key = h.digest()
+    with _lock:
+        if key in _recent:
+            _recent.move_to_end(key)
+            return _recent[key]
+    url = encode_screenshot(screenshot, options)
+    with _lock:
+        _recent[key] = url
+        while len(_recent) > RECENT_ENCODINGS:
+            _recent.popitem(last=False)
+    return url
+
+
+def submit_screenshot(screenshot: Any, options: ScreenshotOptions = ScreenshotOptions()) -> PendingImage:
+    """Starts encoding `screenshot` in the background; see `encode_screenshot`."""
+    if isinstance(screenshot, (bytes, bytearray)):
+        width = height = 0  # Known once decoded
+    else:
+        factor = scale_factor(screenshot.shape[1], screenshot.shape[0], options)
+        width, height = screenshot.shape[1] // factor, screenshot.shape[0] // factor
+    return PendingImage(_get_executor().submit(_encode_recent, screenshot, options), width, height)
@@ -0,0 +1,304 @@
+"""Accessibility and DOM trees as compact text, recomputed incrementally from one step to the next.
+
+Trees come in two shapes:
+
+- CDP accessibility trees, {"nodes": [...]} as returned by Accessibility.getFullAXTree (and kept
+  by BrowserGym as axtree_object),
+- nested dicts, {"role" or "tag", "name" or "text", "id", "props", "children": [...]}, for DOM
+  walks and custom environments.
+
+They are pruned while being converted (see `TreeOptions`): ignored nodes and nameless layout
+nodes (generic, none, ...) are replaced by their children, hidden subtrees and text boxes are
+dropped, and StaticText repeating its parent's name goes away. What is left is one line per
+node:
+
+    [12] textbox 'Email', required, value='a@b.c'
+
+Every node carries a digest of its line and of its children's digests (a Merkle hash), so two
+identical subtrees have the same digest whichever step they come from. `TreeSerializer`
+memoizes the text and token count of subtrees by digest: when a step changes one form field,
+only the path from that field to the root is serialized and counted again. `diff_trees` lists
+the nodes added, removed and changed between two steps, matched by id.
+"""
+
+import functools
+import hashlib
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
+from typing import Any
+
+Tree = list["Node"]  # The roots left after pruning, usually one
+TOKEN_CACHE_SIZE = 65536  # Distinct lines whose token count is kept
+
+
+def approx_tokens(text: str) -> int:
+    """Rough token count (4 characters per token), the estimate agentlab2.llm uses too."""
+    return (len(text) + 3) // 4
+
+
+def cached_counter(count_tokens: Callable[[str], int]) -> Callable[[str], int]:
+    """`count_tokens` with its results cached (tokenizers are slow, lines repeat)."""
+    if hasattr(count_tokens, "cache_info"):
+        return count_tokens
+    return functools.lru_cache(maxsize=TOKEN_CACHE_SIZE)(count_tokens)
+
+
+@dataclass(frozen=True)
+class TreeOptions:
+    flatten_roles: frozenset[str] = frozenset({"generic", "none", "presentation", "group", "LineBreak"})
+    drop_roles: frozenset[str] = frozenset({"InlineTextBox", "ListMarker"})
+    props: tuple[str, ...] = (  # Properties shown on the node's line, in this order
+        "value",
+        "checked",
+        "selected",
+        "expanded",
+        "pressed",
+        "disabled",
+        "focused",
+        "required",
+        "url",
+    )
+    drop_hidden: bool = True
+    max_name_length: int = 200  # Longer names are cut, with "..."
+
+
+class Node:
+    """A pruned tree node. Immutable once built: its digest covers the whole subtree."""
+
+    __slots__ = ("id", "role", "name", "props", "children", "line", "digest")
+
+    def __init__(
+        self, id: str | None, role: str, name: str, props: tuple[tuple[str, Any], ...], children: list["Node"]
+    ) -> None:
+        self.id = id
+        self.role = role
+        self.name = name
+        self.props = props
+        self.children = children
+        self.line = _format_line(id, role, name, props)
+        h = hashlib.blake2b(self.line.encode("utf-8"), digest_size=16)
+        for child in children:
+            h.update(child.digest)
+        self.digest = h.digest()
+
+    def __repr__(self) -> str:
+        return f"Node({self.line!r}, {len(self.children)} children)"
+
+
+def _format_line(id: str | None, role: str, name: str, props: tuple[tuple[str, Any], ...]) -> str:
+    parts = [f"[{id}] {role}" if id is not None else role]
+    if name:
+        parts[0] += f" {name!r}"
+    for key, value in props:
+        parts.append(key if value is True else f"{key}={value!r}")
+    return ", ".join(parts)
+
+
+def _make(
+    id: str | None,
+    role: str,
+    name: str,
+    props: dict[str, Any],
+    children: list[Node],
+    ignored: bool,
+    options: TreeOptions,
+) -> list[Node]:
+    """The node after pruning: itself, its children in its place, or nothing."""
+    if role in options.drop_roles or (options.drop_hidden and props.get("hidden") is True):
+        return []
+    if len(name) > options.max_name_length:
+        name = name[: options.max_name_length] + "..."
+    if name:
+        children = [c for c in children if not (c.role == "StaticText" and c.name == name and not c.children)]
+    shown = (
+        tuple((key, props[key]) for key in options.props if props.get(key) not in (None, False, "")) if props else ()
+    )
+    if ignored or (role in options.flatten_roles and not name and not shown):
+        return children
+    if role == "StaticText" and not name and not children:
+        return []
+    return [Node(id, role, name, shown, children)]
+
+
+def _ax_value(field: Any) -> Any:
+    return field.get("value") if isinstance(field, dict) else field
+
+
+def from_cdp(nodes: list[dict[str, Any]], options: TreeOptions = TreeOptions()) -> Tree:
+    """Converts a CDP accessibility tree (the "nodes" list of Accessibility.getFullAXTree)."""
+    by_id = {node["nodeId"]: node for node in nodes}
+    child_ids = {child for node in nodes for child in node.get("childIds", ())}
+
+    def convert(node: dict[str, Any], children: list[Node]) -> list[Node]:
+        props = {p["name"]: _ax_value(p.get("value")) for p in node.get("properties", ())}
+        if "value" in node:
+            props["value"] = _ax_value(node["value"])
+        id = node.get("browsergym_id") or node.get("backendDOMNodeId") or node["nodeId"]
+        return _make(
+            str(id),
+            str(_ax_value(node.get("role")) or ""),
+            str(_ax_value(node.get("name")) or "").strip(),
+            props,
+            children,
+            bool(node.get("ignored")),
+            options,
+        )
+
+    def children(node: dict[str, Any]) -> list[dict[str, Any]]:
+        return [by_id[child] for child in node.get("childIds", ()) if child in by_id]
+
+    roots = [node for node in nodes if node["nodeId"] not in child_ids]
+    return _convert_bottom_up(roots, children, convert)
+
+
+def from_nested(root: dict[str, Any], options: TreeOptions = TreeOptions()) -> Tree:
+    """Converts a nested dict tree: {"role" or "tag", "name" or "text", "id", "props", "children"}."""
+
+    def convert(node: dict[str, Any], children: list[Node]) -> list[Node]:
+        id = node.get("id")
+        return _make(
+            None if id is None else str(id),
+            str(node.get("role") or node.get("tag") or ""),
+            str(node.get("name") or node.get("text") or "").strip(),
+            dict(node.get("props") or node.get("attributes") or {}),
+            children,
+            bool(node.get("ignored")),
+            options,
+        )
+
+    return _convert_bottom_up([root], lambda node: node.get("children", ()), convert)
+
+
+def _convert_bottom_up(
+    roots: list[Any],
+    children: Callable[[Any], Iterable[Any]],
+    convert: Callable[[Any, list[Node]], list[Node]],
+) -> Tree:
+    """Converts raw nodes children first, with a stack instead of recursion: pages nest deeper
+    than Python's recursion limit (long lists of wrappers, comment threads, ...)."""
+    converted: list[list[Node]] = []  # Converted nodes of the raw nodes done, in order
+    stack: list[tuple[Any, int, bool]] = [(root, 0, False) for root in reversed(roots)]
+    while stack:
+        raw, start, expanded = stack.pop()
+        if not expanded:
+            stack.append((raw, len(converted), True))
+            stack.extend((child, 0, False) for child in reversed(list(children(raw))))
+            continue
+        nodes = [node for done in converted[start:] for node in done]
+        del converted[start:]
+        converted.append(convert(raw, nodes))
+    return [node for done in converted for node in done]
+
+
+def to_tree(raw: Any, options: TreeOptions = TreeOptions()) -> Tree:
+    """Converts whichever supported shape `raw` has (see the module docstring)."""
+    if isinstance(raw, Node):
+        return [raw]
+    if isinstance(raw, list) and all(isinstance(node, Node) for node in raw):
+        return raw
+    if isinstance(raw, dict) and isinstance(raw.get("nodes"), list):
+        return from_cdp(raw["nodes"], options)
+    if isinstance(raw, list):
+        return from_cdp(raw, options)
+    if isinstance(raw, dict):
+        return from_nested(raw, options)
+    raise TypeError(f"Unsupported tree: {type(raw).__name__}")
+
+
+class TreeSerializer:
+    """Text and token count of trees, memoized by subtree digest.
+
+    The memo holds the subtrees of the last two trees serialized, which is what the next step
+    can reuse; older entries are dropped. Token counts are summed line by line, so a subtree
+    is counted once whatever follows it.
+    """
+
+    def __init__(self, count_tokens: Callable[[str], int] = approx_tokens, indent: str = "\t") -> None:
+        self.indent = indent
+        self.count_tokens = cached_counter(count_tokens)
+        self._memo: dict[tuple[bytes, int], tuple[str, int]] = {}
+        self._previous: dict[tuple[bytes, int], tuple[str, int]] = {}
+        self.stats = {"nodes": 0, "reused": 0}
+
+    def serialize(self, tree: Tree) -> tuple[str, int]:
+        """Returns (text, tokens) for `tree`."""
+        self._previous, self._memo = self._memo, {}
+        parts = [self._subtree(root, 0) for root in tree]
+        return "\n".join(text for text, _ in parts), sum(tokens for _, tokens in parts)
+
+    def _lookup(self, node: Node, depth: int) -> tuple[str, int] | None:
+        key = (node.digest, depth)
+        hit = self._memo.get(key) or self._previous.get(key)
+        if hit is not None:
+            self.stats["reused"] += 1
+            self._memo[key] = hit
+        return hit
+
+    def _subtree(self, node: Node, depth: int) -> tuple[str, int]:
+        """Text and tokens of a subtree, with a stack instead of recursion (see _convert_bottom_up)."""
+        hit = self._lookup(node, depth)
+        if hit is not None:
+            return hit
+        done: list[tuple[str, int]] = []  # Results of the subtrees finished, in order
+        stack: list[tuple[Node, int, int | None]] = [(node, depth, None)]  # (node, depth, start in done once expanded)
+        while stack:
+            current, level, start = stack.pop()
+            if start is None:
+                hit = self._lookup(current, level) if current is not node else None
+                if hit is not None:
+                    done.append(hit)
+                    continue
+                stack.append((current, level, len(done)))
+                stack.extend((child, level + 1, None) for child in reversed(current.children))
+                continue
+            self.stats["nodes"] += 1
+            line = self.indent * level + current.line
+            texts, tokens = [line], self.count_tokens(line)
+            for text, n in done[start:]:
+                texts.append(text)
+                tokens += n
+            del done[start:]
+            hit = ("\n".join(texts), tokens)
+            self._memo[(current.digest, level)] = hit
+            done.append(hit)
+        return done[0]
+
+
+@dataclass(frozen=True)
+class TreeIndex:
+    """Where each node of a tree is, by id (or by position for nodes without one)."""
+
+    lines: dict[str, str]  # Node key -> line
+    parents: dict[str, str | None]  # Node key -> id of its parent, if the parent has one
+
+    @classmethod
+    def build(cls, tree: Tree) -> "TreeIndex":
+        lines: dict[str, str] = {}
+        parents: dict[str, str | None] = {}
+        for key, parent, node in _walk(tree):
+            lines[key] = node.line
+            parents[key] = parent
+        return cls(lines, parents)
+
+
+def _walk(tree: Tree) -> Iterator[tuple[str, str | None, Node]]:
+    stack: list[tuple[Node, str, str | None]] = [(root, str(i), None) for i, root in reversed(list(enumerate(tree)))]
+    while stack:
+        node, path, parent = stack.pop()
+        key = node.id if node.id is not None else path
+        yield key, parent, node
+        stack.extend((child, f"{path}.{i}", node.id) for i, child in reversed(list(enumerate(node.children))))
+
+
+def diff_trees(old: TreeIndex, new: TreeIndex) -> str:
+    """The nodes added (+), changed (~, new version shown) and removed (-), one per line."""
+    lines = []
+    for key, line in new.lines.items():
+        before = old.lines.get(key)
+        if before is None:
+            parent = new.parents[key]
+            lines.append(f"+ {line}" + (f" (in [{parent}])" if parent is not None else ""))
+        elif before != line:
+            lines.append(f"~ {line}")
+    lines.extend(f"- {line}" for key, line in old.lines.items() if key not in new.lines)
+    return "\n".join(lines)
@@ -0,0 +1,247 @@
+"""Where the time of an episode goes: spans around each phase, counters, and sampled stacks.
+
+With `Study.profile` set, every episode records spans (name, start, duration, args):
+
+    episode        the whole episode; args: its status and counters (below)
+    env_make       making the environment, or env_acquire with an environment pool
+    agent_make     making the agent
+    env_reset      env.reset
+    step           one step; args: {"step": n}
+      agent        agent.get_action, its LLM calls included
+      llm          each LLM call (agentlab2.llm); args: model, token usage, cached
+      env_step     env.step
+      observation  agent.obs_preprocessor
+      trajectory   writing the step
+    env_close      closing the environment, or giving it back to the pool
+
+The total time of each phase goes to the result's info, as "time_<phase>_s" (and from there
+to agentlab2.results), next to the episode's counters: LLM calls, tokens, retries and bytes
+sent and received, and the bytes of trajectory written.
+
+Episodes picked by `ProfileOptions.sample` (a fraction of the episodes, chosen by episode id,
+so the same ones on every run) or listed in `sample_episodes` also run a sampling profiler:
+a thread that reads the stacks of the episode's threads every `sample_interval_s` and turns
+them into nested spans, one track per thread, like py-spy's flame charts. The event loop's
+thread is shared by the episodes a worker runs at once: its stacks show them all.
+
+The spans of every episode are appended to one trace file per study, <study_dir>/trace.json
+by default, in the Trace Event Format that https://ui.perfetto.dev and chrome://tracing open:
+one process per worker, one track per episode. Spans may be added from anywhere an episode
+runs:
+
+    with span("parse_page", url=url) as args:
+        ...
+        args["n_links"] = len(links)
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import AbstractContextManager, nullcontext
+from dataclasses import dataclass
+from typing import Any
+
+from agentlab2.core import current_episode
+
+TRACE_FILENAME = "trace.json"  # <study_dir>/trace.json
+# Trace timestamps are Unix times, so the workers' clocks line up
+_EPOCH = time.time() - time.perf_counter()
+_encode = json.JSONEncoder(separators=(",", ":")).encode
+
+
+@dataclass(frozen=True)
+class ProfileOptions:
+    sample: float = 0.0  # Fraction of the episodes run under the sampling profiler
+    sample_episodes: frozenset[str] = frozenset()  # Episode ids always run under it
+    sample_interval_s: float = 0.005
+    trace_path: str | None = None  # Default: <study_dir>/trace.json, no trace file without a study_dir
+
+    def samples(self, episode_id: str) -> bool:
+        """Whether the episode runs under the sampling profiler."""
+        if episode_id in self.sample_episodes:
+            return True
+        digest = hashlib.blake2b(episode_id.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest) < self.sample * 2**64
+
+
+def _track(episode_id: str) -> int:
+    """The episode's track (trace thread id), the same in every worker; below 2**53, which JSON readers keep exact."""
+    return int.from_bytes(hashlib.blake2b(episode_id.encode("utf-8"), digest_size=6).digest()) << 4
+
+
+class EpisodeProfile:
+    """The spans of one episode, in trace events, and the total time of each phase."""
+
+    def __init__(self, episode_id: str, options: ProfileOptions = ProfileOptions()) -> None:
+        self.episode_id = episode_id
+        self.options = options
+        self.pid = os.getpid()
+        self.tid = _track(episode_id)
+        self.totals: dict[str, float] = {}
+        # (name, track, start, end, args, concurrent), turned into trace events at the end
+        self.spans: list[tuple[str, int, float, float, dict[str, Any] | None, bool]] = []
+        self.threads: set[int] = set()  # Threads the episode runs on, for the sampler
+        self._lock = threading.Lock()
+        self._sampler: _Sampler | None = None
+
+    def add(self, name: str, start: float, end: float, args: dict[str, Any], concurrent: bool = False) -> None:
+        """Records a span (perf_counter times). Concurrent spans may overlap others, e.g. parallel LLM calls."""
+        with self._lock:
+            self.totals[name] = self.totals.get(name, 0.0) + end - start
+            self.spans.append((name, self.tid, start, end, args, concurrent))
+
+    def start_sampling(self) -> None:
+        if self._sampler is None and self.options.samples(self.episode_id):
+            self._sampler = _Sampler(self)
+            self._sampler.start()
+
+    def stop_sampling(self) -> None:
+        if self._sampler is not None and self._sampler.is_alive():
+            self._sampler.stop()
+
+    def info(self) -> dict[str, float]:
+        """Total time per phase, for the result's info."""
+        return {f"time_{name}_s": seconds for name, seconds in self.totals.items() if name != "episode"}
+
+    def trace_events(self) -> list[dict[str, Any]]:
+        """The recorded spans as trace events, with the names of the worker and of the episode's tracks."""
+        pid = self.pid
+        names = {self.tid: self.episode_id}
+        if self._sampler is not None:
+            names.update(self._sampler.tracks)
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": f"worker {pid}"}}]
+        events += [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in names.items()
+        ]
+        for n, (name, tid, start, end, args, concurrent) in enumerate(self.spans):
+            ts = round((_EPOCH + start) * 1e6, 1)  # Unix time in microseconds
+            dur = round((end - start) * 1e6, 1)
+            if concurrent:  # Async events: a track of their own, where they may overlap
+                event = {"name": name, "cat": name, "pid": pid, "tid": tid, "id": f"{tid:x}.{n}"}
+                events.append({**event, "ph": "b", "ts": ts, "args": args or {}})
+                events.append({**event, "ph": "e", "ts": round(ts + dur, 1)})
+            else:
+                events.append(
+                    {"name": name, "ph": "X", "pid": pid, "tid": tid, "ts": ts, "dur": dur, "args": args or {}}
+                )
+        return events
+
+
+class _Span:
+    __slots__ = ("profile", "name", "args", "concurrent", "start")
+
+    def __init__(self, profile: EpisodeProfile, name: str, args: dict[str, Any], concurrent: bool) -> None:
+        self.profile = profile
+        self.name = name
+        self.args = args
+        self.concurrent = concurrent
+
+    def __enter__(self) -> dict[str, Any]:
+        self.start = time.perf_counter()
+        return self.args
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.profile.add(self.name, self.start, time.perf_counter(), self.args, self.concurrent)
+
+
+def span(name: str, concurrent: bool = False, **args: Any) -> AbstractContextManager[dict[str, Any]]:
+    """Times the block as a span of the current episode, if it is profiled; yields the span's args."""
+    episode = current_episode.get()
+    profile = episode.profile if episode is not None else None
+    if profile is None:
+        return nullcontext(args)
+    return _Span(profile, name, args, concurrent)
+
+
+class _Sampler(threading.Thread):
+    """Samples the stacks of the episode's threads, as nested spans on one track per thread."""
+
+    def __init__(self, profile: EpisodeProfile) -> None:
+        super().__init__(name=f"agentlab2-sampler-{profile.episode_id}", daemon=True)
+        self.profile = profile
+        self.tracks: dict[int, str] = {}  # Track -> name
+        self._thread_tracks: dict[int, int] = {}  # Thread -> track
+        self._open: dict[int, list[tuple[str, float]]] = {}  # Thread -> frames on its stack (label, since)
+        self._labels: dict[Any, str] = {}
+        self._stopping = threading.Event()
+
+    def run(self) -> None:
+        interval = self.profile.options.sample_interval_s
+        while not self._stopping.wait(interval):
+            self._sample(sys._current_frames(), time.perf_counter())
+        self._sample({}, time.perf_counter())  # Closes every open frame
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self.join()
+
+    def _label(self, code: Any) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            filename = os.path.basename(code.co_filename)
+            label = self._labels[code] = f"{code.co_qualname} ({filename}:{code.co_firstlineno})"
+        return label
+
+    def _track(self, ident: int) -> int:
+        track = self._thread_tracks.get(ident)
+        if track is None:
+            # Episode tracks are 16 apart (see _track), which leaves room for 15 sampled threads
+            track = self._thread_tracks[ident] = self.profile.tid + 1 + len(self._thread_tracks) % 15
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            self.tracks[track] = f"{self.profile.episode_id} samples: {names.get(ident, ident)}"
+        return track
+
+    def _sample(self, frames: dict[int, Any], now: float) -> None:
+        for ident in self.profile.threads | set(self._open):
+            stack = []
+            frame = frames.get(ident)
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            open_frames = self._open.setdefault(ident, [])
+            common = 0
+            while common < min(len(stack), len(open_frames)) and open_frames[common][0] == stack[common]:
+                common += 1
+            while len(open_frames) > common:
+                label, since = open_frames.pop()
+                with self.profile._lock:
+                    self.profile.spans.append((label, self._track(ident), since, now, None, False))
+            open_frames.extend((label, now) for label in stack[common:])
+
+
+class TraceWriter:
+    """Appends trace events to a JSON array file, across runs of a study.
+
+    The file is a valid trace once closed. While the study runs, or if it was killed, it lacks
+    the closing bracket, which the trace viewers do without.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a+b")
+        self._file.seek(0, os.SEEK_END)
+        self._empty = self._file.tell() == 0
+        if not self._empty:
+            # Reopened: drop the closing bracket, the next events follow the last ones
+            self._file.seek(max(0, self._file.tell() - 3))
+            if self._file.read(3) == b"\n]\n":
+                self._file.truncate(self._file.tell() - 3)
+
+    def write(self, events: list[dict[str, Any]]) -> None:
+        if not events:
+            return
+        text = _encode(events)[1:-1]  # One call for all the events: json.dumps per event is slow
+        self._file.write((("[\n" if self._empty else ",\n") + text).encode("utf-8"))
+        self._file.flush()
+        self._empty = False
+
+    def close(self) -> None:
+        if not self._empty:
+            self._file.write(b"\n]\n")
+        self._file.close()
@@ -0,0 +1,495 @@
+"""Recipes: the agent x task x seed x hyperparameter grid of a study, in a TOML file compiled once.
+
+    # recipes/stub_sweep.toml
+    imports = ["my_agents.py"]  # Files (relative to the recipe) or modules defining the classes
+    seeds = 5                   # range(5), or a list of seeds
+
+    [study]                     # Study settings, see agentlab2.study.Study
+    study_dir = "studies/stub-sweep"
+    episodes_per_worker = 4
+    env_pool = { warm = 1 }
+
+    [[agents]]
+    class = "my_agents:LLMAgentArgs"
+    args = { agent_name = "llm", model = "gpt-4o" }
+    grid = { temperature = [0.0, 0.7], max_tokens = [512, 2048] }  # Every combination
+
+    [[tasks]]
+    class = "agentlab2.envpool.stub:StubTaskArgs"
+    grid = { task_name = ["stub-a", "stub-b"] }
+
+    [[tasks]]
+    suite = "agentlab2.envpool.stub:stub_suite"  # A function returning the tasks
+    args = { n = 100 }
+
+    [[exclude]]                 # Episodes left out: fnmatch patterns on the names, or a seed
+    agent = "llm-temperature=0.7-*"
+    task = "stub-b"
+
+A grid expands to one agent (or task) per combination of its values, named after the name in
+`args` with the values appended, "llm-temperature=0.7-max_tokens=512", unless the name itself
+is in the grid.
+
+compile_recipe validates the whole recipe (classes, argument names, names unique and usable as
+directory names, study settings) and reports every problem at once, then writes the episodes
+to a manifest file keyed by the content hash of the recipe and of the local files it imports:
+launching the recipe again, or from other processes, opens the manifest instead of expanding
+it again. The manifest holds each agent and task once, pickled, and the episodes as records of
+three integers (agent, task, seed), so reading the episodes start:stop costs the same whether
+the grid has a hundred episodes or a hundred thousand:
+
+    manifest = compile_recipe("recipes/stub_sweep.toml")
+    manifest.study().run()
+    start, stop = manifest.shard(index, count)  # E.g. one job of a cluster array
+    manifest.study(start, stop).run()
+
+or `agentlab2 run recipes/stub_sweep.toml --shard 3/16`. Shards running at the same time need a
+study_dir each (the CLI gives them <study_dir>/shard-3-of-16): a journal resumes one run at a
+time. To spread one study over machines, see agentlab2.distributed instead.
+"""
+
+import dataclasses
+import fnmatch
+import hashlib
+import importlib
+import importlib.util
+import io
+import itertools
+import json
+import logging
+import os
+import pickle
+import struct
+import sys
+import time
+from array import array
+from typing import TYPE_CHECKING, Any
+
+from agentlab2.core import AgentArgs, TaskArgs
+
+if TYPE_CHECKING:
+    from agentlab2.study import ManifestStudy
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_DIRNAME = ".manifests"  # Next to the recipe, unless AGENTLAB2_MANIFEST_DIR is set
+MANIFEST_MAGIC = b"AL2MANI\x01"  # The last byte is the format version
+RECIPE_KEYS = {"imports", "seeds", "study", "agents", "tasks", "exclude"}
+ENTRY_KEYS = {"class", "suite", "args", "grid"}
+EXCLUDE_KEYS = {"agent", "task", "seed"}
+STUDY_KEYS = {
+    "max_steps",
+    "n_workers",
+    "episodes_per_worker",
+    "episode_timeout",
+    "study_dir",
+    "max_attempts",
+    "retry_backoff_s",
+    "env_pool",
+    "profile",
+}
+
+
+class RecipeError(ValueError):
+    """A recipe that does not compile; `problems` lists all that was found wrong with it."""
+
+    def __init__(self, path: str, problems: list[str]) -> None:
+        self.path = path
+        self.problems = problems
+        super().__init__(f"{path}: {len(problems)} problem(s)\n  " + "\n  ".join(problems))
+
+
+def load_module(target: str, base_dir: str = "") -> Any:
+    """The module at "path/to/file.py" (relative to `base_dir`), or named "package.module".
+
+    A file is registered under its base name, so that worker processes can unpickle the
+    classes it defines.
+    """
+    if not (target.endswith(".py") or os.path.sep in target):
+        return importlib.import_module(target)
+    path = os.path.join(base_dir, target)
+    module_name = os.path.splitext(os.path.basename(path))[0]
+    module = sys.modules.get(module_name)
+    if module is not None and os.path.abspath(getattr(module, "__file__", "") or "") == os.path.abspath(path):
+        return module
+    module_spec = importlib.util.spec_from_file_location(module_name, path)
+    if module_spec is None or module_spec.loader is None or not os.path.exists(path):
+        raise ImportError(f"Cannot load {path}")
+    module = importlib.util.module_from_spec(module_spec)
+    sys.modules[module_name] = module
+    module_spec.loader.exec_module(module)
+    return module
+
+
+def _resolve(ref: Any) -> Any:
+    """The object named by "package.module:name"."""
+    if not isinstance(ref, str) or ":" not in ref:
+        raise ValueError(f'{ref!r} is not "package.module:name"')
+    target, _, name = ref.partition(":")
+    try:
+        return getattr(importlib.import_module(target), name)
+    except AttributeError:
+        raise ValueError(f"{target} has no {name!r}") from None
+
+
+def _local_files(recipe: dict[str, Any], base_dir: str) -> list[str]:
+    return [
+        os.path.abspath(os.path.join(base_dir, target))
+        for target in recipe.get("imports", [])
+        if isinstance(target, str) and (target.endswith(".py") or os.path.sep in target)
+    ]
+
+
+def read_recipe(path: str) -> dict[str, Any]:
+    import tomllib
+
+    try:
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    except tomllib.TOMLDecodeError as e:
+        raise RecipeError(path, [f"invalid TOML: {e}"]) from None
+
+
+def recipe_hash(path: str, recipe: dict[str, Any] | None = None) -> str:
+    """Hash of the recipe's content (comments and layout aside) and of the local files it imports."""
+    recipe = read_recipe(path) if recipe is None else recipe
+    digest = hashlib.sha256(MANIFEST_MAGIC)
+    digest.update(json.dumps(recipe, sort_keys=True, default=str).encode("utf-8"))
+    for file in _local_files(recipe, os.path.dirname(os.path.abspath(path))):
+        try:
+            with open(file, "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            pass  # Reported by compile_recipe
+    return digest.hexdigest()[:20]
+
+
+def _format_value(value: Any) -> str:
+    return value if isinstance(value, str) else json.dumps(value, separators=(",", ":"))
+
+
+def _expand(entry: Any, where: str, base: type, name_field: str, problems: list[str]) -> list[Any]:
+    """The agents (or tasks) of one [[agents]] (or [[tasks]]) entry."""
+    if not isinstance(entry, dict):
+        problems.append(f"{where}: expected a table")
+        return []
+    if unknown := entry.keys() - ENTRY_KEYS:
+        problems.append(f"{where}: unknown key(s) {', '.join(sorted(unknown))}")
+    args, grid = entry.get("args", {}), entry.get("grid", {})
+    if not isinstance(args, dict) or not isinstance(grid, dict):
+        problems.append(f"{where}: args and grid must be tables")
+        return []
+    for key, values in grid.items():
+        if not isinstance(values, list) or not values:
+            problems.append(f"{where}.grid.{key}: expected a non-empty list of values")
+            return []
+    if ("class" in entry) == ("suite" in entry):
+        problems.append(f"{where}: expected either class or suite")
+        return []
+
+    if "suite" in entry:
+        if grid:
+            problems.append(f"{where}: a suite takes args, not a grid")
+        try:
+            items = list(_resolve(entry["suite"])(**args))
+        except Exception as e:
+            problems.append(f"{where}.suite: {type(e).__name__}: {e}")
+            return []
+        if wrong := [type(item).__name__ for item in items if not isinstance(item, base)]:
+            problems.append(f"{where}.suite: returned {wrong[0]}, not {base.__name__}")
+            return []
+        return items
+
+    try:
+        cls = _resolve(entry["class"])
+    except Exception as e:
+        problems.append(f"{where}.class: {type(e).__name__}: {e}")
+        return []
+    if not (isinstance(cls, type) and issubclass(cls, base) and dataclasses.is_dataclass(cls)):
+        problems.append(f"{where}.class: {entry['class']} is not a dataclass subclassing {base.__name__}")
+        return []
+    fields = {field.name for field in dataclasses.fields(cls) if field.init}
+    if unknown := (args.keys() | grid.keys()) - fields:
+        problems.append(f"{where}: {cls.__name__} has no argument(s) {', '.join(sorted(unknown))}")
+        return []
+    if name_field not in args and name_field not in grid:
+        problems.append(f"{where}: {name_field} missing from args and grid")
+        return []
+
+    keys = list(grid)
+    items = []
+    for values in itertools.product(*(grid[key] for key in keys)):
+        kwargs = {**args, **dict(zip(keys, values))}
+        if name_field not in grid:
+            kwargs[name_field] += "".join(f"-{key}={_format_value(value)}" for key, value in zip(keys, values))
+        try:
+            items.append(cls(**kwargs))
+        except Exception as e:
+            problems.append(f"{where}: {cls.__name__}({kwargs[name_field]!r}, ...): {type(e).__name__}: {e}")
+            return []  # The other combinations likely fail the same way
+    return items
+
+
+def _check_names(items: list[Any], kind: str, name_field: str, problems: list[str]) -> None:
+    seen = set()
+    for item in items:
+        name = getattr(item, name_field)
+        if not isinstance(name, str) or not name or os.path.sep in name or "__" in name:
+            problems.append(f"{kind}: {name!r} is not a valid name (non-empty, no {os.path.sep!r}, no '__')")
+        elif name in seen:
+            problems.append(f"{kind}: {name!r} appears more than once")
+        seen.add(name)
+
+
+def _check_settings(settings: Any, problems: list[str]) -> None:
+    if not isinstance(settings, dict):
+        problems.append("study: expected a table")
+        return
+    if unknown := settings.keys() - STUDY_KEYS:
+        problems.append(f"study: unknown setting(s) {', '.join(sorted(unknown))}")
+    try:
+        _study_options(settings)
+    except Exception as e:
+        problems.append(f"study: {type(e).__name__}: {e}")
+
+
+def _study_options(settings: dict[str, Any]) -> dict[str, Any]:
+    """The recipe's study settings as Study arguments."""
+    options = {key: value for key, value in settings.items() if key in STUDY_KEYS}
+    if isinstance(options.get("env_pool"), dict):
+        from agentlab2.envpool.pool import EnvPoolOptions
+
+        options["env_pool"] = EnvPoolOptions(**options["env_pool"])
+    if isinstance(options.get("profile"), dict):
+        from agentlab2.profiling import ProfileOptions
+
+        profile = dict(options["profile"])
+        profile["sample_episodes"] = frozenset(profile.get("sample_episodes", ()))
+        options["profile"] = ProfileOptions(**profile)
+    return options
+
+
+def _excluded(rules: Any, agents: list[AgentArgs], tasks: list[TaskArgs], seeds: list[int], problems: list[str]):
+    """Per [[exclude]] rule, the indices of the agents, tasks and seeds it matches."""
+    if not isinstance(rules, list):
+        problems.append("exclude: expected an array of tables")
+        return []
+    matches = []
+    for n, rule in enumerate(rules):
+        if not isinstance(rule, dict) or not rule or rule.keys() - EXCLUDE_KEYS:
+            problems.append(f"exclude[{n}]: expected a table of {', '.join(sorted(EXCLUDE_KEYS))}")
+            continue
+        pattern = str(rule.get("agent", "*"))
+        agent_ids = {i for i, agent in enumerate(agents) if fnmatch.fnmatchcase(agent.agent_name, pattern)}
+        pattern = str(rule.get("task", "*"))
+        task_ids = {i for i, task in enumerate(tasks) if fnmatch.fnmatchcase(task.task_name, pattern)}
+        seed_ids = {i for i, seed in enumerate(seeds) if "seed" not in rule or seed == rule["seed"]}
+        if not (agent_ids and task_ids and seed_ids):
+            problems.append(f"exclude[{n}]: matches no episode")
+        matches.append((agent_ids, task_ids, seed_ids))
+    return matches
+
+
+def compile_recipe(path: str, cache_dir: str | None = None, force: bool = False) -> "Manifest":
+    """The manifest of the recipe at `path`, compiled now unless a manifest of the same content exists.
+
+    Raises RecipeError listing every problem of an invalid recipe.
+    """
+    recipe = read_recipe(path)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    if cache_dir is None:
+        cache_dir = os.environ.get("AGENTLAB2_MANIFEST_DIR") or os.path.join(base_dir, MANIFEST_DIRNAME)
+    name = os.path.splitext(os.path.basename(path))[0]
+    manifest_path = os.path.join(cache_dir, f"{name}-{recipe_hash(path, recipe)}.manifest")
+    if force or not os.path.exists(manifest_path):
+        start = time.perf_counter()
+        n_episodes = _compile(path, recipe, base_dir, manifest_path)
+        logger.info(
+            "Compiled %s: %d episode(s) in %.2fs, to %s", path, n_episodes, time.perf_counter() - start, manifest_path
+        )
+    return Manifest(manifest_path)
+
+
+def _compile(path: str, recipe: dict[str, Any], base_dir: str, manifest_path: str) -> int:
+    problems: list[str] = []
+    if unknown := recipe.keys() - RECIPE_KEYS:
+        problems.append(f"unknown key(s) {', '.join(sorted(unknown))}")
+
+    imports = recipe.get("imports", [])
+    if not isinstance(imports, list):
+        problems.append("imports: expected a list")
+        imports = []
+    resolved_imports = []
+    for target in imports:
+        try:
+            load_module(target, base_dir)
+        except Exception as e:
+            problems.append(f"imports: {target}: {type(e).__name__}: {e}")
+        else:
+            local = target.endswith(".py") or os.path.sep in target
+            resolved_imports.append(os.path.abspath(os.path.join(base_dir, target)) if local else target)
+
+    seeds = recipe.get("seeds", [0])
+    if isinstance(seeds, int) and not isinstance(seeds, bool):
+        seeds = list(range(seeds))
+    if not isinstance(seeds, list) or not seeds or not all(type(seed) is int for seed in seeds):
+        problems.append("seeds: expected a number of seeds or a non-empty list of integers")
+        seeds = []
+    elif len(set(seeds)) != len(seeds):
+        problems.append("seeds: duplicate seeds")
+
+    settings = recipe.get("study", {})
+    _check_settings(settings, problems)
+
+    expanded = {}
+    for kind, base, name_field in (("agents", AgentArgs, "agent_name"), ("tasks", TaskArgs, "task_name")):
+        entries = recipe.get(kind)
+        if not isinstance(entries, list) or not entries:
+            problems.append(f"{kind}: expected at least one [[{kind}]] entry")
+            entries = []
+        items = []
+        for n, entry in enumerate(entries):
+            items += _expand(entry, f"{kind}[{n}]", base, name_field, problems)
+        _check_names(items, kind, name_field, problems)
+        expanded[kind] = items
+    agents, tasks = expanded["agents"], expanded["tasks"]
+    rules = _excluded(recipe.get("exclude", []), agents, tasks, seeds, problems)
+    if problems:
+        raise RecipeError(path, problems)
+
+    indices = itertools.product(range(len(agents)), range(len(tasks)), range(len(seeds)))
+    if rules:
+        indices = (
+            (a, t, s)
+            for a, t, s in indices
+            if not any(a in agent_ids and t in task_ids and s in seed_ids for agent_ids, task_ids, seed_ids in rules)
+        )
+    records = array("I", itertools.chain.from_iterable(indices))
+    if not records:
+        raise RecipeError(path, ["exclude: leaves no episode"])
+    header = {
+        "recipe": os.path.abspath(path),
+        "imports": resolved_imports,
+        "study": settings,
+        "seeds": seeds,
+        "n_episodes": len(records) // 3,
+    }
+    _write_manifest(manifest_path, header, agents, tasks, records)
+    return header["n_episodes"]
+
+
+def _write_manifest(
+    path: str, header: dict[str, Any], agents: list[AgentArgs], tasks: list[TaskArgs], records: array
+) -> None:
+    """magic, header length (uint64), pickled header, pickled agents and tasks, records (uint32)."""
+    data = io.BytesIO()
+    offsets = []
+    for item in itertools.chain(agents, tasks):
+        blob = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+        offsets.append((data.tell(), len(blob)))
+        data.write(blob)
+    header = {**header, "agents": offsets[: len(agents)], "tasks": offsets[len(agents) :], "records": data.tell()}
+    if sys.byteorder == "big":
+        records.byteswap()  # Records are little-endian
+    data.write(records.tobytes())
+    header_blob = pickle.dumps(header, protocol=pickle.HIGHEST_PROTOCOL)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MANIFEST_MAGIC + struct.pack("<Q", len(header_blob)) + header_blob)
+        f.write(data.getbuffer())
+    os.replace(tmp_path, path)  # Processes compiling the same recipe at once write the same file
+
+
+class Manifest:
+    """The episodes of a compiled recipe, read by index: agents and tasks are unpickled as needed."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            if self._file.read(len(MANIFEST_MAGIC)) != MANIFEST_MAGIC:
+                raise ValueError(f"{path} is not a manifest of this version of agentlab2, compile its recipe again")
+            (header_size,) = struct.unpack("<Q", self._file.read(8))
+            header = pickle.loads(self._file.read(header_size))
+        except BaseException:
+            self._file.close()
+            raise
+        self._data = len(MANIFEST_MAGIC) + 8 + header_size
+        self.recipe_path: str = header["recipe"]
+        self.settings: dict[str, Any] = header["study"]
+        self.seeds: list[int] = header["seeds"]
+        self._n_episodes: int = header["n_episodes"]
+        self._offsets = {"agents": header["agents"], "tasks": header["tasks"]}
+        self._records: int = header["records"]
+        self._loaded: dict[tuple[str, int], Any] = {}
+        for target in header["imports"]:  # The classes of the agents and tasks
+            load_module(target)
+
+    def __len__(self) -> int:
+        return self._n_episodes
+
+    def __enter__(self) -> "Manifest":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._file.close()
+
+    @property
+    def n_agents(self) -> int:
+        return len(self._offsets["agents"])
+
+    @property
+    def n_tasks(self) -> int:
+        return len(self._offsets["tasks"])
+
+    def _load(self, kind: str, index: int) -> Any:
+        item = self._loaded.get((kind, index))
+        if item is None:
+            offset, size = self._offsets[kind][index]
+            self._file.seek(self._data + offset)
+            item = self._loaded[kind, index] = pickle.loads(self._file.read(size))
+        return item
+
+    def agent(self, index: int) -> AgentArgs:
+        return self._load("agents", index)
+
+    def task(self, index: int) -> TaskArgs:
+        return self._load("tasks", index)
+
+    def entries(self, start: int = 0, stop: int | None = None) -> list[tuple[AgentArgs, TaskArgs, int]]:
+        """The (agent, task, seed) of the episodes start:stop."""
+        start, stop, _ = slice(start, stop).indices(self._n_episodes)
+        records = array("I")
+        if stop > start:
+            self._file.seek(self._data + self._records + 12 * start)
+            records.frombytes(self._file.read(12 * (stop - start)))
+            if sys.byteorder == "big":
+                records.byteswap()
+        return [
+            (self.agent(records[i]), self.task(records[i + 1]), self.seeds[records[i + 2]])
+            for i in range(0, len(records), 3)
+        ]
+
+    def shard(self, index: int, count: int) -> tuple[int, int]:
+        """The (start, stop) of shard `index` of `count` equal shards, 0-based."""
+        if not 0 <= index < count:
+            raise ValueError(f"Shard {index} of {count} does not exist")
+        return self._n_episodes * index // count, self._n_episodes * (index + 1) // count
+
+    def study(self, start: int = 0, stop: int | None = None, **overrides: Any) -> "ManifestStudy":
+        """A study of the episodes start:stop, with the recipe's settings (`overrides` take precedence)."""
+        from agentlab2.study import ManifestStudy
+
+        return ManifestStudy(
+            agents=(),
+            tasks=(),
+            manifest_path=self.path,
+            start=start,
+            stop=stop,
+            **{**_study_options(self.settings), **overrides},
+        )
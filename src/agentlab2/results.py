@@ -0,0 +1,355 @@
+"""Study results as columns, for leaderboards over tens of thousands of episodes.
+
+`ResultsTable.load(study_dir)` reads the summary.json of every finished episode (never the
+trajectories) into one numpy array per field:
+
+    episode_id, agent_name, task_name, status                         strings
+    seed, n_steps, llm_calls, prompt_tokens, completion_tokens,       int64
+    llm_retries
+    reward, duration_s, cost_usd, time_<phase>_s                      float64
+    success                                                           bool
+
+(time_<phase>_s: env_reset, env_step, observation, agent, llm; zero for episodes run without
+profiling, see agentlab2.profiling).
+
+The table is kept in <study_dir>/results/, named after the study's content hash: a digest of
+the journal (or, without one, of the sizes and modification times of the summaries). Loading
+an unchanged study again reads that one file; once more episodes have finished, only their
+summaries are read, the other rows come from the previous table.
+
+`ResultsTable.aggregate` groups the episodes by any columns (agent x task by default) and
+computes success rates with bootstrap confidence intervals, reward, step-count distributions,
+duration, token and cost totals, and the mean time per phase of profiled episodes, with numpy
+operations over all the groups at once. The
+bootstrap draws its resamples in batches of replicates, each batch one array operation for
+every group. Aggregates of a loaded study are cached next to its table.
+
+    table = ResultsTable.load("studies/my_study")
+    print(table.aggregate(by=("agent_name",)).format())
+    table.to_arrow()  # with pyarrow installed
+
+Needs numpy.
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError("agentlab2.results needs numpy: pip install numpy") from e
+
+from agentlab2.journal import JOURNAL_FILENAME
+from agentlab2.trajectory import EPISODES_DIRNAME, SUMMARY_FILENAME
+
+logger = logging.getLogger(__name__)
+
+RESULTS_DIRNAME = "results"  # <study_dir>/results/
+TABLE_VERSION = 2  # Part of the content hash: bump when the columns change
+READ_THREADS = 16
+BOOTSTRAP_BATCH = 2**22  # Values resampled per batch (32 MB of indices)
+
+# Column -> dtype, and where it comes from in summary.json (EpisodeResult.to_dict)
+COLUMNS: dict[str, Any] = {
+    "episode_id": np.str_,
+    "agent_name": np.str_,
+    "task_name": np.str_,
+    "seed": np.int64,
+    "status": np.str_,
+    "reward": np.float64,
+    "success": np.bool_,
+    "n_steps": np.int64,
+    "duration_s": np.float64,
+    "llm_calls": np.int64,  # From the result's info (see agentlab2.llm.client)
+    "prompt_tokens": np.int64,
+    "completion_tokens": np.int64,
+    "cost_usd": np.float64,
+    "llm_retries": np.int64,
+    "time_env_reset_s": np.float64,  # From profiled episodes (see agentlab2.profiling)
+    "time_env_step_s": np.float64,
+    "time_observation_s": np.float64,
+    "time_agent_s": np.float64,
+    "time_llm_s": np.float64,
+}
+PHASES = ("env_reset", "env_step", "observation", "agent", "llm")
+INFO_COLUMNS = frozenset(
+    {"llm_calls", "prompt_tokens", "completion_tokens", "cost_usd", "llm_retries", *(f"time_{p}_s" for p in PHASES)}
+)
+FINGERPRINT = "__fingerprint__"  # Per-row version of the summary, stored with the table
+
+
+def _summary_entries(study_dir: str) -> list[tuple[str, str, str]]:
+    """(episode_id, summary path, fingerprint) of every episode with a result, sorted by episode."""
+    journal_path = os.path.join(study_dir, JOURNAL_FILENAME)
+    if os.path.exists(journal_path):
+        db = sqlite3.connect(f"file:{journal_path}?mode=ro", uri=True)
+        try:
+            rows = db.execute(
+                "SELECT episode_id, result_path, attempts, updated_at FROM episodes "
+                "WHERE result_path IS NOT NULL ORDER BY episode_id"
+            ).fetchall()
+        finally:
+            db.close()
+        return [(episode_id, os.path.join(study_dir, path), f"{a}:{t!r}") for episode_id, path, a, t in rows]
+    entries = []
+    for path in glob.glob(os.path.join(study_dir, EPISODES_DIRNAME, "*", SUMMARY_FILENAME)):
+        stat = os.stat(path)
+        entries.append((os.path.basename(os.path.dirname(path)), path, f"{stat.st_mtime_ns}:{stat.st_size}"))
+    return sorted(entries)
+
+
+def content_hash(entries: list[tuple[str, str, str]]) -> str:
+    h = hashlib.sha256(f"v{TABLE_VERSION}\n".encode())
+    for episode_id, _, fingerprint in entries:
+        h.update(f"{episode_id}\t{fingerprint}\n".encode())
+    return h.hexdigest()
+
+
+def _read_summary(path: str) -> dict[str, Any] | None:
+    try:
+        with open(path) as f:
+            summary = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Could not read %s: %s", path, e)
+        return None
+    info = summary.get("info") or {}
+    return {name: info.get(name, 0) if name in INFO_COLUMNS else summary.get(name) for name in COLUMNS}
+
+
+class ResultsTable:
+    """Columns of equal length, by name. Tables loaded from a study know its content hash."""
+
+    def __init__(self, columns: dict[str, np.ndarray], study_dir: str | None = None, digest: str | None = None) -> None:
+        self.columns = columns
+        self.study_dir = study_dir
+        self.digest = digest
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def where(self, mask: np.ndarray) -> "ResultsTable":
+        """The rows where `mask` is true, e.g. table.where(table["status"] == "done")."""
+        return ResultsTable({name: column[mask] for name, column in self.columns.items()})
+
+    def to_arrow(self) -> Any:
+        import pyarrow as pa
+
+        return pa.table(self.columns)
+
+    @classmethod
+    def empty(cls) -> "ResultsTable":
+        return cls({name: np.array([], dtype=dtype) for name, dtype in COLUMNS.items()})
+
+    @classmethod
+    def load(cls, study_dir: str, use_cache: bool = True) -> "ResultsTable":
+        """The results of every episode of the study that has one (the last attempt's)."""
+        entries = _summary_entries(study_dir)
+        digest = content_hash(entries)
+        cache_dir = os.path.join(study_dir, RESULTS_DIRNAME)
+        cache_path = os.path.join(cache_dir, f"table-{digest[:16]}.npz")
+        if use_cache and os.path.exists(cache_path):
+            with np.load(cache_path, allow_pickle=False) as data:
+                return cls({name: data[name] for name in COLUMNS}, study_dir, digest)
+
+        # Rows whose summary did not change since the last table are taken from it
+        previous: dict[str, np.ndarray] = {}
+        if use_cache:
+            for path in glob.glob(os.path.join(cache_dir, "table-*.npz")):
+                with np.load(path, allow_pickle=False) as data:
+                    if set(COLUMNS) <= set(data.files):  # Not from an older version with other columns
+                        previous = {name: data[name] for name in (*COLUMNS, FINGERPRINT)}
+        known = {}
+        if previous:
+            known = {
+                (episode_id, fingerprint): i
+                for i, (episode_id, fingerprint) in enumerate(zip(previous["episode_id"], previous[FINGERPRINT]))
+            }
+        reuse = [
+            (row, known[episode_id, fp]) for row, (episode_id, _, fp) in enumerate(entries) if (episode_id, fp) in known
+        ]
+        reused_rows = {row for row, _ in reuse}
+        to_read = [(row, entries[row]) for row in range(len(entries)) if row not in reused_rows]
+        with ThreadPoolExecutor(READ_THREADS) as executor:
+            summaries = list(executor.map(_read_summary, [path for _, (_, path, _) in to_read]))
+        read = [(row, summary) for (row, _), summary in zip(to_read, summaries) if summary is not None]
+        logger.info("Results of %s: %d episode(s) read, %d from the previous table", study_dir, len(read), len(reuse))
+
+        rows = np.array([row for row, _ in reuse] + [row for row, _ in read], dtype=np.int64)
+        order = np.argsort(rows, kind="stable")
+        columns = {}
+        for name, dtype in COLUMNS.items():
+            old = previous[name][[i for _, i in reuse]] if reuse else np.array([], dtype=dtype)
+            new = np.array([summary[name] for _, summary in read], dtype=dtype)
+            columns[name] = np.concatenate([old, new]).astype(dtype, copy=False)[order]
+        fingerprints = np.array([entries[row][2] for row in rows[order]], dtype=np.str_)
+        table = cls(columns, study_dir, digest)
+        if use_cache:
+            table._save(cache_path, fingerprints)
+        return table
+
+    def _save(self, path: str, fingerprints: np.ndarray) -> None:
+        """Writes the table and drops the tables and aggregates of older versions of the study."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, **self.columns, **{FINGERPRINT: fingerprints})
+        os.replace(tmp_path, path)
+        for old in glob.glob(os.path.join(os.path.dirname(path), "*.npz")):
+            if self.digest[:16] not in os.path.basename(old):
+                os.remove(old)
+
+    def aggregate(
+        self,
+        by: Sequence[str] = ("agent_name", "task_name"),
+        n_boot: int = 1000,
+        confidence: float = 0.95,
+        seed: int = 0,
+    ) -> "ResultsTable":
+        """One row per group of episodes with the same values of `by` (one row in all for by=()).
+
+        Errors, timeouts and crashes count as failures; n_errors tells how many there were.
+        Success rate bounds are bootstrap percentiles over `n_boot` resamples of each group.
+        When some episodes were profiled, time_<phase>_mean_s is the mean time per episode of
+        each phase over them (episodes without any phase time are left out).
+        """
+        cache_path = None
+        if self.study_dir is not None and self.digest is not None:
+            params = json.dumps([list(by), n_boot, confidence, seed])
+            key = hashlib.sha256(params.encode()).hexdigest()[:16]
+            cache_path = os.path.join(self.study_dir, RESULTS_DIRNAME, f"aggregate-{self.digest[:16]}-{key}.npz")
+            if os.path.exists(cache_path):
+                with np.load(cache_path, allow_pickle=False) as data:
+                    return ResultsTable({name: data[name] for name in data.files})
+
+        keys, group, counts = _group(self, by)
+        n_groups = len(counts)
+
+        def total(values: np.ndarray) -> np.ndarray:
+            return np.bincount(group, weights=values, minlength=n_groups)
+
+        success = self["success"].astype(np.float64)
+        steps = self["n_steps"].astype(np.float64)
+        success_low, success_high = bootstrap_ci(success, group, counts, n_boot, confidence, seed)
+        steps_q = _group_quantiles(steps, group, counts, (0.5, 0.9, 1.0))
+        columns = {
+            **keys,
+            "n_episodes": counts,
+            "n_errors": total(self["status"] != "done").astype(np.int64),
+            "success_rate": total(success) / counts,
+            "success_ci_low": success_low,
+            "success_ci_high": success_high,
+            "mean_reward": total(self["reward"]) / counts,
+            "steps_mean": total(steps) / counts,
+            "steps_p50": steps_q[0.5],
+            "steps_p90": steps_q[0.9],
+            "steps_max": steps_q[1.0],
+            "duration_mean_s": total(self["duration_s"]) / counts,
+            "llm_calls": total(self["llm_calls"]).astype(np.int64),
+            "prompt_tokens": total(self["prompt_tokens"]).astype(np.int64),
+            "completion_tokens": total(self["completion_tokens"]).astype(np.int64),
+            "cost_usd": total(self["cost_usd"]),
+        }
+        columns["cost_per_episode_usd"] = columns["cost_usd"] / counts
+        columns["llm_retries"] = total(self["llm_retries"]).astype(np.int64)
+        phase_times = {phase: self[f"time_{phase}_s"] for phase in PHASES}
+        profiled = np.logical_or.reduce([times > 0 for times in phase_times.values()])
+        if profiled.any():
+            n_profiled = total(profiled.astype(np.float64))
+            with np.errstate(invalid="ignore", divide="ignore"):
+                for phase, times in phase_times.items():
+                    columns[f"time_{phase}_mean_s"] = total(np.where(profiled, times, 0.0)) / n_profiled
+        table = ResultsTable(columns)
+        if cache_path is not None:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            np.savez(f"{cache_path}.tmp.npz", **columns)
+            os.replace(f"{cache_path}.tmp.npz", cache_path)
+        return table
+
+    def format(self, max_rows: int = 50, float_digits: int = 3) -> str:
+        """The table as aligned text, e.g. to print a leaderboard."""
+        names = list(self.columns)
+        cells = [names]
+        for i in range(min(len(self), max_rows)):
+            row = []
+            for name in names:
+                value = self.columns[name][i]
+                row.append(f"{value:.{float_digits}f}" if isinstance(value, np.floating) else str(value))
+            cells.append(row)
+        widths = [max(len(row[j]) for row in cells) for j in range(len(names))]
+        lines = ["  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in cells]
+        if len(self) > max_rows:
+            lines.append(f"... {len(self) - max_rows} more row(s)")
+        return "\n".join(lines)
+
+
+def _group(table: ResultsTable, by: Sequence[str]) -> tuple[dict[str, np.ndarray], np.ndarray, np.ndarray]:
+    """(key columns of the groups, group of each row, size of each group)."""
+    n = len(table)
+    if not by:
+        return {}, np.zeros(n, dtype=np.int64), np.array([n] if n else [], dtype=np.int64)
+    uniques, codes = [], []
+    for name in by:
+        unique, code = np.unique(table[name], return_inverse=True)
+        uniques.append(unique)
+        codes.append(code.reshape(-1))
+    group_codes, group = np.unique(np.stack(codes, axis=1), axis=0, return_inverse=True)
+    group = group.reshape(-1)
+    keys = {name: unique[group_codes[:, j]] for j, (name, unique) in enumerate(zip(by, uniques))}
+    return keys, group, np.bincount(group, minlength=len(group_codes))
+
+
+def _starts(counts: np.ndarray) -> np.ndarray:
+    return np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+
+
+def _group_quantiles(
+    values: np.ndarray, group: np.ndarray, counts: np.ndarray, quantiles: Sequence[float]
+) -> dict[float, np.ndarray]:
+    """Per-group quantiles (linear interpolation), from one sort of all the values."""
+    ordered = values[np.lexsort((values, group))]
+    starts = _starts(counts)
+    result = {}
+    for q in quantiles:
+        position = starts + q * (counts - 1)
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        result[q] = ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+    return result
+
+
+def bootstrap_ci(
+    values: np.ndarray, group: np.ndarray, counts: np.ndarray, n_boot: int, confidence: float, seed: int = 0
+) -> tuple[np.ndarray, np.ndarray]:
+    """Percentile bootstrap interval of the mean of `values` in each group.
+
+    The values are laid out group after group; a batch of replicates is one (replicates x
+    values) array of indices, each drawn within its own group, and the group sums of every
+    replicate come from one np.add.reduceat.
+    """
+    n_groups = len(counts)
+    if n_groups == 0 or n_boot == 0:
+        return np.full(n_groups, np.nan), np.full(n_groups, np.nan)
+    rng = np.random.default_rng(seed)
+    order = np.argsort(group, kind="stable")
+    ordered = values[order].astype(np.float64)
+    starts = _starts(counts)
+    column_group = group[order]
+    column_start, column_count = starts[column_group], counts[column_group]
+    means = np.empty((n_boot, n_groups), dtype=np.float32)
+    batch = max(1, BOOTSTRAP_BATCH // len(values))
+    for first in range(0, n_boot, batch):
+        size = min(batch, n_boot - first)
+        indices = column_start + (rng.random((size, len(values))) * column_count).astype(np.int64)
+        means[first : first + size] = np.add.reduceat(ordered[indices], starts, axis=1) / counts
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(means, [alpha, 1 - alpha], axis=0)
+    return low.astype(np.float64), high.astype(np.float64)
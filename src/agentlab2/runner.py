@@ -0,0 +1,344 @@
+"""Runs experiments across a pool of worker processes.
+
+Each worker is a long-lived process that runs one experiment at a time (or several, as
+coroutines, see `episodes_per_worker`) and sends back its `EpisodeResult`. The parent
+enforces the per-episode timeout: a worker that overruns it is killed together with its
+process group (the browser or app it launched), and when a worker dies (segfault, OOM kill)
+its episodes are reported as crashed. Either way a fresh worker takes its place, so one bad
+episode never stalls or takes down the rest of the study.
+
+Work comes from an `ExperimentQueue`; subclasses decide the order and what to retry (see
+agentlab2.journal.JournalQueue). With an environment pool (see agentlab2.envpool), each
+worker keeps warm environments, and experiments go preferably to a worker that already ran
+their task.
+
+A study runs its queue on an `Executor`: `LocalExecutor`, the worker processes of this
+machine, by default; agentlab2.distributed spreads it over several machines.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from multiprocessing.connection import Connection, wait
+
+from agentlab2.envpool.pool import EnvPool, EnvPoolOptions
+from agentlab2.experiment import EpisodeResult, EpisodeStatus, Experiment, close_loop_client
+
+logger = logging.getLogger(__name__)
+
+KILL_GRACE_S = 5.0  # Time a killed worker gets to exit before it is given up on
+ORPHAN_CHECK_S = 1.0  # How often workers check that the parent is still there
+
+
+class ExperimentQueue:
+    """The experiments still to run, in order. Told about every result, so subclasses can retry."""
+
+    def __init__(self, experiments: Iterable[Experiment]) -> None:
+        self._pending = deque(experiments)
+
+    def pop(self) -> Experiment | None:
+        """The next experiment to run, None if none is ready now."""
+        return self._pending.popleft() if self._pending else None
+
+    def ready_in(self) -> float:
+        """Seconds until pop() has something again (inf: not before another report())."""
+        return 0.0 if self._pending else float("inf")
+
+    def report(self, experiment: Experiment, result: EpisodeResult) -> None:
+        """Called with the result of every experiment returned by pop()."""
+
+
+def default_n_workers() -> int:
+    """All the cores this process may use."""
+    return os.process_cpu_count() or 1
+
+
+def _exit_with_parent(parent_pid: int) -> None:
+    """Kills this worker's process group once the parent is gone (killed, OOM), even mid-episode."""
+    while os.getppid() == parent_pid:
+        time.sleep(ORPHAN_CHECK_S)
+    if hasattr(os, "killpg"):
+        os.killpg(0, signal.SIGKILL)
+    os._exit(1)
+
+
+def _recv(conn: Connection) -> tuple[Experiment, float | None] | None:
+    try:
+        return conn.recv()
+    except EOFError:  # Parent went away
+        return None
+
+
+async def _run_with_timeout(
+    conn: Connection, experiment: Experiment, timeout: float | None, env_pool: EnvPool | None
+) -> None:
+    started = time.monotonic()
+    try:
+        result = await asyncio.wait_for(experiment.arun(env_pool=env_pool), timeout)
+    except TimeoutError:
+        logger.warning("Episode %s timed out after %ss", experiment.episode_id, timeout)
+        result = experiment.result(
+            "timeout", duration_s=time.monotonic() - started, error=f"Timed out after {timeout}s"
+        )
+    conn.send(result)
+
+
+async def _serve_concurrently(conn: Connection, env_pool: EnvPool | None) -> None:
+    """Runs every experiment received as a task of this event loop, as soon as it arrives."""
+    loop = asyncio.get_running_loop()
+    tasks: set[asyncio.Task] = set()
+    while (message := await loop.run_in_executor(None, _recv, conn)) is not None:
+        task = asyncio.create_task(_run_with_timeout(conn, *message, env_pool))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    for task in tasks:
+        task.cancel()
+    await close_loop_client()
+
+
+def _worker_main(conn: Connection, parent_pid: int, capacity: int, env_pool_options: EnvPoolOptions | None) -> None:
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()  # Own process group, so a kill also reaches the environment's child processes
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C is handled by the parent
+    threading.Thread(target=_exit_with_parent, args=(parent_pid,), daemon=True).start()
+    env_pool = EnvPool(env_pool_options) if env_pool_options is not None else None
+    if capacity > 1:
+        asyncio.run(_serve_concurrently(conn, env_pool))
+        if env_pool is not None:
+            env_pool.close()
+        # Every result is sent; don't wait for the threads of timed out episodes at interpreter exit
+        os._exit(0)
+    with asyncio.Runner() as runner:  # One event loop for all the episodes: connections stay open between them
+        while (message := _recv(conn)) is not None:
+            experiment, _ = message  # The parent enforces the timeout
+            conn.send(experiment.run(env_pool, runner))
+        runner.run(close_loop_client())
+    if env_pool is not None:
+        env_pool.close()
+
+
+class _Worker:
+    """A worker process and the experiments it is running (at most `capacity`)."""
+
+    def __init__(
+        self, mp_context: multiprocessing.context.BaseContext, capacity: int, env_pool: EnvPoolOptions | None
+    ) -> None:
+        self.capacity = capacity
+        self.conn, child_conn = mp_context.Pipe()
+        self.process = mp_context.Process(
+            target=_worker_main, args=(child_conn, os.getpid(), capacity, env_pool), name="agentlab2-worker"
+        )
+        self.process.start()
+        child_conn.close()
+        self.running: dict[str, tuple[Experiment, float, float]] = {}  # episode_id -> (experiment, start, deadline)
+        self.tasks: set[str] = set()  # Tasks it ran, whose environments its pool may hold
+
+    def submit(self, experiment: Experiment, timeout: float | None) -> bool:
+        """Sends the experiment to the worker; False if the worker is gone, without the experiment."""
+        if not self.process.is_alive():
+            return False
+        started = time.monotonic()
+        deadline = float("inf")
+        if timeout:
+            # Concurrent workers time out their own episodes; the kill is the last resort
+            deadline = started + timeout + (KILL_GRACE_S if self.capacity > 1 else 0.0)
+        self.running[experiment.episode_id] = (experiment, started, deadline)
+        try:
+            self.conn.send((experiment, timeout))
+        except OSError:  # Died since is_alive()
+            del self.running[experiment.episode_id]
+            return False
+        self.tasks.add(repr(experiment.task_args))
+        return True
+
+    def receive(self) -> tuple[list[tuple[Experiment, EpisodeResult]], bool]:
+        """The results the worker sent since the last call, and whether its pipe is broken."""
+        results = []
+        try:
+            while self.running and self.conn.poll():
+                result = self.conn.recv()
+                results.append((self.running.pop(result.episode_id)[0], result))
+        except (EOFError, OSError):
+            return results, True
+        return results, False
+
+    def crashed(self) -> list[tuple[Experiment, EpisodeResult]]:
+        """Results for the experiments of a worker that died."""
+        self.process.join(KILL_GRACE_S)
+        exitcode = self.process.exitcode
+        logger.warning("Worker died running %s (exit code %s)", ", ".join(self.running), exitcode)
+        return self.lost_results("crashed", f"Worker process died with exit code {exitcode}")
+
+    @property
+    def deadline(self) -> float:
+        return min((deadline for _, _, deadline in self.running.values()), default=float("inf"))
+
+    def kill(self) -> None:
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(self.process.pid, signal.SIGKILL)
+            else:
+                self.process.kill()
+        except ProcessLookupError:
+            pass
+        self.process.join(KILL_GRACE_S)
+        self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(KILL_GRACE_S)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+    def lost_results(self, status: EpisodeStatus, error: str) -> list[tuple[Experiment, EpisodeResult]]:
+        """Results for the experiments that were running when the worker died or was killed."""
+        now = time.monotonic()
+        results = []
+        for experiment, started, deadline in self.running.values():
+            episode_status: EpisodeStatus = "timeout" if status == "timeout" and now >= deadline else "crashed"
+            results.append((experiment, experiment.result(episode_status, duration_s=now - started, error=error)))
+        self.running.clear()
+        return results
+
+
+def run_parallel(
+    experiments: Iterable[Experiment] | ExperimentQueue,
+    n_workers: int | None = None,
+    episode_timeout: float | None = None,
+    mp_context: multiprocessing.context.BaseContext | None = None,
+    episodes_per_worker: int = 1,
+    env_pool: EnvPoolOptions | None = None,
+) -> Iterator[EpisodeResult]:
+    """Runs `experiments` on `n_workers` processes and yields their results as they finish.
+
+    With episodes_per_worker > 1 each worker runs that many episodes at once, as coroutines of
+    one event loop (see Experiment.arun); worth it when episodes mostly wait on model calls.
+    With `env_pool` each worker keeps the environments of its tasks warm (see agentlab2.envpool).
+    With n_workers=0 the experiments run one after the other in this process (for debugging;
+    the timeout is not enforced).
+    """
+    queue = experiments if isinstance(experiments, ExperimentQueue) else ExperimentQueue(experiments)
+    n_workers = default_n_workers() if n_workers is None else n_workers
+    if n_workers == 0:
+        pool = EnvPool(env_pool) if env_pool is not None else None
+        runner = asyncio.Runner()
+        try:
+            while (wait_s := queue.ready_in()) != float("inf"):
+                time.sleep(wait_s)
+                while (experiment := queue.pop()) is not None:
+                    result = experiment.run(pool, runner)
+                    queue.report(experiment, result)
+                    yield result
+        finally:
+            runner.run(close_loop_client())
+            runner.close()
+            if pool is not None:
+                pool.close()
+        return
+
+    mp_context = mp_context or multiprocessing.get_context()
+    workers: list[_Worker] = []
+    try:
+        while True:
+            while any(len(w.running) < w.capacity for w in workers) or len(workers) < n_workers:
+                experiment = queue.pop()
+                if experiment is None:
+                    break
+                # Fill started workers first, preferring one that ran the task (its environment may
+                # be warm), then start new ones (also in place of killed ones)
+                while True:
+                    free = [w for w in workers if len(w.running) < w.capacity]
+                    task = repr(experiment.task_args)
+                    worker = next((w for w in free if task in w.tasks), free[0] if free else None)
+                    if worker is None:
+                        worker = _Worker(mp_context, episodes_per_worker, env_pool)
+                        workers.append(worker)
+                    if worker.submit(experiment, episode_timeout):
+                        break
+                    # The worker died since its results were last read (one of its episodes crashed
+                    # it): its episodes are lost, the experiment goes to another worker
+                    results = worker.receive()[0] + worker.crashed()
+                    worker.kill()
+                    workers.remove(worker)
+                    for lost_experiment, result in results:
+                        queue.report(lost_experiment, result)
+                        yield result
+
+            busy = [worker for worker in workers if worker.running]
+            wait_s = min([worker.deadline for worker in busy] + [queue.ready_in() + time.monotonic()])
+            if not busy and wait_s == float("inf"):
+                break
+            wait_s = max(0.0, wait_s - time.monotonic())
+            ready = wait(
+                [worker.conn for worker in busy] + [worker.process.sentinel for worker in busy],
+                timeout=None if wait_s == float("inf") else wait_s,
+            )
+            for worker in busy:
+                results, broken = worker.receive()
+                lost = "crashed" if broken else None
+                if lost is None and worker.process.sentinel in ready and worker.running:
+                    lost = "crashed"
+                if lost is None and time.monotonic() >= worker.deadline:
+                    lost = "timeout"
+                if lost == "crashed":
+                    results += worker.crashed()
+                elif lost == "timeout":
+                    logger.warning("Killing the worker running %s: timed out", ", ".join(worker.running))
+                    results += worker.lost_results("timeout", f"Timed out after {episode_timeout}s")
+                if lost:
+                    worker.kill()
+                    workers.remove(worker)
+                for experiment, result in results:
+                    queue.report(experiment, result)
+                    yield result
+    finally:
+        for worker in workers:
+            if worker.running:
+                worker.kill()
+            else:
+                worker.stop()
+
+
+class Executor(ABC):
+    """Runs the experiments of a queue somewhere and yields their results as they finish."""
+
+    @abstractmethod
+    def run(
+        self,
+        queue: ExperimentQueue,
+        episode_timeout: float | None = None,
+        episodes_per_worker: int = 1,
+        env_pool: EnvPoolOptions | None = None,
+    ) -> Iterator[EpisodeResult]:
+        """Runs until the queue is exhausted (see run_parallel for the arguments)."""
+
+
+@dataclass(frozen=True)
+class LocalExecutor(Executor):
+    """Worker processes on this machine (see run_parallel)."""
+
+    n_workers: int | None = None
+
+    def run(
+        self,
+        queue: ExperimentQueue,
+        episode_timeout: float | None = None,
+        episodes_per_worker: int = 1,
+        env_pool: EnvPoolOptions | None = None,
+    ) -> Iterator[EpisodeResult]:
+        return run_parallel(
+            queue, self.n_workers, episode_timeout, episodes_per_worker=episodes_per_worker, env_pool=env_pool
+        )
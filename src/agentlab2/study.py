@@ -0,0 +1,141 @@
+"""A study: every agent on every task with every seed, run in parallel."""
+
+import itertools
+import logging
+import os
+from collections.abc import Iterator, Sequence
+from dataclasses import dataclass
+
+from agentlab2.core import AgentArgs, TaskArgs
+from agentlab2.envpool.pool import EnvPoolOptions
+from agentlab2.experiment import EpisodeResult, Experiment
+from agentlab2.journal import Journal, JournalQueue
+from agentlab2.profiling import TRACE_FILENAME, ProfileOptions, TraceWriter
+from agentlab2.recipe import Manifest
+from agentlab2.runner import Executor, ExperimentQueue, LocalExecutor
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Study:
+    """The agent x task x seed grid of experiments and how to run it.
+
+    n_workers: worker processes (default: all cores), 0 runs everything in this process.
+    episodes_per_worker: episodes each worker runs at once, as coroutines (see Experiment.arun).
+        Raise it for agents that mostly wait on model calls (AsyncAgent).
+    episode_timeout: seconds after which an episode is killed and reported as "timeout".
+    study_dir: where to save the trajectories (see agentlab2.trajectory) and the progress
+        journal (see agentlab2.journal), None to keep neither. Running a study again with
+        the same study_dir resumes it: finished episodes are not run again.
+    max_attempts: with a study_dir, runs per episode before a failure (error, timeout, crash)
+        is final.
+    retry_backoff_s: wait before the first retry of a failed episode, doubled on each retry.
+    env_pool: keep environments warm and reuse them across the episodes of a task, instead of
+        launching one per episode (see agentlab2.envpool).
+    profile: time the phases of every step, sample the stacks of some episodes, and write it
+        all to a trace file, <study_dir>/trace.json by default (see agentlab2.profiling).
+    executor: where the episodes run, by default LocalExecutor(n_workers), the worker processes
+        of this machine; agentlab2.distributed.BrokerExecutor spreads them over several machines.
+    """
+
+    agents: Sequence[AgentArgs]
+    tasks: Sequence[TaskArgs]
+    seeds: Sequence[int] = (0,)
+    max_steps: int = 30
+    n_workers: int | None = None
+    episodes_per_worker: int = 1
+    episode_timeout: float | None = None
+    study_dir: str | None = None
+    max_attempts: int = 3
+    retry_backoff_s: float = 30.0
+    env_pool: EnvPoolOptions | None = None
+    profile: ProfileOptions | None = None
+    executor: Executor | None = None
+
+    def experiments(self) -> list[Experiment]:
+        return [
+            Experiment(agent_args, task_args, seed, self.max_steps, self.study_dir, self.profile)
+            for agent_args, task_args, seed in itertools.product(self.agents, self.tasks, self.seeds)
+        ]
+
+    @property
+    def trace_path(self) -> str | None:
+        if self.profile is None:
+            return None
+        if self.profile.trace_path is None and self.study_dir is not None:
+            return os.path.join(self.study_dir, TRACE_FILENAME)
+        return self.profile.trace_path
+
+    def iter_results(self, journal: Journal | None = None) -> Iterator[EpisodeResult]:
+        """Yields the results of the episodes run now (retries included), in the order they finish."""
+        experiments = self.experiments()
+        if journal is not None:
+            queue = JournalQueue(journal, experiments, self.max_attempts, self.retry_backoff_s)
+            logger.info("Running %d episode(s), %d already finished", len(queue), queue.n_skipped)
+        else:
+            queue = ExperimentQueue(experiments)
+            logger.info("Running %d episode(s)", len(experiments))
+        executor = self.executor if self.executor is not None else LocalExecutor(self.n_workers)
+        results = executor.run(
+            queue, self.episode_timeout, episodes_per_worker=self.episodes_per_worker, env_pool=self.env_pool
+        )
+        trace = TraceWriter(self.trace_path) if self.trace_path is not None else None
+        pooled, hits, reset_s = 0, 0, []
+        try:
+            for n, result in enumerate(results, 1):
+                logger.info("[%d] %s: %s", n, result.episode_id, result.status)
+                if "env_pool" in result.info:
+                    pooled += 1
+                    hits += result.info["env_pool"] == "hit"
+                if "env_reset_s" in result.info:
+                    reset_s.append(result.info["env_reset_s"])
+                if result.trace is not None:
+                    if trace is not None:
+                        trace.write(result.trace)
+                    result.trace = None
+                yield result
+        finally:
+            if trace is not None:
+                trace.close()
+                logger.info("Trace written to %s", trace.path)
+        if pooled:
+            logger.info(
+                "Environment pool: %.0f%% hits over %d episode(s), %.3fs per reset",
+                100 * hits / pooled,
+                pooled,
+                sum(reset_s) / len(reset_s),
+            )
+
+    def run(self) -> list[EpisodeResult]:
+        """Runs (or resumes) the study and returns the last result of every episode, in experiment order."""
+        if self.study_dir is None:
+            results = {result.episode_id: result for result in self.iter_results()}
+            return [results[experiment.episode_id] for experiment in self.experiments()]
+
+        journal = Journal(self.study_dir)
+        try:
+            for _ in self.iter_results(journal):
+                pass
+            logger.info("Study finished: %s", journal.counts())
+            results = [journal.load_result(experiment.episode_id) for experiment in self.experiments()]
+        finally:
+            journal.close()
+        return [result for result in results if result is not None]
+
+
+@dataclass
+class ManifestStudy(Study):
+    """The episodes start:stop of a compiled recipe (see agentlab2.recipe), instead of agents x tasks x seeds."""
+
+    manifest_path: str = ""
+    start: int = 0
+    stop: int | None = None
+
+    def experiments(self) -> list[Experiment]:
+        with Manifest(self.manifest_path) as manifest:
+            entries = manifest.entries(self.start, self.stop)
+        return [
+            Experiment(agent_args, task_args, seed, self.max_steps, self.study_dir, self.profile)
+            for agent_args, task_args, seed in entries
+        ]
@@ -0,0 +1,279 @@
+"""Streaming trajectory storage.
+
+Each episode is written step by step, as it runs, to <study_dir>/episodes/<episode_id>/:
+
+    steps.bin          step records (zlib-compressed JSON), appended one after the other
+    index/<name>.bin   one fixed-width little-endian column per indexed field (see INDEX_COLUMNS)
+    summary.json       the EpisodeResult, written when the episode ends
+
+A step record holds the observation the agent saw, its action and agent_info (LLM inputs and
+outputs), and what the environment returned. Binary payloads in it (screenshots and other
+arrays, raw bytes, encoded screenshots) go to a content-addressed `BlobStore` in
+<study_dir>/blobs/, so an unchanged screenshot is stored once however many steps and episodes
+show it. Payloads under BLOB_MIN_BYTES stay in the record (arrays as JSON lists, bytes in
+base64), a file each would cost more than they do. A screenshot still being encoded (a `PendingImage` of agentlab2.observation) is
+waited for, on the writer's thread, and stored as the encoded image with its media type.
+
+Nothing is ever rewritten, so memory use does not grow with the episode, and a crash loses
+at most the step being written: readers only see the steps whose index entry is complete.
+`TrajectoryReader` memory-maps the index and decodes one step record at a time.
+"""
+
+import array
+import base64
+import hashlib
+import json
+import mmap
+import os
+import sys
+import time
+import zlib
+from collections.abc import Iterator
+from typing import Any
+
+from agentlab2.observation.screenshot import PendingImage
+
+EPISODES_DIRNAME = "episodes"  # <study_dir>/episodes/<episode_id>/
+BLOBS_DIRNAME = "blobs"  # <study_dir>/blobs/, shared by the episodes of a study
+STEPS_FILENAME = "steps.bin"
+INDEX_DIRNAME = "index"
+SUMMARY_FILENAME = "summary.json"
+BLOB_KEY = "__blob__"
+BYTES_KEY = "__bytes__"  # Small bytes stored inline, base64-encoded
+BLOB_MIN_BYTES = 1024  # Smaller arrays and bytes stay inline
+COMPRESSION_LEVEL = 1  # Screenshots dominate the volume; fast beats small here
+
+# Index column -> array typecode (fixed width, stored little-endian)
+INDEX_COLUMNS = {
+    "offset": "Q",  # Start of the step record in steps.bin
+    "length": "I",  # Compressed size of the step record
+    "timestamp": "d",  # Unix time the step was written
+    "reward": "d",
+    "terminated": "B",
+    "truncated": "B",
+}
+
+
+class BlobStore:
+    """Content-addressed, write-once storage: <root>/<sha256[:2]>/<sha256>, zlib-compressed."""
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self._known: set[str] = set()  # Digests already on disk, saves a stat per repeated screenshot
+        self.bytes_written = 0  # Compressed bytes of the blobs this instance wrote
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        if digest in self._known:
+            return digest
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                self.bytes_written += f.write(zlib.compress(data, COMPRESSION_LEVEL))
+            os.replace(tmp_path, path)  # Concurrent writers of the same blob write the same bytes
+        self._known.add(digest)
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        with open(self.path(digest), "rb") as f:
+            return zlib.decompress(f.read())
+
+
+class BlobRef:
+    """A binary payload of a step record, loaded from the blob store only when asked for."""
+
+    def __init__(
+        self,
+        store: BlobStore,
+        digest: str,
+        dtype: str | None = None,
+        shape: list[int] | None = None,
+        media_type: str | None = None,  # Of an encoded image, e.g. "image/png"
+    ):
+        self.store = store
+        self.digest = digest
+        self.dtype = dtype
+        self.shape = shape
+        self.media_type = media_type
+
+    def load(self) -> Any:
+        """Returns the bytes, or a numpy array if the payload was one (and numpy is installed)."""
+        data = self.store.get(self.digest)
+        if self.dtype is None:
+            return data
+        try:
+            import numpy as np
+        except ImportError:
+            return data
+        return np.frombuffer(data, dtype=self.dtype).reshape(self.shape)
+
+    def __repr__(self) -> str:
+        if self.media_type is not None:
+            return f"BlobRef({self.digest[:12]}, media_type={self.media_type})"
+        return f"BlobRef({self.digest[:12]}, dtype={self.dtype}, shape={self.shape})"
+
+
+def _encoder(store: BlobStore):
+    def default(value: Any) -> Any:
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            data = bytes(value)
+            if len(data) < BLOB_MIN_BYTES:
+                return {BYTES_KEY: base64.b64encode(data).decode("ascii")}
+            return {BLOB_KEY: store.put(data)}
+        if hasattr(value, "dtype") and hasattr(value, "tobytes"):  # numpy arrays and scalars
+            if value.shape == () or value.nbytes < BLOB_MIN_BYTES:
+                return value.tolist()
+            return {BLOB_KEY: store.put(value.tobytes()), "dtype": str(value.dtype), "shape": list(value.shape)}
+        if isinstance(value, PendingImage):
+            media_type, data = value.decoded()
+            return {BLOB_KEY: store.put(data), "media_type": media_type}
+        if isinstance(value, (set, frozenset)):
+            return list(value)
+        return repr(value)
+
+    return default
+
+
+def write_summary(episode_dir: str, summary: dict[str, Any]) -> None:
+    """Writes summary.json atomically."""
+    os.makedirs(episode_dir, exist_ok=True)
+    path = os.path.join(episode_dir, SUMMARY_FILENAME)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(summary, f, default=repr)
+    os.replace(f"{path}.tmp", path)
+
+
+class TrajectoryWriter:
+    """Appends the steps of one episode to `episode_dir`, replacing any earlier trajectory there."""
+
+    def __init__(self, episode_dir: str, blob_store: BlobStore) -> None:
+        self.episode_dir = episode_dir
+        self.blob_store = blob_store
+        os.makedirs(os.path.join(episode_dir, INDEX_DIRNAME), exist_ok=True)
+        summary_path = os.path.join(episode_dir, SUMMARY_FILENAME)
+        if os.path.exists(summary_path):
+            os.remove(summary_path)
+        self._steps = open(os.path.join(episode_dir, STEPS_FILENAME), "wb")
+        self._columns = {
+            name: open(os.path.join(episode_dir, INDEX_DIRNAME, f"{name}.bin"), "wb") for name in INDEX_COLUMNS
+        }
+        self._encode = json.JSONEncoder(default=_encoder(blob_store), separators=(",", ":")).encode
+        self.n_steps = 0
+        self.bytes_written = 0  # Step records and index entries, blobs not included
+
+    def add_step(self, record: dict[str, Any], reward: float = 0.0, terminated: bool = False, truncated: bool = False):
+        payload = zlib.compress(self._encode(record).encode("utf-8"), COMPRESSION_LEVEL)
+        offset = self._steps.tell()
+        self._steps.write(payload)
+        self._steps.flush()  # The record is complete before its index entry exists
+        values = {
+            "offset": offset,
+            "length": len(payload),
+            "timestamp": time.time(),
+            "reward": reward,
+            "terminated": terminated,
+            "truncated": truncated,
+        }
+        for name, typecode in INDEX_COLUMNS.items():
+            column = array.array(typecode, [values[name]])
+            if sys.byteorder == "big":
+                column.byteswap()
+            self.bytes_written += self._columns[name].write(column.tobytes())
+            self._columns[name].flush()
+        self.bytes_written += len(payload)
+        self.n_steps += 1
+
+    def close(self, summary: dict[str, Any] | None = None) -> None:
+        """Closes the files; `summary` (the episode result) marks the trajectory as complete."""
+        self._steps.close()
+        for column in self._columns.values():
+            column.close()
+        if summary is not None:
+            write_summary(self.episode_dir, summary)
+
+    def __enter__(self) -> "TrajectoryWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        if not self._steps.closed:
+            self.close()
+
+
+def _map(path: str) -> mmap.mmap | bytes:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""  # Empty files cannot be mapped
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class TrajectoryReader:
+    """Lazy access to a trajectory written by TrajectoryWriter."""
+
+    def __init__(self, episode_dir: str, blob_store: BlobStore) -> None:
+        self.episode_dir = episode_dir
+        self.blob_store = blob_store
+        self._steps = _map(os.path.join(episode_dir, STEPS_FILENAME))
+        self._index = {name: _map(os.path.join(episode_dir, INDEX_DIRNAME, f"{name}.bin")) for name in INDEX_COLUMNS}
+        # A step counts once every column has its entry and its record is in steps.bin
+        self.n_steps = min(len(data) // array.array(INDEX_COLUMNS[name]).itemsize for name, data in self._index.items())
+        offsets, lengths = self.column("offset"), self.column("length")
+        while self.n_steps and offsets[self.n_steps - 1] + lengths[self.n_steps - 1] > len(self._steps):
+            self.n_steps -= 1
+
+    def __len__(self) -> int:
+        return self.n_steps
+
+    def column(self, name: str) -> memoryview | array.array:
+        """An index column, zero-copy over the mapped file (copied only on big-endian machines)."""
+        typecode = INDEX_COLUMNS[name]
+        data = self._index[name]
+        itemsize = array.array(typecode).itemsize
+        view = memoryview(data)[: self.n_steps * itemsize]
+        if sys.byteorder == "little":
+            return view.cast(typecode)
+        column = array.array(typecode, view.tobytes())
+        column.byteswap()
+        return column
+
+    def step(self, i: int) -> dict[str, Any]:
+        """Decodes step `i`; binary payloads are returned as BlobRef (see BlobRef.load()), small bytes as bytes."""
+        if not 0 <= i < self.n_steps:
+            raise IndexError(f"Step {i} out of range ({self.n_steps} steps)")
+        offset, length = self.column("offset")[i], self.column("length")[i]
+        payload = zlib.decompress(self._steps[offset : offset + length])
+        return json.loads(payload, object_hook=self._decode_blob)
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        for i in range(self.n_steps):
+            yield self.step(i)
+
+    def summary(self) -> dict[str, Any] | None:
+        """The episode result, None while the episode is unfinished (or if it was interrupted)."""
+        try:
+            with open(os.path.join(self.episode_dir, SUMMARY_FILENAME)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _decode_blob(self, obj: dict[str, Any]) -> Any:
+        if BLOB_KEY in obj:
+            return BlobRef(self.blob_store, obj[BLOB_KEY], obj.get("dtype"), obj.get("shape"), obj.get("media_type"))
+        if BYTES_KEY in obj:
+            return base64.b64decode(obj[BYTES_KEY])
+        return obj
+
+    def close(self) -> None:
+        for data in (self._steps, *self._index.values()):
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+    def __enter__(self) -> "TrajectoryReader":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
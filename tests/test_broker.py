@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+from agentlab2.distributed import BrokerExecutor, SQLiteBroker
+from agentlab2.envpool import NoopAgentArgs, StubTaskArgs
+from agentlab2.experiment import Experiment
+from agentlab2.study import Study
+
+
+@pytest.fixture
+def broker(tmp_path):
+    broker = SQLiteBroker(str(tmp_path / "broker.sqlite"))
+    broker.open_study({"episodes_per_worker": 1})
+    yield broker
+    broker.close()
+
+
+def experiment(seed: int = 0) -> Experiment:
+    return Experiment(NoopAgentArgs("noop"), StubTaskArgs("task", launch_s=0.0), seed)
+
+
+def expire(broker: SQLiteBroker, worker_id: str) -> None:
+    broker.heartbeat(worker_id, -1.0)  # Renews the worker's leases into the past
+
+
+def test_results_are_collected_once(broker):
+    task_id = broker.put(experiment())
+    leased_id, leased = broker.lease("w1", 60.0)
+    assert leased_id == task_id and leased.episode_id == experiment().episode_id
+    assert broker.lease("w2", 60.0) is None
+    assert broker.complete(task_id, "w1", leased.result("done"))
+    assert [(i, r.status) for i, r in broker.collect()] == [(task_id, "done")]
+    assert broker.collect() == []
+
+
+def test_expired_leases_are_requeued(broker):
+    task_id = broker.put(experiment())
+    _, leased = broker.lease("w1", 60.0)
+    assert broker.requeue_expired(max_leases=3) == (0, [])  # Still leased
+    expire(broker, "w1")
+    assert broker.requeue_expired(max_leases=3) == (1, [])
+    assert broker.lease("w2", 60.0)[0] == task_id
+    assert broker.complete(task_id, "w2", leased.result("done"))
+    assert not broker.complete(task_id, "w1", leased.result("done"))  # The first worker's late result is dropped
+
+
+def test_heartbeats_keep_leases(broker):
+    broker.put(experiment())
+    broker.lease("w1", 0.05)
+    broker.heartbeat("w1", 60.0)
+    time.sleep(0.1)
+    assert broker.requeue_expired(max_leases=3) == (0, [])
+
+
+def test_tasks_lost_too_often_are_given_up(broker):
+    task_id = broker.put(experiment())
+    for attempt in range(2):
+        broker.lease(f"w{attempt}", 60.0)
+        expire(broker, f"w{attempt}")
+        requeued, given_up = broker.requeue_expired(max_leases=2)
+    assert (requeued, given_up) == (0, [task_id])
+    assert broker.counts() == {}
+
+
+def test_open_study_refuses_while_leases_are_live(broker):
+    broker.put(experiment())
+    broker.lease("w1", 60.0)
+    with pytest.raises(RuntimeError, match="serving another study"):
+        broker.open_study({})
+    assert broker.counts() == {"leased": 1}
+    expire(broker, "w1")  # Its workers are gone
+    broker.open_study({})
+    assert broker.counts() == {}
+
+
+def test_study_runs_on_a_local_node(tmp_path):
+    executor = BrokerExecutor(str(tmp_path / "broker.sqlite"), local_workers=1, poll_s=0.05)
+    tasks = [StubTaskArgs("task", launch_s=0.0, reset_s=0.0, step_s=0.0)]
+    study = Study([NoopAgentArgs("noop")], tasks, seeds=range(3), study_dir=str(tmp_path / "study"), executor=executor)
+    results = study.run()
+    assert [r.status for r in results] == ["done"] * 3
@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import pytest
+
+from agentlab2.envpool import EnvPool, EnvPoolOptions, NoopAgentArgs, StubTaskArgs
+from agentlab2.experiment import Experiment
+from agentlab2.runner import run_parallel
+
+
+def wait_for(condition, timeout_s: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout_s
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def run_episodes(pool: EnvPool, tasks: list[StubTaskArgs], healthy: bool = True) -> list[str]:
+    """Acquires and releases an environment for each task in turn; returns where each came from."""
+
+    async def main():
+        sources = []
+        for task in tasks:
+            pooled, source = await pool.acquire(task)
+            sources.append(source)
+            await pool.release(pooled, healthy=healthy)
+        return sources
+
+    return asyncio.run(main())
+
+
+def test_released_environments_are_reused():
+    pool = EnvPool(EnvPoolOptions(warm=0))
+    task = StubTaskArgs("task", launch_s=0.0)
+    assert run_episodes(pool, [task] * 3) == ["miss", "hit", "hit"]
+    assert pool.stats["launched"] == 1
+    pool.close()
+
+
+def test_tasks_seen_once_are_not_prewarmed():
+    pool = EnvPool(EnvPoolOptions(warm=1))
+    run_episodes(pool, [StubTaskArgs(f"task-{i}", launch_s=0.0) for i in range(5)])
+    time.sleep(0.1)
+    assert pool.stats["launched"] == 5
+    pool.close()
+
+
+def test_repeated_tasks_are_prewarmed():
+    pool = EnvPool(EnvPoolOptions(warm=1))
+    task = StubTaskArgs("task", launch_s=0.0)
+    run_episodes(pool, [task] * 2)
+    wait_for(lambda: pool.stats["launched"] == 2)  # The second episode launched one ahead
+    assert run_episodes(pool, [task]) == ["hit"]
+    pool.close()
+
+
+def test_failed_episodes_discard_their_environment():
+    pool = EnvPool(EnvPoolOptions(warm=0))
+    task = StubTaskArgs("task", launch_s=0.0)
+    assert run_episodes(pool, [task] * 2, healthy=False) == ["miss", "miss"]
+    assert pool.stats["discarded"] == 2
+    pool.close()
+
+
+def test_environments_are_recycled_after_max_uses():
+    pool = EnvPool(EnvPoolOptions(warm=0, max_uses=2))
+    task = StubTaskArgs("task", launch_s=0.0)
+    assert run_episodes(pool, [task] * 4) == ["miss", "hit", "miss", "hit"]
+    assert pool.stats["recycled"] == 2
+    pool.close()
+
+
+def test_idle_environments_are_capped():
+    pool = EnvPool(EnvPoolOptions(warm=0, max_idle=2))
+    run_episodes(pool, [StubTaskArgs(f"task-{i}", launch_s=0.0) for i in range(4)])
+    assert sum(len(idle) for idle in pool._idle.values()) == 2
+    pool.close()
+
+
+def test_launch_errors_reach_the_episode():
+    pool = EnvPool(EnvPoolOptions(warm=1))
+    failing = StubTaskArgs("failing", launch_s=0.0, launch_error="no browser")
+    for _ in range(2):
+        with pytest.raises(RuntimeError, match="no browser"):
+            run_episodes(pool, [failing])
+    assert run_episodes(pool, [StubTaskArgs("working", launch_s=0.0)]) == ["miss"]
+    pool.close()
+
+
+@pytest.mark.parametrize("episodes_per_worker", [1, 2])
+def test_runner_with_pool(episodes_per_worker):
+    tasks = [StubTaskArgs(f"task-{i}", launch_s=0.0, reset_s=0.0) for i in range(2)]
+    experiments = [Experiment(NoopAgentArgs("noop"), task, seed) for task in tasks for seed in range(3)]
+    results = list(
+        run_parallel(experiments, 1, 20.0, episodes_per_worker=episodes_per_worker, env_pool=EnvPoolOptions(warm=1))
+    )
+    assert sorted(r.episode_id for r in results) == sorted(e.episode_id for e in experiments)
+    assert all(r.status == "done" for r in results)
+    assert sum(r.info["env_pool"] == "hit" for r in results) > 0
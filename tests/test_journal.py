@@ -0,0 +1,55 @@
+from agentlab2.envpool import NoopAgentArgs, StubTaskArgs
+from agentlab2.journal import Journal
+from agentlab2.study import Study
+
+
+def make_study(study_dir, tasks=None, **kwargs) -> Study:
+    tasks = tasks or [StubTaskArgs("task", launch_s=0.0, reset_s=0.0, step_s=0.0)]
+    return Study([NoopAgentArgs("noop")], tasks, seeds=range(3), n_workers=0, study_dir=str(study_dir), **kwargs)
+
+
+def rows(study_dir) -> dict:
+    journal = Journal(str(study_dir))
+    try:
+        return {episode_id: dict(row) for episode_id, row in journal.rows().items()}
+    finally:
+        journal.close()
+
+
+def test_finished_study_is_not_run_again(tmp_path):
+    study = make_study(tmp_path)
+    first = study.run()
+    assert [r.status for r in first] == ["done"] * 3
+
+    journal = Journal(str(tmp_path))
+    try:
+        assert list(study.iter_results(journal)) == []  # Nothing left to run
+    finally:
+        journal.close()
+    again = study.run()
+    assert [r.episode_id for r in again] == [r.episode_id for r in first]
+    assert all(row["attempts"] == 1 for row in rows(tmp_path).values())
+
+
+def test_interrupted_episodes_run_again(tmp_path):
+    study = make_study(tmp_path)
+    experiments = study.experiments()
+    journal = Journal(str(tmp_path))
+    journal.register(experiments)
+    journal.mark_running(experiments[0].episode_id)  # The study was killed while it ran
+    journal.close()
+
+    results = study.run()
+    assert [r.status for r in results] == ["done"] * 3
+    assert rows(tmp_path)[experiments[0].episode_id]["attempts"] == 2
+
+
+def test_failures_are_retried_up_to_max_attempts(tmp_path):
+    failing = StubTaskArgs("failing", launch_s=0.0, launch_error="no browser")
+    study = make_study(tmp_path, [failing], max_attempts=2, retry_backoff_s=0.0)
+    results = study.run()
+    assert [r.status for r in results] == ["error"] * 3
+    assert all(row["attempts"] == 2 and row["state"] == "failed" for row in rows(tmp_path).values())
+
+    study.run()  # Final failures are not retried on resume
+    assert all(row["attempts"] == 2 for row in rows(tmp_path).values())
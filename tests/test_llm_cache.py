@@ -0,0 +1,94 @@
+import asyncio
+import os
+
+import pytest
+
+from agentlab2.core import EpisodeContext, current_episode
+from agentlab2.llm import CacheMiss, LLMClient, ResponseCache
+from agentlab2.llm.mock_server import MockLLMServer
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+@pytest.fixture
+def server():
+    with MockLLMServer() as server:
+        yield server
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return os.path.join(tmp_path, "cache.sqlite")
+
+
+def run_episode(server, cache: ResponseCache, episode_id: str, n: int = 1, **params) -> list:
+    """Sends `n` identical requests, one after the other, from episode `episode_id`."""
+
+    async def main():
+        current_episode.set(EpisodeContext(episode_id))
+        client = LLMClient({"mock": server.provider()}, cache=cache)
+        try:
+            return [await client.chat("mock/any", MESSAGES, **params) for _ in range(n)]
+        finally:
+            client.pool.close()  # client.close() would close the cache too
+
+    return asyncio.run(main())
+
+
+def test_read_through_answers_repeats_from_the_cache(server, cache_path):
+    cache = ResponseCache(cache_path)
+    first = run_episode(server, cache, "a", temperature=0)[0]
+    again = run_episode(server, cache, "b", temperature=0)[0]
+    assert server.requests == 1
+    assert not first.cached and again.cached
+    assert again.text == first.text
+    cache.close()
+
+
+def test_replay_serves_recorded_answers_without_the_api(server, cache_path):
+    recorder = ResponseCache(cache_path, mode="record")
+    recorded = run_episode(server, recorder, "episode", n=2, temperature=1.0)
+    recorder.close()
+    server.stop()  # Replay must not need it
+
+    replayer = ResponseCache(cache_path, mode="replay")
+    replayed = run_episode(server, replayer, "episode", n=2, temperature=1.0)
+    assert [r.raw for r in replayed] == [r.raw for r in recorded]
+    assert all(r.cached for r in replayed)
+    replayer.close()
+
+
+def test_replay_miss_raises_cache_miss(server, cache_path):
+    cache = ResponseCache(cache_path, mode="replay")
+    with pytest.raises(CacheMiss):
+        run_episode(server, cache, "episode", temperature=0)
+    assert server.requests == 0
+    cache.close()
+
+
+def test_sampled_requests_are_cached_per_episode_and_occurrence(server, cache_path):
+    cache = ResponseCache(cache_path)
+    run_episode(server, cache, "a", n=2, temperature=1.0)
+    assert server.requests == 2  # The second identical request of an episode is a new sample
+    run_episode(server, cache, "a", n=2, temperature=1.0)
+    assert server.requests == 2
+    run_episode(server, cache, "b", n=1, temperature=1.0)
+    assert server.requests == 3
+    cache.close()
+
+
+def test_eviction_keeps_the_file_under_max_bytes(cache_path):
+    cache = ResponseCache(cache_path, max_bytes=1000)
+    for i in range(20):
+        cache.put(f"key{i}", "model", {"text": "x" * 100})
+    cache.evict()
+    assert cache.stats["evicted"] > 0
+    assert cache.get("key19") is not None
+    cache.close()
+
+
+def test_close_twice(cache_path):
+    cache = ResponseCache(cache_path)
+    cache.put("key", "model", {"text": "x"})
+    cache.close()
+    cache.close()
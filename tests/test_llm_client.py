@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from agentlab2.llm import LLMClient, LLMError, ProviderConfig, close_client, get_client
+from agentlab2.llm.mock_server import MockLLMServer
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+@pytest.fixture
+def server():
+    with MockLLMServer(latency_s=0.05) as server:
+        yield server
+
+
+def chat_all(client: LLMClient, n: int, **params) -> list:
+    async def main():
+        try:
+            return await asyncio.gather(*(client.chat("mock/any", MESSAGES, **params) for _ in range(n)))
+        finally:
+            client.close()
+
+    return asyncio.run(main())
+
+
+def test_retries_failed_requests(server):
+    server.failure_rate = 0.5
+    client = LLMClient({"mock": server.provider(max_retries=10)})
+    responses = chat_all(client, 10, temperature=1.0)
+    assert [r.text for r in responses] == ["Mock reply to: Hello"] * 10
+    assert server.failures > 0
+    assert client.stats["retries"] == server.failures
+    assert client.stats["requests"] == server.requests == 10 + server.failures
+
+
+def test_gives_up_after_max_retries(server):
+    server.failure_rate = 1.0
+    client = LLMClient({"mock": server.provider(max_retries=2)})
+    with pytest.raises(LLMError) as error:
+        chat_all(client, 1)
+    assert error.value.status in (429, 503)
+    assert server.requests == 3
+
+
+def test_in_flight_requests_are_capped(server):
+    client = LLMClient({"mock": server.provider(max_concurrency=3)})
+    chat_all(client, 12, temperature=1.0)
+    assert server.requests == 12
+    assert server.max_in_flight == 3
+
+
+def test_identical_deterministic_requests_are_coalesced(server):
+    client = LLMClient({"mock": server.provider()})
+    responses = chat_all(client, 5, temperature=0)
+    assert server.requests == 1
+    assert client.stats["coalesced"] == 4
+    assert len({r.text for r in responses}) == 1
+
+
+def test_sampled_requests_are_not_coalesced(server):
+    client = LLMClient({"mock": server.provider()})
+    chat_all(client, 5, temperature=1.0)
+    assert server.requests == 5
+    assert client.stats["coalesced"] == 0
+
+
+def chat_raw(response: bytes) -> LLMClient:
+    """Sends one chat request to a server answering `response` to everything; returns the client."""
+
+    async def main():
+        async def handle(reader, writer):
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = next(line for line in head.split(b"\r\n") if line.lower().startswith(b"content-length"))
+            await reader.readexactly(int(length.split(b":")[1]))
+            writer.write(response)
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        client = LLMClient({"raw": ProviderConfig("raw", f"http://127.0.0.1:{port}/v1", backoff_base_s=0.05)})
+        try:
+            await client.chat("raw/any", MESSAGES)
+        finally:
+            client.close()
+            server.close()
+        return client
+
+    return asyncio.run(main())
+
+
+def test_client_errors_are_not_retried():
+    with pytest.raises(LLMError) as error:
+        chat_raw(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 2\r\n\r\n{}")
+    assert error.value.status == 400
+
+
+def test_invalid_json_body_raises_llm_error():
+    with pytest.raises(LLMError) as error:
+        chat_raw(b"HTTP/1.1 200 OK\r\nContent-Length: 6\r\n\r\n<html>")
+    assert error.value.status == 200
+
+
+def test_close_client_replaces_the_loop_client():
+    async def main():
+        client = get_client()
+        assert get_client() is client
+        await close_client()
+        assert get_client() is not client
+        await close_client()
+        await close_client()  # Nothing left to close
+
+    asyncio.run(main())